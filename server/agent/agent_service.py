@@ -1,42 +1,134 @@
 import asyncio
-from pathlib import Path
-from typing import Dict, Optional
-from fastapi import WebSocket
-from agent.core import agent
-from e2b_code_interpreter import AsyncSandbox
+import time
+from typing import Dict, List, Optional
+from agent.core import (
+    AgentContext,
+    context_tools,
+    get_agent,
+    get_checkpointer,
+    run_context_tool,
+    sandbox_tools,
+    warmup_model,
+)
+from e2b_code_interpreter import AsyncSandbox, CommandExitException
 import os
 from dotenv import load_dotenv
-import json
-from utils.persistent_store import load_file_store, save_file_store
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from utils.persistent_store import FileStore, open_file_store
+from utils.registry import registry as default_registry
+from agent.sandbox_pool import APP_DIR, SandboxConnector, SandboxPool, connect_sandbox
+from agent.sandbox_lifecycle import SandboxLifecycle
+from agent.dependency_cache import DependencyCache, dependency_cache as default_dependency_cache
+from agent.dependency_cache import is_install_command, sandbox_dependency_key
+from agent.dev_server import DevServerSupervisor, is_dev_server_command, preview_url
+from agent.file_reader import FileReader, is_read_only_command, select_lines
+from agent.file_edit import EditConflict, apply_edit
+from agent.llm_stream import EarlyWrites, StreamedTurn
+from agent.scaffolds import ScaffoldLibrary, scaffold_library as default_scaffold_library, scaffold_note
+from agent.tool_scheduler import run_tool_calls
+from agent.run_scheduler import sandbox_limiter
+from agent.command_stream import CommandOutputStream
+from agent.event_bus import ProjectChannel
+from utils.tracing import edit_bytes, span
 import logging
 
 load_dotenv()
 api_key = os.getenv('E2B_API_KEY')
 
+# Upper bound on sandbox writes in flight for a single LLM turn
+TOOL_CONCURRENCY = int(os.getenv('TOOL_CONCURRENCY', '8'))
+# Send all create_file writes of one LLM turn to the sandbox in one request
+BATCH_FILE_WRITES = os.getenv('BATCH_FILE_WRITES', '1') == '1'
+# Default limit in seconds for one execute_command, unless the call passes its own timeout
+COMMAND_TIMEOUT = int(os.getenv('COMMAND_TIMEOUT', '300'))
+# How long a model-issued `npm run dev` waits for the speculative dev server to come up
+DEV_SERVER_READY_WAIT = int(os.getenv('DEV_SERVER_READY_WAIT', '60'))
+
+# Forward the model's output token by token instead of once per finished response
+STREAM_TOKENS = os.getenv('STREAM_TOKENS', '1') == '1'
+
+READ_TOOLS = ('read_file', 'read_files')
+
 logger = logging.getLogger(__name__)
 
 
 class AgentService:
-    def __init__(self):
-        self.agent = agent
-        self.sandboxes: Dict[str, AsyncSandbox] = {}
+    def __init__(
+        self,
+        pool: Optional[SandboxPool] = None,
+        registry=None,
+        connect: SandboxConnector = connect_sandbox,
+        dependency_cache: Optional[DependencyCache] = None,
+        scaffolds: Optional[ScaffoldLibrary] = None,
+    ):
+        self.pool = pool if pool is not None else SandboxPool.from_env()
+        self.registry = registry if registry is not None else default_registry
+        self.connect = connect
+        self.dependency_cache = dependency_cache if dependency_cache is not None else default_dependency_cache
+        self.lifecycle = SandboxLifecycle.from_env(self.pool, self.registry, connect, self.dependency_cache)
+        self.dev_servers = DevServerSupervisor()
+        self.lifecycle.on_teardown.append(self.dev_servers.stop)
+        self.file_reader = FileReader()
+        self.lifecycle.on_teardown.append(self.file_reader.forget)
+        self.early_writes = EarlyWrites(max_concurrency=TOOL_CONCURRENCY)
+        self.scaffolds = scaffolds if scaffolds is not None else default_scaffold_library
+        # node_modules archives being made, by sandbox id
+        self._dependency_saves: Dict[str, asyncio.Task] = {}
+        self.warmup_stats: dict = {'state': 'pending'}
+
+    @property
+    def agent(self):
+        """The compiled graph, built on first use unless warmup() already did."""
+        return get_agent()
+
+    @property
+    def sandboxes(self) -> Dict[str, AsyncSandbox]:
+        """Sandboxes currently live on this worker, by project."""
+        return self.lifecycle.sandboxes
+
+    async def warmup(self):
+        """
+        Pay the one-time costs of the first run up front: compile the graph and
+        open the checkpoint database, build the model and its async client, and
+        start pre-filling the sandbox pool. Each step's duration ends up in
+        warmup_stats; a step that fails is left to happen on first use.
+        """
+        self.warmup_stats = {'state': 'running'}
+        started = time.monotonic()
+        self.pool.start()
+        steps = (
+            ('graph', lambda: asyncio.to_thread(get_agent)),
+            ('model', warmup_model),
+            ('scaffolds', lambda: asyncio.to_thread(self.scaffolds.load)),
+        )
+        for step, action in steps:
+            step_started = time.monotonic()
+            try:
+                await action()
+                self.warmup_stats[step] = round(time.monotonic() - step_started, 3)
+            except Exception as e:
+                logger.warning(f'Warmup of {step} failed, it will be built on first use: {e}')
+                self.warmup_stats[step] = f'failed: {e}'
+        self.warmup_stats['state'] = 'ready'
+        self.warmup_stats['seconds'] = round(time.monotonic() - started, 3)
+        logger.info(f'Warmup finished in {self.warmup_stats["seconds"]}s')
 
     async def get_sandbox(self, project_id: str):
-        if project_id not in self.sandboxes:
-            print(f'Initializing new sandbox for project: {project_id}')
-            self.sandboxes[project_id] = await AsyncSandbox.create('temp-react', timeout=600)
-            print('Sandbox is setup create with REACT environment')
-        return self.sandboxes[project_id]
+        self.pool.start()
+        return await self.lifecycle.acquire(project_id)
+
+    def release_sandbox(self, project_id: str):
+        """Nobody is looking at the project anymore; hibernate its sandbox after a grace period"""
+        self.lifecycle.release(project_id)
 
     async def close_sandbox(self, project_id: str):
         """Close a specific sandbox"""
         if project_id in self.sandboxes:
-            await self.sandboxes[project_id].kill()
-            del self.sandboxes[project_id]
+            await self.lifecycle.close(project_id)
             print(f'  Closed sandbox: {project_id}')
 
     async def exec_in_sandbox(
-        self, tool_name: str, tool_args: dict, sandbox: AsyncSandbox, socket: Optional[WebSocket] = None
+        self, tool_name: str, tool_args: dict, sandbox: AsyncSandbox, channel: Optional[ProjectChannel] = None
     ) -> str:
         """
         Execute a tool in the E2B sandbox and return a formatted result string.
@@ -51,17 +143,18 @@ class AgentService:
                 if not file_path:
                     error_msg = 'Error: file_path is required for create_file'
                     logger.error(error_msg)
-                    await self._send_ws_message(socket, {'e': 'error', 'message': error_msg})
+                    await self._send_ws_message(channel, {'e': 'error', 'message': error_msg})
                     return error_msg
-                await self._send_ws_message(socket, {'e': 'file_creating', 'message': f'Creating {file_path}...'})
+                if not self.early_writes.was_announced(sandbox, file_path):
+                    await self._send_ws_message(channel, {'e': 'file_creating', 'message': f'Creating {file_path}...'})
 
-                full_path = f'/home/user/react-app/{file_path}'
-                await sandbox.files.write(full_path, content)
+                if not await self.early_writes.claim(sandbox, file_path, content):
+                    await sandbox.files.write(f'{APP_DIR}/{file_path}', content)
 
                 success_msg = f'Successfully created file: {file_path} ({len(content)} characters)'
                 logger.info(success_msg)
 
-                await self._send_ws_message(socket, {'e': 'file_created', 'message': file_path})
+                await self._send_ws_message(channel, {'e': 'file_created', 'message': file_path})
 
                 return success_msg
 
@@ -71,36 +164,83 @@ class AgentService:
                 if not command:
                     error_msg = 'Error: command is required for execute_command'
                     logger.error(error_msg)
-                    await self._send_ws_message(socket, {'e': 'error', 'message': error_msg})
+                    await self._send_ws_message(channel, {'e': 'error', 'message': error_msg})
                     return error_msg
 
                 logger.info(f'Executing command: {command}')
 
                 await self._send_ws_message(
-                    socket,
+                    channel,
                     {'e': 'command', 'message': f'Running: {command[:100]}{"..." if len(command) > 100 else ""}'},
                 )
 
+                # The dev server would never exit and block the run until the command timeout
+                if is_dev_server_command(command):
+                    if await self.dev_servers.wait_ready(sandbox, DEV_SERVER_READY_WAIT):
+                        message = (
+                            f'The dev server is already running at {preview_url(sandbox)} and reloads on file changes'
+                        )
+                        await self._send_ws_message(
+                            channel, {'e': 'command_output', 'stream': 'stdout', 'message': message + '\n'}
+                        )
+                        return f'Command: {command}\nExit code: 0\nOutput:\n{message}'
+                    return await self._start_dev_server(command, sandbox, channel)
+
+                if not is_read_only_command(command):
+                    await self._dependencies_saved(sandbox)
+
+                # Keyed on the manifest as it is before the install, which is what the next project presents
+                install_key = (
+                    await sandbox_dependency_key(sandbox)
+                    if self.dependency_cache.enabled and is_install_command(command)
+                    else None
+                )
+                if install_key:
+                    restored = await self._restore_dependencies(command, install_key, sandbox, channel)
+                    if restored:
+                        return restored
+
+                timeout = tool_args.get('timeout') or COMMAND_TIMEOUT
+                output = CommandOutputStream(lambda frame: self._send_ws_message(channel, frame))
                 try:
-                    full_command = f'cd /home/user/react-app && {command}'
-                    result_obj = await sandbox.commands.run(full_command)
+                    full_command = f'cd {APP_DIR} && {command}'
+                    handle = await sandbox.commands.run(
+                        full_command,
+                        background=True,
+                        on_stdout=output.on_stdout,
+                        on_stderr=output.on_stderr,
+                        # The sandbox-side limit is only a backstop for the wait_for below
+                        timeout=timeout + 10,
+                    )
+                    try:
+                        result_obj = await asyncio.wait_for(handle.wait(), timeout=timeout)
+                    except CommandExitException as e:
+                        result_obj = e
+                    except (asyncio.TimeoutError, asyncio.CancelledError):
+                        await handle.kill()
+                        raise
+                    finally:
+                        await output.close()
+
+                    stdout = output.stdout.text()
+                    stderr = output.stderr.text()
 
                     logger.info('=' * 60)
                     logger.info('✅ Command completed')
                     logger.info('=' * 60)
-                    logger.info(f'STDOUT:\n{result_obj.stdout}')
-                    if result_obj.stderr:
-                        logger.info(f'\nSTDERR:\n{result_obj.stderr}')
+                    logger.info(f'STDOUT:\n{stdout}')
+                    if stderr:
+                        logger.info(f'\nSTDERR:\n{stderr}')
                     logger.info('=' * 60)
 
                     result_parts = [f'Command: {command}']
                     result_parts.append(f'Exit code: {result_obj.exit_code}')
 
-                    if result_obj.stdout:
-                        result_parts.append(f'Output:\n{result_obj.stdout}')
+                    if stdout:
+                        result_parts.append(f'Output:\n{stdout}')
 
-                    if result_obj.stderr:
-                        result_parts.append(f'Errors:\n{result_obj.stderr}')
+                    if stderr:
+                        result_parts.append(f'Errors:\n{stderr}')
 
                     result_msg = '\n'.join(result_parts)
 
@@ -108,21 +248,30 @@ class AgentService:
                         warning = f'⚠️ Command exited with code {result_obj.exit_code}'
                         logger.warning(warning)
                         await self._send_ws_message(
-                            socket,
+                            channel,
                             {
                                 'e': 'command_failed',
-                                'error': result_obj.stderr or 'Command failed',
+                                'error': output.stderr.tail or 'Command failed',
                                 'exit_code': result_obj.exit_code,
                             },
                         )
                         return f'Command failed with exit code {result_obj.exit_code}:\n{result_msg}'
 
+                    if install_key:
+                        self._save_dependencies(install_key, sandbox)
                     return result_msg
 
+                except asyncio.TimeoutError:
+                    error_msg = f'Command timed out after {timeout}s and was killed'
+                    logger.error(f'❌ {error_msg}: {command}')
+                    await self._send_ws_message(channel, {'e': 'command_error', 'error': error_msg})
+                    partial = output.stdout.text() or output.stderr.text()
+                    return f'Error executing command: {error_msg}' + (f'\nPartial output:\n{partial}' if partial else '')
+
                 except Exception as e:
                     error_msg = f'❌ Command execution failed: {e}'
                     logger.error(error_msg)
-                    await self._send_ws_message(socket, {'e': 'command_error', 'error': str(e)})
+                    await self._send_ws_message(channel, {'e': 'command_error', 'error': str(e)})
                     return f'Error executing command: {str(e)}'
 
             else:
@@ -133,181 +282,472 @@ class AgentService:
         except Exception as e:
             error_msg = f'Error in exec_in_sandbox for {tool_name}: {str(e)}'
             logger.error(error_msg, exc_info=True)
-            await self._send_ws_message(socket, {'e': 'error', 'message': error_msg})
+            await self._send_ws_message(channel, {'e': 'error', 'message': error_msg})
             return error_msg
 
-    async def handle_context_tool(
-        self, tool_name: str, args: dict, project_id: str, file_store: list
+    async def _start_dev_server(self, command: str, sandbox: AsyncSandbox, channel: Optional[ProjectChannel]) -> str:
+        """Start the model's dev server command in the background when no speculative one is up."""
+        exit_code, listening, output = await self.dev_servers.start_detached(sandbox, command)
+        if exit_code is not None:
+            return f'Command: {command}\nExit code: {exit_code}\nOutput:\n{output}'
+        if listening:
+            url = preview_url(sandbox)
+            await self._send_ws_message(channel, {'e': 'preview_ready', 'url': url, 'message': url})
+            message = f'The dev server is running in the background at {url}'
+        else:
+            message = 'The dev server is still starting in the background'
+        await self._send_ws_message(channel, {'e': 'command_output', 'stream': 'stdout', 'message': message + '\n'})
+        return f'Command: {command}\nExit code: 0\nOutput:\n{output}{message}'
+
+    async def _restore_dependencies(
+        self, command: str, key: str, sandbox: AsyncSandbox, channel: Optional[ProjectChannel]
     ) -> Optional[str]:
+        """Unpack a cached dependency tree instead of running the install. None on a miss."""
+        try:
+            if not await self.dependency_cache.restore_into(sandbox, key):
+                return None
+        except Exception as e:
+            logger.warning(f'Restoring cached dependencies {key} failed, installing instead: {e}')
+            return None
+
+        logger.info(f'Restored node_modules {key} from cache for: {command}')
+        message = f'Dependencies restored from cache ({key})'
+        await self._send_ws_message(channel, {'e': 'command_output', 'stream': 'stdout', 'message': message + '\n'})
+        return f'Command: {command}\nExit code: 0\nOutput:\n{message}'
+
+    async def _apply_scaffold(
+        self, prompt: str, sandbox: AsyncSandbox, channel: Optional[ProjectChannel], file_store: FileStore
+    ) -> str:
+        """
+        Write the learned starter scaffold matching a new project's prompt in
+        one request, with its dependencies when they are cached. Returns what
+        the model is told about it, or '' when no scaffold matched.
+        """
+        try:
+            files = await asyncio.to_thread(self.scaffolds.match, prompt)
+        except Exception as e:
+            logger.warning(f'Scaffold lookup failed, the model starts from scratch: {e}')
+            return ''
+        if not files:
+            return ''
+        with span('scaffold.apply', files=len(files)) as attrs:
+            calls = [
+                {'name': 'create_file', 'args': {'file_path': file_path, 'content': content}, 'id': f'scaffold-{index}'}
+                for index, (file_path, content) in enumerate(files.items())
+            ]
+            await self.write_files_bulk(calls, sandbox, channel, file_store)
+            written = {file_path: content for file_path, content in files.items() if file_store.get(file_path)}
+            if 'package.json' not in written:
+                return ''
+            key = await sandbox_dependency_key(sandbox) if self.dependency_cache.enabled else None
+            installed = bool(key) and await self._restore_dependencies('npm install', key, sandbox, channel) is not None
+            attrs['dependencies_installed'] = installed
+        return scaffold_note(written, installed)
+
+    def _save_dependencies(self, key: str, sandbox: AsyncSandbox):
         """
-        Handle context-related tools (get_context, save_context).
-        Returns the result message or None if tool was handled internally.
+        Archive the freshly installed tree in the background. Commands that may
+        change node_modules wait for it first (see `_dependencies_saved`), so the
+        archive never holds a tree a later tool call was halfway through changing.
         """
-        if tool_name == 'get_context':
+        if self.dependency_cache.has(key) or sandbox.sandbox_id in self._dependency_saves:
+            return
+
+        async def save():
             try:
-                context_path = Path(f'data/project/{project_id}/context/context.json')
+                with span('dependencies.save', key=key):
+                    await self.dependency_cache.save_from_sandbox(sandbox, key)
+            except Exception as e:
+                logger.warning(f'Could not cache node_modules {key}: {e}')
 
-                if not context_path.exists():
-                    return 'No context found - this is a fresh project. You can proceed with creating the project from scratch.'
+        task = asyncio.create_task(save())
+        self._dependency_saves[sandbox.sandbox_id] = task
+        task.add_done_callback(lambda _: self._dependency_saves.pop(sandbox.sandbox_id, None))
 
-                with open(context_path, 'r', encoding='utf-8') as f:
-                    context = json.load(f)
+    async def _dependencies_saved(self, sandbox: AsyncSandbox):
+        """Wait for the sandbox's node_modules archive, if one is being made."""
+        task = self._dependency_saves.get(sandbox.sandbox_id)
+        if task is not None:
+            with span('dependencies.wait'):
+                await asyncio.shield(task)
 
-                context_msg = f"""Previous project context:
-Semantic: {context.get('semantic', 'N/A')}
-Procedural: {context.get('procedural', 'N/A')}
-Episodic: {context.get('episodic', 'N/A')}
-Existing files: {', '.join(context.get('structue', []))}
+    async def handle_context_tool(
+        self, tool_name: str, args: dict, project_id: str, file_store: list
+    ) -> Optional[str]:
+        """
+        Handle context-related tools (get_context, save_context, retrieve_context).
+        Returns the result message or None if the tool is not a context tool.
+        """
+        if tool_name not in context_tools:
+            return None
+        try:
+            return await run_context_tool(tool_name, args, project_id)
+        except Exception as e:
+            logger.error(f'Error in {tool_name}: {e}', exc_info=True)
+            return f'Error in {tool_name}: {str(e)}'
 
-Please use this context to understand what was built previously and continue from there."""
+    async def _send_ws_message(self, channel: Optional[ProjectChannel], message: dict):
+        """Queue a message for every viewer of the project; never waits on the clients"""
+        if channel:
+            channel.publish(message)
 
-                logger.info('Retrieved context for project')
-                return context_msg
+    async def _run_sandbox_tool(
+        self, call: dict, sandbox: AsyncSandbox, channel: Optional[ProjectChannel], file_store: FileStore
+    ) -> ToolMessage:
+        """Execute one sandbox tool call and wrap its result for the LLM."""
+        tool_name = call.get('name', '')
+        args = call.get('args', {})
+        tool_call_id = call.get('id', 'unknown')
 
-            except Exception as e:
-                error_msg = f'Error getting context: {e}'
-                logger.error(error_msg, exc_info=True)
-                return f'Error retrieving context: {str(e)}'
+        logger.info(f'Executing sandbox tool: {tool_name} with args: {list(args.keys())}')
 
-        elif tool_name == 'save_context':
-            try:
-                base_dir = Path(f'data/project/{project_id}')
-                context_dir = base_dir / 'context'
-                semantic = args.get('semantic', '').strip()
-                procedural = args.get('procedural', '').strip()
-                episodic = args.get('episodic', '').strip()
-
-                if not semantic:
-                    return 'Error: semantic context is required for save_context'
-
-                file_store = load_file_store(project_id)
-                code_map = {entry['file_path']: entry['content'] for entry in file_store}
-
-                os.makedirs(context_dir, exist_ok=True)
-                context_data = {
-                    'semantic': semantic,
-                    'procedural': procedural,
-                    'episodic': episodic,
-                    'code_map': code_map,
-                    'structue': list(code_map.keys()),
-                }
-
-                context_path = context_dir / 'context.json'
-                with open(context_path, 'w', encoding='utf-8') as f:
-                    json.dump(context_data, f, indent=2)
-
-                logger.info(f'Successfully saved context for project {project_id}')
-                return f'Context saved successfully. Semantic: {semantic[:100]}...'
+        try:
+            with span(f'tool.{tool_name}'):
+                try:
+                    result_content = await self.exec_in_sandbox(tool_name, args, sandbox, channel)
+                finally:
+                    if tool_name == 'execute_command':
+                        self.file_reader.command_ran(sandbox, args.get('command', ''))
 
-            except Exception as e:
-                error_msg = f'Error saving context: {e}'
-                logger.error(error_msg, exc_info=True)
-                return f'Error saving context: {str(e)}'
+            if tool_name == 'create_file' and args.get('file_path'):
+                with span('file_store.save'):
+                    file_store.put(args['file_path'], args.get('content', ''))
+                await self.file_reader.wrote(sandbox, {args['file_path']: args.get('content', '')})
 
-        return None
+            return ToolMessage(content=result_content, tool_call_id=tool_call_id)
 
-    async def _send_ws_message(self, socket: Optional[WebSocket], message: dict):
-        """Helper to send WebSocket message with immediate flushing"""
-        if socket:
-            try:
-                await socket.send_json(message)
-                await asyncio.sleep(0.02)
-            except Exception as e:
-                logger.warning(f'Failed to send WebSocket message: {e}')
+        except Exception as e:
+            error_msg = f'Error executing {tool_name}: {str(e)}'
+            logger.error(error_msg, exc_info=True)
+            await self._send_ws_message(channel, {'e': 'tool_error', 'tool': tool_name, 'message': error_msg})
+            return ToolMessage(content=error_msg, tool_call_id=tool_call_id)
 
-    async def run_agent_stream(self, prompt: str, project_id: str, socket: Optional[WebSocket] = None):
+    async def write_files_bulk(
+        self, calls: List[dict], sandbox: AsyncSandbox, channel: Optional[ProjectChannel], file_store: FileStore
+    ) -> List[ToolMessage]:
         """
-        Run the agent with streaming support, properly handling tool execution
-        and feeding results back to the LLM. Messages are sent in real-time.
-        Uses StateGraph for better streaming control.
+        Write the files of several create_file calls to the sandbox in a single
+        request. If the bulk request fails, every file is retried on its own so
+        failures are still reported per file.
         """
-        from langchain_core.messages import HumanMessage, ToolMessage
-        from agent.core import AgentState
-
-        current_state: AgentState = {'messages': [HumanMessage(content=prompt)], 'iteration_count': 0}
+        results: List[Optional[ToolMessage]] = [None] * len(calls)
+        pending = {}
+
+        for index, call in enumerate(calls):
+            args = call.get('args', {})
+            file_path = args.get('file_path')
+            if not file_path:
+                error_msg = 'Error: file_path is required for create_file'
+                logger.error(error_msg)
+                await self._send_ws_message(channel, {'e': 'error', 'message': error_msg})
+                results[index] = ToolMessage(content=error_msg, tool_call_id=call.get('id', 'unknown'))
+                continue
+            if not self.early_writes.was_announced(sandbox, file_path):
+                await self._send_ws_message(channel, {'e': 'file_creating', 'message': f'Creating {file_path}...'})
+            pending[index] = (file_path, args.get('content', ''))
+
+        # Repeated writes to one path collapse into the last one
+        latest = {file_path: content for file_path, content in pending.values()}
+        claimed = await asyncio.gather(
+            *(self.early_writes.claim(sandbox, file_path, content) for file_path, content in latest.items())
+        )
+        to_write = {file_path: latest[file_path] for file_path, done in zip(latest, claimed) if not done}
+        failed = {}
+        try:
+            with span('tool.create_file', files=len(to_write), written_early=len(latest) - len(to_write)):
+                if to_write:
+                    await sandbox.files.write_files(
+                        [{'path': f'{APP_DIR}/{file_path}', 'data': content} for file_path, content in to_write.items()]
+                    )
+            logger.info(f'Wrote {len(to_write)} files to sandbox in one request')
+        except Exception as e:
+            logger.warning(f'Bulk write of {len(to_write)} files failed, retrying one by one: {e}')
+            outcomes = await asyncio.gather(
+                *(sandbox.files.write(f'{APP_DIR}/{file_path}', content) for file_path, content in to_write.items()),
+                return_exceptions=True,
+            )
+            failed = {
+                file_path: outcome
+                for file_path, outcome in zip(to_write, outcomes)
+                if isinstance(outcome, Exception)
+            }
+
+        for index, (file_path, content) in pending.items():
+            tool_call_id = calls[index].get('id', 'unknown')
+            if file_path in failed:
+                error_msg = f'Error executing create_file: {failed[file_path]}'
+                logger.error(error_msg)
+                await self._send_ws_message(channel, {'e': 'tool_error', 'tool': 'create_file', 'message': error_msg})
+                results[index] = ToolMessage(content=error_msg, tool_call_id=tool_call_id)
+                continue
+
+            with span('file_store.save'):
+                file_store.put(file_path, content)
+            await self._send_ws_message(channel, {'e': 'file_created', 'message': file_path})
+            results[index] = ToolMessage(
+                content=f'Successfully created file: {file_path} ({len(content)} characters)',
+                tool_call_id=tool_call_id,
+            )
+
+        await self.file_reader.wrote(
+            sandbox, {file_path: content for file_path, content in latest.items() if file_path not in failed}
+        )
+        return results  # type: ignore
+
+    async def _run_read_tool(self, call: dict, project_id: str, sandbox: AsyncSandbox) -> ToolMessage:
+        """Serve read_file and read_files, mostly without a sandbox round trip."""
+        tool_name = call.get('name', '')
+        args = call.get('args', {})
+        tool_call_id = call.get('id', 'unknown')
 
-        sandbox = await self.get_sandbox(project_id)
-        file_store = load_file_store(project_id)
+        try:
+            with span(f'tool.{tool_name}') as attrs:
+                if tool_name == 'read_file':
+                    file_path = args.get('file_path')
+                    if not file_path:
+                        return ToolMessage(content='Error: file_path is required for read_file', tool_call_id=tool_call_id)
+                    content = await self.file_reader.read(project_id, sandbox, file_path)
+                    result = (
+                        f'Error: file not found: {file_path}'
+                        if content is None
+                        else select_lines(content, args.get('start_line'), args.get('end_line'))
+                    )
+                else:
+                    file_paths = args.get('file_paths') or []
+                    contents = await self.file_reader.read_many(project_id, sandbox, file_paths)
+                    result = '\n'.join(
+                        f'--- {file_path}\n' + ('[file not found]' if content is None else select_lines(content))
+                        for file_path, content in contents.items()
+                    ) or 'Error: file_paths is required for read_files'
+                attrs['chars'] = len(result)
+            return ToolMessage(content=result, tool_call_id=tool_call_id)
 
-        await self._send_ws_message(socket, {'e': 'started', 'message': 'Creating project...'})
+        except Exception as e:
+            error_msg = f'Error executing {tool_name}: {str(e)}'
+            logger.error(error_msg, exc_info=True)
+            return ToolMessage(content=error_msg, tool_call_id=tool_call_id)
+
+    async def _run_edit_tool(
+        self,
+        call: dict,
+        project_id: str,
+        sandbox: AsyncSandbox,
+        channel: Optional[ProjectChannel],
+        file_store: FileStore,
+    ) -> ToolMessage:
+        """Apply an edit_file call to the file's current content and write the result."""
+        args = call.get('args', {})
+        tool_call_id = call.get('id', 'unknown')
+        file_path = args.get('file_path')
+        if not file_path:
+            return ToolMessage(content='Error: file_path is required for edit_file', tool_call_id=tool_call_id)
 
         try:
-            async for chunk in self.agent.astream(current_state, stream_mode='updates'):  # type: ignore
-                if 'call_llm' in chunk:
-                    llm_node_output = chunk['call_llm']
-                    new_messages = llm_node_output.get('messages', [])
+            with span('tool.edit_file') as attrs:
+                current = await self.file_reader.read(project_id, sandbox, file_path)
+                if current is None:
+                    return ToolMessage(
+                        content=f'Error: file not found: {file_path}. Use create_file to create it.',
+                        tool_call_id=tool_call_id,
+                    )
+                try:
+                    content = apply_edit(current, args.get('search', ''), args.get('replace', ''), args.get('diff', ''))
+                except EditConflict as e:
+                    attrs['conflict'] = str(e)
+                    logger.info(f'edit_file conflict on {file_path}: {e}')
+                    return ToolMessage(
+                        content=(
+                            f'Edit not applied to {file_path}: {e}. Retry edit_file with text copied exactly '
+                            f'from the current content below, or rewrite the file with create_file.\n'
+                            f'--- {file_path}\n{select_lines(current)}'
+                        ),
+                        tool_call_id=tool_call_id,
+                    )
+
+                await self._send_ws_message(channel, {'e': 'file_creating', 'message': f'Editing {file_path}...'})
+                await sandbox.files.write(f'{APP_DIR}/{file_path}', content)
+                with span('file_store.save'):
+                    file_store.put(file_path, content)
+                await self.file_reader.wrote(sandbox, {file_path: content})
+                await self._send_ws_message(channel, {'e': 'file_created', 'message': file_path})
+
+                sent = sum(len(args.get(key, '').encode('utf-8')) for key in ('search', 'replace', 'diff'))
+                full = len(content.encode('utf-8'))
+                edit_bytes.inc('sent', sent)
+                edit_bytes.inc('full_rewrite', full)
+                attrs['bytes_saved'] = full - sent
+
+            return ToolMessage(
+                content=f'Successfully edited file: {file_path} ({len(content)} characters)', tool_call_id=tool_call_id
+            )
 
-                    if new_messages:
-                        current_state['messages'] = list(current_state['messages']) + new_messages
-                        llm_msg = new_messages[-1]
+        except Exception as e:
+            error_msg = f'Error executing edit_file: {str(e)}'
+            logger.error(error_msg, exc_info=True)
+            await self._send_ws_message(channel, {'e': 'tool_error', 'tool': 'edit_file', 'message': error_msg})
+            return ToolMessage(content=error_msg, tool_call_id=tool_call_id)
+
+    async def _run_call(
+        self,
+        call: dict,
+        project_id: str,
+        sandbox: AsyncSandbox,
+        channel: Optional[ProjectChannel],
+        file_store: FileStore,
+    ) -> ToolMessage:
+        if call.get('name') in READ_TOOLS:
+            return await self._run_read_tool(call, project_id, sandbox)
+        if call.get('name') == 'edit_file':
+            return await self._run_edit_tool(call, project_id, sandbox, channel, file_store)
+        return await self._run_sandbox_tool(call, sandbox, channel, file_store)
+
+    async def _run_sandbox_calls(
+        self,
+        project_id: str,
+        tool_calls: List[dict],
+        sandbox: AsyncSandbox,
+        channel: Optional[ProjectChannel],
+        file_store: FileStore,
+    ) -> List[ToolMessage]:
+        sandbox_calls = [call for call in tool_calls if call.get('name', '') in sandbox_tools]
+        if not sandbox_calls:
+            return []
+
+        # Each call (or bulk write) takes its own slot, so a long install does not hold up the rest of the batch
+        async def run_call(call: dict) -> ToolMessage:
+            async with sandbox_limiter.slot():
+                return await self._run_call(call, project_id, sandbox, channel, file_store)
+
+        async def write_batch(calls: List[dict]) -> List[ToolMessage]:
+            async with sandbox_limiter.slot():
+                return await self.write_files_bulk(calls, sandbox, channel, file_store)
+
+        return await run_tool_calls(
+            sandbox_calls,
+            run_call,
+            max_concurrency=TOOL_CONCURRENCY,
+            execute_batch=write_batch if BATCH_FILE_WRITES else None,
+        )
+
+    def thread_config(self, project_id: str, run_id: Optional[str] = None, use_llm_cache: bool = True) -> dict:
+        """Graph config for a run; the project is the checkpoint thread, the run is recorded in its metadata."""
+        return {
+            'configurable': {'thread_id': project_id, 'project_id': project_id, 'llm_cache': use_llm_cache},
+            'metadata': {'run_id': run_id},
+        }
+
+    async def can_resume(self, project_id: str) -> bool:
+        """Whether the project's thread stopped before the graph reached its end."""
+        if get_checkpointer() is None:
+            return False
+        snapshot = await self.agent.aget_state(self.thread_config(project_id))
+        return bool(snapshot.next)
+
+    async def _close_interrupted_turn(self, project_id: str, config: dict):
+        """
+        Answer the tool calls an interrupted run left without results, so a new
+        prompt does not follow a function call that has no response.
+        """
+        snapshot = await self.agent.aget_state(config)
+        messages = snapshot.values.get('messages', []) if snapshot.values else []
+        last_ai = next((message for message in reversed(messages) if isinstance(message, AIMessage)), None)
+        if last_ai is None or not last_ai.tool_calls:
+            return
+        answered = {message.tool_call_id for message in messages if isinstance(message, ToolMessage)}
+        missing = [call for call in last_ai.tool_calls if call.get('id') not in answered]
+        if not missing:
+            return
+        logger.info(f'Closing {len(missing)} unanswered tool calls of an interrupted run of {project_id}')
+        await self.agent.aupdate_state(
+            config,
+            {
+                'messages': [
+                    ToolMessage(
+                        content='Cancelled: the run was interrupted before this tool call finished',
+                        tool_call_id=call.get('id', 'unknown'),
+                        status='error',
+                    )
+                    for call in missing
+                ]
+            },
+            as_node='execute_tools',
+        )
+
+    async def run_agent_stream(
+        self,
+        prompt: str,
+        project_id: str,
+        channel: Optional[ProjectChannel] = None,
+        use_llm_cache: bool = True,
+        run_id: Optional[str] = None,
+        resume: bool = False,
+    ):
+        """
+        Run the agent graph for one prompt and relay its progress to the
+        project's viewers in real time. Tool calls, sandbox ones included, run
+        inside the graph's execute_tools node against this run's sandbox,
+        which is passed in as the graph's runtime context.
+
+        With checkpointing on, the prompt is added to the project's existing
+        thread, and `resume` continues an interrupted run from its last
+        completed node instead of starting a new turn.
+        """
+        from langchain_core.messages import HumanMessage
 
-                        if hasattr(llm_msg, 'content') and llm_msg.content:
-                            await self._send_ws_message(socket, {'e': 'thinking', 'message': llm_msg.content})
-                            logger.debug(f'LLM content: {llm_msg.content[:100]}...')
-
-                        if hasattr(llm_msg, 'tool_calls') and llm_msg.tool_calls:
-                            sandbox_tool_results = []
-                            context_tool_calls = []
-
-                            for call in llm_msg.tool_calls:
-                                tool_name = call.get('name', '')
-
-                                if tool_name in ['create_file', 'execute_command']:
-                                    args = call.get('args', {})
-                                    tool_call_id = call.get('id', 'unknown')
-
-                                    logger.info(f'Executing sandbox tool: {tool_name} with args: {list(args.keys())}')
-
-                                    try:
-                                        result_content = await self.exec_in_sandbox(tool_name, args, sandbox, socket)
-
-                                        if tool_name == 'create_file':
-                                            entry = {
-                                                'file_path': args.get('file_path'),
-                                                'content': args.get('content', ''),
-                                            }
-                                            file_store.append(entry)
-                                            save_file_store(project_id, file_store)
-
-                                        sandbox_tool_results.append(
-                                            ToolMessage(content=result_content, tool_call_id=tool_call_id)
-                                        )
-
-                                    except Exception as e:
-                                        error_msg = f'Error executing {tool_name}: {str(e)}'
-                                        logger.error(error_msg, exc_info=True)
-                                        sandbox_tool_results.append(
-                                            ToolMessage(content=error_msg, tool_call_id=call.get('id', 'unknown'))
-                                        )
-                                        await self._send_ws_message(
-                                            socket, {'e': 'tool_error', 'tool': tool_name, 'message': error_msg}
-                                        )
-
-                                    await asyncio.sleep(0.02)
-                                else:
-                                    context_tool_calls.append(call)
-
-                            if sandbox_tool_results:
-                                current_state['messages'] = list(current_state['messages']) + sandbox_tool_results
-
-                                if not context_tool_calls:
-                                    continue_state = {
-                                        'messages': current_state['messages'],
-                                        'iteration_count': current_state.get('iteration_count', 0),
-                                    }
+        sandbox = await self.get_sandbox(project_id)
+        file_store = open_file_store(project_id)
+        self.dev_servers.ensure(sandbox, channel)
+        context = AgentContext(
+            sandbox=sandbox,
+            channel=channel,
+            run_sandbox_tools=lambda calls: self._run_sandbox_calls(project_id, calls, sandbox, channel, file_store),
+        )
 
-                elif 'execute_tools' in chunk:
-                    tools_node_output = chunk['execute_tools']
-                    new_messages = tools_node_output.get('messages', [])
+        await self._send_ws_message(channel, {'e': 'started', 'message': 'Creating project...'})
 
-                    if new_messages:
-                        current_state['messages'] = list(current_state['messages']) + new_messages
-                        current_state['iteration_count'] = tools_node_output.get(
-                            'iteration_count', current_state.get('iteration_count', 0)
+        try:
+            config = self.thread_config(project_id, run_id, use_llm_cache)
+            if not resume and await self.can_resume(project_id):
+                # A new prompt replaces the interrupted run instead of resuming it
+                await self._close_interrupted_turn(project_id, config)
+            if not resume and not file_store.index:
+                # A brand new project starts from a learned scaffold instead of the model writing boilerplate
+                prompt += await self._apply_scaffold(prompt, sandbox, channel, file_store)
+            graph_input = {'messages': [HumanMessage(content=prompt)], 'iteration_count': 0}
+            if resume and get_checkpointer() is not None:
+                # Continues from the last completed node, which re-runs tool calls that never finished
+                graph_input = None
+                await self._send_ws_message(channel, {'e': 'thinking', 'message': 'Resuming the previous run...'})
+
+            turn = StreamedTurn()
+            stream_mode = ['updates', 'messages'] if STREAM_TOKENS else ['updates']
+            async for mode, chunk in self.agent.astream(
+                graph_input, config, stream_mode=stream_mode, context=context  # type: ignore
+            ):
+                if mode == 'messages':
+                    message, metadata = chunk
+                    if metadata.get('langgraph_node') == 'call_llm' and isinstance(message, AIMessageChunk):
+                        await self._forward_chunk(turn, message, sandbox, channel)
+                    continue
+
+                if 'call_llm' in chunk:
+                    new_messages = chunk['call_llm'].get('messages', [])
+                    if new_messages and new_messages[-1].content:
+                        llm_msg = new_messages[-1]
+                        await self._send_ws_message(
+                            channel, {'e': 'thinking', 'message': llm_msg.content, 'turn': turn.id}
                         )
+                        logger.debug(f'LLM content: {str(llm_msg.content)[:100]}...')
+                    turn = StreamedTurn()
 
+                elif 'execute_tools' in chunk:
                     logger.debug('Graph executed tools node')
 
+            try:
+                await asyncio.to_thread(self.scaffolds.learn, project_id, file_store.entries())
+            except Exception as e:
+                logger.warning(f'Could not add project {project_id} to the scaffold library: {e}')
+
             try:
                 host = sandbox.get_host(5173)
                 url = f'https://{host}'
@@ -319,8 +759,34 @@ Please use this context to understand what was built previously and continue fro
         except Exception as e:
             error_msg = f'❌ Error in agent stream: {e}'
             logger.error(error_msg, exc_info=True)
-            await self._send_ws_message(socket, {'e': 'error', 'message': str(e)})
+            await self._send_ws_message(channel, {'e': 'error', 'message': str(e)})
             raise
 
+        finally:
+            await self.early_writes.settle(sandbox, file_store)
+            # Failed and cancelled runs leave checkpoints too
+            checkpointer = get_checkpointer()
+            if checkpointer is not None:
+                try:
+                    await checkpointer.aprune(project_id)
+                except Exception as e:
+                    logger.warning(f'Could not prune checkpoints of {project_id}: {e}')
+
+    async def _forward_chunk(
+        self, turn: StreamedTurn, chunk: AIMessageChunk, sandbox: AsyncSandbox, channel: Optional[ProjectChannel]
+    ):
+        """Pass a streamed piece of the model's response on as soon as it arrives."""
+        for event in turn.feed(chunk):
+            if event[0] == 'text':
+                await self._send_ws_message(channel, {'e': 'thinking_delta', 'message': event[1], 'turn': turn.id})
+            elif event[0] == 'file_path':
+                file_path = event[1].file_path
+                if self.early_writes.announce(sandbox, file_path):
+                    await self._send_ws_message(channel, {'e': 'file_creating', 'message': f'Creating {file_path}...'})
+            elif event[0] == 'write_ready':
+                args = event[2]
+                if args.get('file_path'):
+                    self.early_writes.start(sandbox, args['file_path'], args.get('content', ''))
+
 
 agent_service = AgentService()
@@ -0,0 +1,341 @@
+"""
+Durable LangGraph checkpointer on the standard library's sqlite3.
+
+Same storage layout as the in-memory saver (checkpoints, per-channel blobs,
+pending writes), so a run interrupted by an error or a crash continues from
+its last completed node, and a project's later prompts extend the same thread.
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DB = os.getenv('CHECKPOINT_DB', 'data/checkpoints.sqlite')
+# Older checkpoints of a thread are only needed for time travel, which we do not offer
+KEEP_CHECKPOINTS = int(os.getenv('CHECKPOINT_KEEP', '20'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_id TEXT,
+    checkpoint_type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    data BLOB NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+'''
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver[str]):
+    def __init__(self, path: str = CHECKPOINT_DB, keep: int = KEEP_CHECKPOINTS):
+        super().__init__()
+        self.path = path
+        self.keep = keep
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        values = {}
+        for channel, version in versions.items():
+            rows = self._query(
+                'SELECT type, data FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?',
+                (thread_id, checkpoint_ns, channel, str(version)),
+            )
+            if rows and rows[0][0] != 'empty':
+                values[channel] = self.serde.loads_typed((rows[0][0], rows[0][1]))
+        return values
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_id, checkpoint_type, checkpoint_blob, metadata_type, metadata_blob = row
+        checkpoint = self.serde.loads_typed((checkpoint_type, checkpoint_blob))
+        writes = self._query(
+            'SELECT task_id, channel, type, data FROM writes '
+            'WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx',
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        return CheckpointTuple(
+            config={
+                'configurable': {
+                    'thread_id': thread_id,
+                    'checkpoint_ns': checkpoint_ns,
+                    'checkpoint_id': checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint,
+                'channel_values': self._load_blobs(thread_id, checkpoint_ns, checkpoint['channel_versions']),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_blob)),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, data)))
+                for task_id, channel, value_type, data in writes
+            ],
+            parent_config=(
+                {
+                    'configurable': {
+                        'thread_id': thread_id,
+                        'checkpoint_ns': checkpoint_ns,
+                        'checkpoint_id': parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config['configurable']['thread_id']
+        checkpoint_ns = config['configurable'].get('checkpoint_ns', '')
+        columns = 'checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata'
+        if checkpoint_id := get_checkpoint_id(config):
+            rows = self._query(
+                f'SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?',
+                (thread_id, checkpoint_ns, checkpoint_id),
+            )
+        else:
+            rows = self._query(
+                f'SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? '
+                'ORDER BY checkpoint_id DESC LIMIT 1',
+                (thread_id, checkpoint_ns),
+            )
+        return self._tuple(thread_id, checkpoint_ns, rows[0]) if rows else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config:
+            clauses.append('thread_id = ?')
+            params.append(config['configurable']['thread_id'])
+            if (checkpoint_ns := config['configurable'].get('checkpoint_ns')) is not None:
+                clauses.append('checkpoint_ns = ?')
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append('checkpoint_id = ?')
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append('checkpoint_id < ?')
+            params.append(before_id)
+        where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+        rows = self._query(
+            'SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, checkpoint_type, checkpoint, '
+            f'metadata_type, metadata FROM checkpoints {where} ORDER BY checkpoint_id DESC',
+            tuple(params),
+        )
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            item = self._tuple(row[0], row[1], row[2:])
+            if filter and not all(item.metadata.get(key) == value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config['configurable']['thread_id']
+        checkpoint_ns = config['configurable']['checkpoint_ns']
+        stored = checkpoint.copy()
+        values: Dict[str, Any] = stored.pop('channel_values')  # type: ignore[misc]
+        blobs = [
+            (thread_id, checkpoint_ns, channel, str(version), *(
+                self.serde.dumps_typed(values[channel]) if channel in values else ('empty', b'')
+            ))
+            for channel, version in new_versions.items()
+        ]
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed(stored)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)', blobs)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint['id'],
+                    config['configurable'].get('checkpoint_id'),
+                    checkpoint_type,
+                    checkpoint_blob,
+                    metadata_type,
+                    metadata_blob,
+                ),
+            )
+        return {
+            'configurable': {
+                'thread_id': thread_id,
+                'checkpoint_ns': checkpoint_ns,
+                'checkpoint_id': checkpoint['id'],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = '',
+    ) -> None:
+        thread_id = config['configurable']['thread_id']
+        checkpoint_ns = config['configurable'].get('checkpoint_ns', '')
+        checkpoint_id = config['configurable']['checkpoint_id']
+        # Special writes (errors, interrupts) replace earlier ones; regular writes are kept as first recorded
+        rows = {'INSERT OR REPLACE': [], 'INSERT OR IGNORE': []}
+        for index, (channel, value) in enumerate(writes):
+            value_type, data = self.serde.dumps_typed(value)
+            verb = 'INSERT OR REPLACE' if channel in WRITES_IDX_MAP else 'INSERT OR IGNORE'
+            rows[verb].append((
+                thread_id, checkpoint_ns, checkpoint_id, task_id,
+                WRITES_IDX_MAP.get(channel, index), channel, value_type, data, task_path,
+            ))
+        with self._lock, self._conn:
+            for verb, batch in rows.items():
+                if batch:
+                    self._conn.executemany(f'{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock, self._conn:
+            for table in ('checkpoints', 'blobs', 'writes'):
+                self._conn.execute(f'DELETE FROM {table} WHERE thread_id = ?', (thread_id,))
+
+    def prune(self, thread_id: str, keep: Optional[int] = None):
+        """Drop all but the newest `keep` checkpoints of a thread, with their writes and unreferenced blobs."""
+        keep = self.keep if keep is None else keep
+        with self._lock, self._conn:
+            stale = [
+                row[0]
+                for row in self._conn.execute(
+                    'SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?',
+                    (thread_id, keep),
+                )
+            ]
+            if not stale:
+                return
+            self._conn.executemany(
+                'DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id = ?', [(thread_id, c) for c in stale]
+            )
+            self._conn.executemany(
+                'DELETE FROM writes WHERE thread_id = ? AND checkpoint_id = ?', [(thread_id, c) for c in stale]
+            )
+            remaining = self._conn.execute(
+                'SELECT checkpoint_type, checkpoint FROM checkpoints WHERE thread_id = ?', (thread_id,)
+            ).fetchall()
+            referenced = set()
+            for checkpoint_type, checkpoint_blob in remaining:
+                versions = self.serde.loads_typed((checkpoint_type, checkpoint_blob))['channel_versions']
+                referenced.update((channel, str(version)) for channel, version in versions.items())
+            blobs = self._conn.execute(
+                'SELECT channel, version FROM blobs WHERE thread_id = ?', (thread_id,)
+            ).fetchall()
+            self._conn.executemany(
+                'DELETE FROM blobs WHERE thread_id = ? AND channel = ? AND version = ?',
+                [(thread_id, channel, version) for channel, version in blobs if (channel, version) not in referenced],
+            )
+        logger.info(f'Pruned {len(stale)} checkpoints of thread {thread_id}')
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = '',
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    async def aprune(self, thread_id: str, keep: Optional[int] = None):
+        await asyncio.to_thread(self.prune, thread_id, keep)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_version = 0
+        elif isinstance(current, int):
+            current_version = current
+        else:
+            current_version = int(current.split('.')[0])
+        return f'{current_version + 1:032}.{random.random():016}'
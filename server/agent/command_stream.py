@@ -0,0 +1,104 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Output sent back to the LLM is cut down to this much of the start and the end
+HEAD_CHARS = 2000
+TAIL_CHARS = 4000
+
+
+class BoundedOutput:
+    """Keeps the head and tail of a stream and counts everything in between."""
+
+    def __init__(self, head_chars: int = HEAD_CHARS, tail_chars: int = TAIL_CHARS):
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self.head = ''
+        self.tail = ''
+        self.total = 0
+
+    def append(self, chunk: str):
+        self.total += len(chunk)
+        if len(self.head) < self.head_chars:
+            room = self.head_chars - len(self.head)
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            self.tail = (self.tail + chunk)[-self.tail_chars:]
+
+    def text(self) -> str:
+        omitted = self.total - len(self.head) - len(self.tail)
+        if omitted <= 0:
+            return self.head + self.tail
+        return f'{self.head}\n... [{omitted} characters omitted] ...\n{self.tail}'
+
+
+class CommandOutputStream:
+    """
+    Collects stdout/stderr chunks of a running command, forwards them as
+    throttled `command_output` frames and keeps a bounded copy for the LLM.
+
+    Chunks arriving within `flush_interval` of each other are merged into one
+    frame per stream, so a chatty `npm install` costs a handful of WebSocket
+    messages per second instead of one per line.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[dict], Awaitable[None]],
+        flush_interval: float = 0.25,
+        max_frame_chars: int = 8192,
+    ):
+        self.send = send
+        self.flush_interval = flush_interval
+        self.max_frame_chars = max_frame_chars
+        self.stdout = BoundedOutput()
+        self.stderr = BoundedOutput()
+        self._pending: Dict[str, str] = {'stdout': '', 'stderr': ''}
+        self._flusher: Optional[asyncio.Task] = None
+        self._waiting = False
+
+    def on_stdout(self, chunk: str):
+        self.stdout.append(chunk)
+        self._queue('stdout', chunk)
+
+    def on_stderr(self, chunk: str):
+        self.stderr.append(chunk)
+        self._queue('stderr', chunk)
+
+    async def close(self):
+        """Stop the periodic flush and send whatever is still buffered."""
+        if self._flusher and not self._flusher.done():
+            if self._waiting:
+                self._flusher.cancel()
+            else:
+                # Let an in-flight send finish rather than cut it off
+                await self._flusher
+        await self._flush()
+
+    def _queue(self, stream: str, chunk: str):
+        # Only the most recent part of a frame is worth showing; the rest is in the bounded copy
+        self._pending[stream] = (self._pending[stream] + chunk)[-self.max_frame_chars:]
+        if self._flusher is None or self._flusher.done():
+            self._waiting = True
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.flush_interval)
+        finally:
+            self._waiting = False
+        await self._flush()
+
+    async def _flush(self):
+        for stream in ('stdout', 'stderr'):
+            text = self._pending[stream]
+            if not text:
+                continue
+            self._pending[stream] = ''
+            try:
+                await self.send({'e': 'command_output', 'stream': stream, 'message': text})
+            except Exception as e:
+                logger.warning(f'Failed to forward command output: {e}')
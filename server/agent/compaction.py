@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+from typing import List, Sequence, Tuple
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+# Rough prompt size budget for one call_llm, in estimated tokens
+TOKEN_BUDGET = int(os.getenv('LLM_TOKEN_BUDGET', '32000'))
+# Number of most recent LLM turns that are always sent verbatim
+KEEP_RECENT_TURNS = int(os.getenv('COMPACTION_KEEP_TURNS', '2'))
+# Tool outputs longer than this are cut down to a head plus a stub
+MAX_TOOL_OUTPUT_CHARS = 1500
+TOOL_OUTPUT_HEAD_CHARS = 300
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(messages: Sequence[BaseMessage]) -> int:
+    """Cheap token estimate (about 4 characters per token) that needs no tokenizer."""
+    chars = 0
+    for message in messages:
+        chars += len(message.content) if isinstance(message.content, str) else len(json.dumps(message.content))
+        if isinstance(message, AIMessage):
+            for call in message.tool_calls:
+                chars += len(call.get('name', '')) + len(json.dumps(call.get('args', {})))
+    return chars // CHARS_PER_TOKEN
+
+
+def _stub(text: str) -> str:
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+    return f'<omitted {len(text)} chars, sha256 {digest}>'
+
+
+def _compact_ai_message(message: AIMessage) -> AIMessage:
+    if not any(call.get('name') == 'create_file' for call in message.tool_calls):
+        return message
+    tool_calls = []
+    for call in message.tool_calls:
+        args = call.get('args', {})
+        if call.get('name') == 'create_file' and isinstance(args.get('content'), str):
+            args = {**args, 'content': _stub(args['content'])}
+        tool_calls.append({**call, 'args': args})
+    return message.model_copy(update={'tool_calls': tool_calls})
+
+
+def _compact_tool_message(message: ToolMessage) -> ToolMessage:
+    content = message.content
+    if not isinstance(content, str) or len(content) <= MAX_TOOL_OUTPUT_CHARS:
+        return message
+    head = content[:TOOL_OUTPUT_HEAD_CHARS]
+    return message.model_copy(update={'content': f'{head}\n... {_stub(content[TOOL_OUTPUT_HEAD_CHARS:])}'})
+
+
+def _compact_message(message: BaseMessage) -> BaseMessage:
+    if isinstance(message, AIMessage):
+        return _compact_ai_message(message)
+    if isinstance(message, ToolMessage):
+        return _compact_tool_message(message)
+    return message
+
+
+def _turn_starts(messages: Sequence[BaseMessage]) -> List[int]:
+    """Indices of the AI messages that open each LLM turn."""
+    return [index for index, message in enumerate(messages) if isinstance(message, AIMessage)]
+
+
+def compact_messages(
+    messages: Sequence[BaseMessage],
+    token_budget: int = TOKEN_BUDGET,
+    keep_recent_turns: int = KEEP_RECENT_TURNS,
+) -> Tuple[List[BaseMessage], dict]:
+    """
+    Shrink the conversation sent to the LLM without touching the graph state.
+
+    Turns older than the last `keep_recent_turns` have their create_file bodies
+    and long tool outputs replaced by stubs (size plus a content hash). If the
+    result is still over `token_budget`, recent turns are stubbed as well, and
+    as a last resort whole old turns are dropped. A dropped turn loses its AI
+    message and tool results only; the user's prompts, including the ones
+    between turns of a thread that spans several runs, and the latest turn are
+    never dropped.
+
+    Returns the compacted messages and a stats dict with token counts.
+    """
+    messages = list(messages)
+    tokens_before = estimate_tokens(messages)
+    starts = _turn_starts(messages)
+
+    def stub_from(turn_index: int) -> List[BaseMessage]:
+        # Stub everything before the given turn; past the last turn means stub everything
+        cutoff = starts[turn_index] if turn_index < len(starts) else len(messages)
+        return [_compact_message(message) if index < cutoff else message for index, message in enumerate(messages)]
+
+    keep = min(keep_recent_turns, len(starts))
+    compacted = stub_from(len(starts) - keep)
+    while estimate_tokens(compacted) > token_budget and keep > 0:
+        keep -= 1
+        compacted = stub_from(len(starts) - keep)
+
+    dropped_turns = 0
+    while estimate_tokens(compacted) > token_budget:
+        starts = _turn_starts(compacted)
+        if len(starts) < 2:
+            break
+        # Drop the oldest turn together with its tool results, but keep any prompt that follows it
+        compacted = compacted[:starts[0]] + [
+            message for message in compacted[starts[0]:starts[1]] if isinstance(message, HumanMessage)
+        ] + compacted[starts[1]:]
+        dropped_turns += 1
+
+    tokens_after = estimate_tokens(compacted)
+    return compacted, {
+        'tokens_before': tokens_before,
+        'tokens_after': tokens_after,
+        'tokens_saved': tokens_before - tokens_after,
+        'dropped_turns': dropped_turns,
+    }
+
@@ -0,0 +1,200 @@
+"""
+Project context for the model, indexed per file.
+
+Saved context only holds the model's own notes (semantic, procedural,
+episodic). File contents already live in the project's file stores; the index
+next to the notes records for each file its hash, size and the imports,
+exports and component names found in it. `get_context` returns the notes plus
+a map built from the index under a fixed size budget, and `retrieve_context`
+searches the index for the paths of the files that match a query. Contents
+are only ever read through read_files.
+"""
+import json
+import os
+import re
+from typing import Dict, List, Optional
+from agent.snapshot import content_hash, known_files
+from utils.persistent_store import get_project_path
+import logging
+
+logger = logging.getLogger(__name__)
+
+# get_context stays around this size however large the project gets
+CONTEXT_BUDGET_CHARS = int(os.getenv('CONTEXT_BUDGET_CHARS', '4000'))
+MAX_RETRIEVED_FILES = 20
+
+SOURCE_EXTENSIONS = ('.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs', '.vue', '.svelte')
+
+IMPORT_PATTERN = re.compile(r'''(?:import\s+(?:[^'"]*?\s+from\s+)?|require\(\s*|import\(\s*)['"]([^'"]+)['"]''')
+EXPORT_DECLARATION = re.compile(
+    r'export\s+(?:default\s+)?(?:async\s+)?(?:function\*?|class|const|let|var|interface|type|enum)\s+([A-Za-z_$][\w$]*)'
+)
+EXPORT_LIST = re.compile(r'export\s*\{([^}]*)\}')
+EXPORT_DEFAULT_NAME = re.compile(r'export\s+default\s+([A-Za-z_$][\w$]*)\s*;?\s*$', re.MULTILINE)
+COMPONENT_PATTERN = re.compile(
+    r'(?:function\s+([A-Z][\w$]*)\s*\(|(?:const|let)\s+([A-Z][\w$]*)\s*=\s*(?:React\.)?(?:memo\(|forwardRef\()?\s*(?:async\s*)?\()'
+)
+
+
+def _context_dir(project_id: str) -> str:
+    return os.path.join(get_project_path(project_id), 'context')
+
+
+def _read_json(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def describe_file(file_path: str, content: str) -> dict:
+    """Hash, size and the symbols a file brings in and offers."""
+    entry = {'hash': content_hash(content), 'size': len(content)}
+    if not file_path.endswith(SOURCE_EXTENSIONS):
+        return entry
+
+    exports = EXPORT_DECLARATION.findall(content)
+    for names in EXPORT_LIST.findall(content):
+        for name in names.split(','):
+            name = name.strip().split(' as ')[-1].strip()
+            if name:
+                exports.append(name)
+    exports.extend(EXPORT_DEFAULT_NAME.findall(content))
+
+    entry['imports'] = sorted(set(IMPORT_PATTERN.findall(content)))
+    entry['exports'] = sorted(set(exports))
+    if file_path.endswith(('.jsx', '.tsx', '.vue', '.svelte')) or '<' in content:
+        entry['components'] = sorted({a or b for a, b in COMPONENT_PATTERN.findall(content)})
+    return entry
+
+
+def update_index(project_id: str) -> Dict[str, dict]:
+    """Bring the file index up to date, re-parsing only files whose content changed."""
+    path = os.path.join(_context_dir(project_id), 'index.json')
+    index = _read_json(path) or {}
+    files = known_files(project_id)
+
+    updated = {}
+    changed = False
+    for file_path, content in files.items():
+        previous = index.get(file_path)
+        if previous is not None and previous['hash'] == content_hash(content):
+            updated[file_path] = previous
+        else:
+            updated[file_path] = describe_file(file_path, content)
+            changed = True
+
+    if changed or len(updated) != len(index):
+        _write_json(path, updated)
+    return updated
+
+
+def load_notes(project_id: str) -> Optional[dict]:
+    notes = _read_json(os.path.join(_context_dir(project_id), 'notes.json'))
+    if notes is None:
+        # Written by the older save_context together with every file's contents
+        legacy = _read_json(os.path.join(_context_dir(project_id), 'context.json'))
+        if legacy is not None:
+            notes = {key: legacy.get(key, '') for key in ('semantic', 'procedural', 'episodic')}
+    return notes
+
+
+def save_context(project_id: str, semantic: str, procedural: str = '', episodic: str = '') -> str:
+    semantic = semantic.strip()
+    if not semantic:
+        return 'Error: semantic context is required for save_context'
+    _write_json(
+        os.path.join(_context_dir(project_id), 'notes.json'),
+        {'semantic': semantic, 'procedural': procedural.strip(), 'episodic': episodic.strip()},
+    )
+    index = update_index(project_id)
+    logger.info(f'Saved context for project {project_id} ({len(index)} files indexed)')
+    return f'Context saved successfully. Semantic: {semantic[:100]}...'
+
+
+def _file_line(file_path: str, entry: dict) -> str:
+    parts = [f'{file_path} ({entry["size"]} chars)']
+    if entry.get('components'):
+        parts.append(f'components: {", ".join(entry["components"])}')
+    elif entry.get('exports'):
+        parts.append(f'exports: {", ".join(entry["exports"])}')
+    local_imports = [name for name in entry.get('imports', []) if name.startswith('.')]
+    if local_imports:
+        parts.append(f'imports: {", ".join(local_imports)}')
+    return ' - '.join(parts)
+
+
+def get_context(project_id: str, budget: int = CONTEXT_BUDGET_CHARS) -> str:
+    notes = load_notes(project_id)
+    index = update_index(project_id)
+    if notes is None and not index:
+        return 'No context found - this is a fresh project. You can proceed with creating the project from scratch.'
+
+    lines = ['Previous project context:']
+    if notes is not None:
+        lines += [
+            f'Semantic: {notes.get("semantic") or "N/A"}',
+            f'Procedural: {notes.get("procedural") or "N/A"}',
+            f'Episodic: {notes.get("episodic") or "N/A"}',
+        ]
+    lines.append(f'Files ({len(index)}):')
+
+    used = sum(len(line) + 1 for line in lines)
+    listed = 0
+    for file_path in sorted(index):
+        line = _file_line(file_path, index[file_path])
+        if used + len(line) + 1 > budget:
+            break
+        lines.append(line)
+        used += len(line) + 1
+        listed += 1
+
+    remaining = sorted(index)[listed:]
+    if remaining:
+        folders: Dict[str, int] = {}
+        for file_path in remaining:
+            folder = os.path.dirname(file_path) or '.'
+            folders[folder] = folders.get(folder, 0) + 1
+        lines.append(
+            f'...and {len(remaining)} more files in '
+            + ', '.join(f'{folder}/ ({count})' for folder, count in sorted(folders.items()))
+        )
+
+    lines.append(
+        'Use retrieve_context with a search term to find more files, '
+        'read_files to read the code you need, and continue from there.'
+    )
+    return '\n'.join(lines)
+
+
+def _matches(file_path: str, entry: dict, terms: List[str]) -> int:
+    # A file that defines what was asked for ranks above the files importing it
+    defines = ' '.join([file_path] + entry.get('exports', []) + entry.get('components', [])).lower()
+    imports = ' '.join(entry.get('imports', [])).lower()
+    return sum(2 if term in defines else 1 if term in imports else 0 for term in terms)
+
+
+def retrieve_context(project_id: str, query: str) -> str:
+    """Paths of the files whose path or symbols best match `query`, one index line each."""
+    index = update_index(project_id)
+    terms = [term for term in re.split(r'[\s,]+', query.lower()) if term]
+    if not terms:
+        return 'Error: query is required for retrieve_context'
+    scored = sorted(
+        ((score, file_path) for file_path, entry in index.items() if (score := _matches(file_path, entry, terms))),
+        key=lambda item: (-item[0], item[1]),
+    )
+    if not scored:
+        return 'No matching files.'
+    lines = [_file_line(file_path, index[file_path]) for _, file_path in scored[:MAX_RETRIEVED_FILES]]
+    if len(scored) > MAX_RETRIEVED_FILES:
+        lines.append(f'...and {len(scored) - MAX_RETRIEVED_FILES} more matches; narrow the query to see them')
+    lines.append('Use read_files with these paths to read their contents.')
+    return '\n'.join(lines)
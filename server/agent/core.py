@@ -1,35 +1,112 @@
 import os
 import asyncio
-from typing import TypedDict, Annotated, Sequence
-from langchain_google_genai import ChatGoogleGenerativeAI
+import threading
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Optional, TypedDict, Annotated, Sequence
 from langgraph.graph import StateGraph, END, add_messages
 from langchain_core.messages import SystemMessage, BaseMessage, ToolMessage, AIMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.runtime import Runtime
 from dotenv import load_dotenv
-from .tools import create_file, execute_command, get_context, save_context
+from .tools import (
+    create_file,
+    edit_file,
+    execute_command,
+    get_context,
+    read_file,
+    read_files,
+    retrieve_context,
+    save_context,
+)
+from . import context_store
+from .compaction import compact_messages
+from .llm_cache import cache_key, llm_cache, tool_schema
+from .checkpointer import SqliteCheckpointSaver
+from .run_scheduler import llm_limiter
+from utils.tracing import llm_tokens, span
 from prompt import PROMPT
 import logging
 
 load_dotenv()
-api_key = os.getenv('GOOGLE_API_KEY')
-if api_key is None:
-    raise Exception('API key not found')
 
 logger = logging.getLogger(__name__)
 
-llm = ChatGoogleGenerativeAI(model='gemini-2.5-flash', google_api_key=api_key)
+MODEL_NAME = 'gemini-2.5-flash'
 
-tools = [create_file, execute_command, save_context, get_context]
+tools = [create_file, edit_file, read_file, read_files, execute_command, save_context, get_context, retrieve_context]
 tools_by_name = {tool.name: tool for tool in tools}
-llm_with_tools = llm.bind_tools(tools)
+context_tools = {save_context.name, get_context.name, retrieve_context.name}
+sandbox_tools = {create_file.name, edit_file.name, read_file.name, read_files.name, execute_command.name}
+TOOL_SCHEMA = tool_schema(tools)
 
 # Maximum number of tool call iterations to prevent infinite loops
 MAX_TOOL_ITERATIONS = 50
 
+# Graph state is checkpointed per project thread so runs can resume and follow-ups continue it
+CHECKPOINTS_ENABLED = os.getenv("CHECKPOINTS", "1") == "1"
+
+# The model, checkpointer and compiled graph are built on first use (or by the
+# server's warmup), so importing this module neither needs GOOGLE_API_KEY nor
+# loads the Gemini client. Benchmarks swap in a scripted model by assigning
+# llm_with_tools before the first run.
+llm = None
+llm_with_tools = None
+_checkpointer = None
+_agent = None
+_init_lock = threading.Lock()
+
+
+def get_model():
+    """The chat model with the tools bound. Raises when GOOGLE_API_KEY is not set."""
+    global llm, llm_with_tools
+    with _init_lock:
+        if llm_with_tools is None:
+            api_key = os.getenv('GOOGLE_API_KEY')
+            if api_key is None:
+                raise Exception('API key not found')
+            # Importing the Gemini client alone takes most of a second
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            llm = ChatGoogleGenerativeAI(model=MODEL_NAME, google_api_key=api_key)
+            llm_with_tools = llm.bind_tools(tools)
+    return llm_with_tools
+
+
+async def warmup_model():
+    """Build the model and its async client ahead of the first LLM call."""
+    model = await asyncio.to_thread(get_model)
+    # The async client needs the running event loop, so the first ainvoke would otherwise build it
+    getattr(llm, 'async_client', None)
+    return model
+
+
+def get_checkpointer() -> Optional[SqliteCheckpointSaver]:
+    """The checkpointer, opened on first use; None when CHECKPOINTS=0."""
+    global _checkpointer
+    if CHECKPOINTS_ENABLED:
+        with _init_lock:
+            if _checkpointer is None:
+                _checkpointer = SqliteCheckpointSaver()
+    return _checkpointer
+
 
 class AgentState(TypedDict):
     """State schema for the agent graph"""
     messages: Annotated[Sequence[BaseMessage], add_messages]
     iteration_count: int
+    compaction: dict
+
+
+@dataclass
+class AgentContext:
+    """
+    Live objects of one run, passed as the graph's runtime context and never
+    checkpointed. run_sandbox_tools executes a batch of sandbox tool calls
+    against the run's sandbox and returns one ToolMessage per call, in order.
+    """
+    sandbox: Any = None
+    channel: Any = None
+    run_sandbox_tools: Optional[Callable[[List[dict]], Awaitable[List[ToolMessage]]]] = None
 
 
 def should_continue(state: AgentState) -> str:
@@ -50,49 +127,96 @@ def should_continue(state: AgentState) -> str:
     return "end"
 
 
-async def call_llm(state: AgentState) -> AgentState:
+async def call_llm(state: AgentState, config: RunnableConfig) -> AgentState:
     """
     Call the LLM with the current messages.
+    Identical requests are answered from llm_cache unless the run opted out
+    with configurable["llm_cache"] = False.
     """
     messages = state["messages"]
+    use_cache = llm_cache.enabled and config.get("configurable", {}).get("llm_cache", True)
     
     try:
-        llm_messages = [SystemMessage(content=PROMPT)] + list(messages)
-        response = await llm_with_tools.ainvoke(llm_messages)
+        llm_messages, compaction = compact_messages([SystemMessage(content=PROMPT)] + list(messages))
+        logger.info(
+            f"Prompt tokens ~{compaction['tokens_after']} "
+            f"(saved ~{compaction['tokens_saved']} by compaction, dropped {compaction['dropped_turns']} turns)"
+        )
+        with span("llm.call", prompt_tokens_estimate=compaction["tokens_after"]) as attrs:
+            key = cache_key(llm_messages, TOOL_SCHEMA) if use_cache else None
+            response = llm_cache.get(key) if key else None
+            attrs["cached"] = response is not None
+            if response is not None:
+                logger.info("LLM response served from cache")
+            else:
+                model = llm_with_tools if llm_with_tools is not None else await asyncio.to_thread(get_model)
+                async with llm_limiter.slot():
+                    response = await model.ainvoke(llm_messages)
+                if key:
+                    llm_cache.put(key, response)
+                usage = getattr(response, "usage_metadata", None) or {}
+                attrs["input_tokens"] = usage.get("input_tokens", 0)
+                attrs["output_tokens"] = usage.get("output_tokens", 0)
+                llm_tokens.inc("input", attrs["input_tokens"])
+                llm_tokens.inc("output", attrs["output_tokens"])
+            attrs["tool_calls"] = len(response.tool_calls)
         
         return {
             "messages": [response],
-            "iteration_count": state.get("iteration_count", 0)
+            "iteration_count": state.get("iteration_count", 0),
+            "compaction": compaction,
         }
     except Exception as e:
         logger.error(f"Error calling LLM: {e}")
         raise
 
 
-async def execute_tools(state: AgentState) -> AgentState:
+async def run_context_tool(tool_name: str, args: dict, project_id: str) -> str:
+    """Serve get_context, save_context and retrieve_context from the project's context store."""
+    if tool_name == "get_context":
+        return await asyncio.to_thread(context_store.get_context, project_id)
+    if tool_name == "save_context":
+        return await asyncio.to_thread(
+            context_store.save_context,
+            project_id,
+            args.get("semantic", ""),
+            args.get("procedural", ""),
+            args.get("episodic", ""),
+        )
+    return await asyncio.to_thread(context_store.retrieve_context, project_id, args.get("query", ""))
+
+
+async def execute_tools(state: AgentState, config: RunnableConfig, runtime: Runtime[AgentContext]) -> AgentState:
     """
-    Execute tool calls from the last AI message.
-    Only handles context tools (get_context, save_context).
-    Sandbox tools (create_file, execute_command) are handled externally by agent_service.
+    Execute the tool calls of the last AI message and return their results.
+    Context tools are served here; consecutive sandbox tools go to the run's
+    AgentContext as one batch, so they can be scheduled together.
     """
-    messages = state["messages"]
-    last_message = messages[-1]
+    last_message = state["messages"][-1]
     
     if not isinstance(last_message, AIMessage) or not last_message.tool_calls:
-        return state
+        return {}
     
     iteration_count = state.get("iteration_count", 0) + 1
     tool_names = [tc.get('name', 'unknown') for tc in last_message.tool_calls]
     logger.info(f"Tool call iteration {iteration_count}, tools: {tool_names}")
     
+    context = runtime.context
+    project_id = config.get("configurable", {}).get("project_id")
     tool_results = []
-    sandbox_tools = ['create_file', 'execute_command']
-    
-    existing_tool_results = {
-        msg.tool_call_id: msg 
-        for msg in messages 
-        if isinstance(msg, ToolMessage)
-    }
+    sandbox_batch = []
+
+    async def flush_sandbox_batch():
+        if not sandbox_batch:
+            return
+        if context is None:
+            tool_results.extend(
+                ToolMessage(content="Error: no sandbox is attached to this run", tool_call_id=tc.get('id', 'unknown'))
+                for tc in sandbox_batch
+            )
+        else:
+            tool_results.extend(await context.run_sandbox_tools(list(sandbox_batch)))
+        sandbox_batch.clear()
     
     for tool_call in last_message.tool_calls:
         tool_name = tool_call.get('name')
@@ -100,16 +224,9 @@ async def execute_tools(state: AgentState) -> AgentState:
         tool_call_id = tool_call.get('id', 'unknown')
         
         if tool_name in sandbox_tools:
-            if tool_call_id in existing_tool_results:
-                logger.debug(f"Using existing result for sandbox tool {tool_name} from agent_service")
-                tool_results.append(existing_tool_results[tool_call_id])
-            else:
-                logger.debug(f"Skipping sandbox tool {tool_name} - will be handled by agent_service")
-                tool_results.append(ToolMessage(
-                    content=f"Tool {tool_name} will be executed externally",
-                    tool_call_id=tool_call_id
-                ))
+            sandbox_batch.append(tool_call)
             continue
+        await flush_sandbox_batch()
         
         if tool_name not in tools_by_name:
             error_msg = f"Unknown tool: {tool_name}. Available tools: {list(tools_by_name.keys())}"
@@ -121,8 +238,12 @@ async def execute_tools(state: AgentState) -> AgentState:
             continue
         
         try:
-            tool = tools_by_name[tool_name]
-            result = await tool.ainvoke(tool_args)
+            if tool_name in context_tools and project_id:
+                with span(f"tool.{tool_name}"):
+                    result = await run_context_tool(tool_name, tool_args, project_id)
+            else:
+                tool = tools_by_name[tool_name]
+                result = await tool.ainvoke(tool_args)
             
             if not isinstance(result, str):
                 result = str(result)
@@ -138,18 +259,20 @@ async def execute_tools(state: AgentState) -> AgentState:
                 content=f"Error: {error_msg}",
                 tool_call_id=tool_call_id
             ))
+    await flush_sandbox_batch()
     
     return {
-        "messages": [last_message] + tool_results,
+        "messages": tool_results,
         "iteration_count": iteration_count
     }
 
 
-def create_agent_graph():
+def create_agent_graph(checkpointer=None):
     """
     Create and compile the agent StateGraph.
+    With a checkpointer, every run needs configurable["thread_id"].
     """
-    workflow = StateGraph(AgentState)
+    workflow = StateGraph(AgentState, context_schema=AgentContext)
     
     workflow.add_node("call_llm", call_llm)
     workflow.add_node("execute_tools", execute_tools)
@@ -167,7 +290,15 @@ def create_agent_graph():
     
     workflow.add_edge("execute_tools", "call_llm")
     
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
 
 
-agent = create_agent_graph()
+def get_agent():
+    """The compiled agent graph, built on first use with the shared checkpointer."""
+    global _agent
+    if _agent is None:
+        graph = create_agent_graph(get_checkpointer())
+        with _init_lock:
+            if _agent is None:
+                _agent = graph
+    return _agent
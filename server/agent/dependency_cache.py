@@ -0,0 +1,167 @@
+"""
+Local cache of installed node_modules trees, keyed by the dependency
+manifest that produced them, so a sandbox can get its dependencies back
+in bulk instead of resolving them again.
+"""
+import hashlib
+import os
+import re
+from typing import Optional
+from e2b_code_interpreter import AsyncSandbox, CommandExitException
+from agent.sandbox_pool import APP_DIR
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv('DEPENDENCY_CACHE', '1') == '1'
+CACHE_DIR = os.getenv('DEPENDENCY_CACHE_DIR', 'data/dependency_cache')
+# Least recently used archives are dropped once the cache grows past this
+CACHE_MAX_BYTES = int(os.getenv('DEPENDENCY_CACHE_MAX_MB', '2048')) * 1024 * 1024
+ARCHIVE_PATH = '/tmp/node_modules.tgz'
+# Packing a large tree takes far longer than the SDK's default command timeout
+ARCHIVE_TIMEOUT = int(os.getenv('DEPENDENCY_ARCHIVE_TIMEOUT', '300'))
+# Tool caches inside node_modules that change while the dev server runs
+ARCHIVE_EXCLUDES = ('node_modules/.vite', 'node_modules/.cache')
+
+# Installs that only resolve what package.json already declares. `npm install foo`
+# changes the manifest first, so it runs for real and the result is cached under
+# the manifest it produced.
+INSTALL_COMMAND = re.compile(
+    r'^\s*(npm\s+(install|i|ci)|yarn(\s+install)?|pnpm\s+(install|i))(\s+--?[\w-]+(=\S+)?)*\s*$'
+)
+
+
+def is_install_command(command: str) -> bool:
+    return bool(INSTALL_COMMAND.match(command))
+
+
+def dependency_key(package_json: str, lockfile: Optional[str] = None) -> str:
+    """The lockfile pins the whole tree when there is one; otherwise package.json is all we have."""
+    source = lockfile if lockfile else package_json
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:32]
+
+
+async def _read_optional(sandbox: AsyncSandbox, path: str) -> Optional[str]:
+    try:
+        return await sandbox.files.read(f'{APP_DIR}/{path}')
+    except Exception:
+        return None
+
+
+async def sandbox_dependency_key(sandbox: AsyncSandbox) -> Optional[str]:
+    package_json = await _read_optional(sandbox, 'package.json')
+    if package_json is None:
+        return None
+    return dependency_key(package_json, await _read_optional(sandbox, 'package-lock.json'))
+
+
+class DependencyCache:
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, enabled: bool = CACHE_ENABLED):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0
+        self.evicted = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, f'{key}.tgz')
+
+    def has(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    async def save_from_sandbox(self, sandbox: AsyncSandbox, key: str) -> bool:
+        """
+        Archive the sandbox's node_modules under `key`, streaming the archive
+        to disk. Returns False if there is nothing to save.
+        """
+        if not self.enabled:
+            return False
+        if self.has(key):
+            return True
+        excludes = ' '.join(f'--exclude={path}' for path in ARCHIVE_EXCLUDES)
+        try:
+            # The lockfile goes along so a restore leaves the same tree npm would have
+            await sandbox.commands.run(
+                f'cd {APP_DIR} && test -d node_modules && '
+                f'tar czf {ARCHIVE_PATH} {excludes} node_modules $(test -f package-lock.json && echo package-lock.json)',
+                timeout=ARCHIVE_TIMEOUT,
+            )
+        except CommandExitException:
+            return False
+
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f'{self.path(key)}.tmp'
+        size = 0
+        try:
+            stream = await sandbox.files.read(ARCHIVE_PATH, format='stream', request_timeout=ARCHIVE_TIMEOUT)
+            with open(tmp_path, 'wb') as f:
+                async for chunk in stream:
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, self.path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        try:
+            await sandbox.commands.run(f'rm -f {ARCHIVE_PATH}')
+        except Exception as e:
+            logger.debug(f'Could not remove the archive from the sandbox: {e}')
+        self.saved += 1
+        logger.info(f'Cached node_modules {key} ({size} bytes)')
+        self._evict(keep=key)
+        return True
+
+    async def restore_into(self, sandbox: AsyncSandbox, key: str) -> bool:
+        """Unpack the cached node_modules for `key` into the sandbox in one upload and one command."""
+        if not self.enabled:
+            return False
+        if not self.has(key):
+            self.misses += 1
+            return False
+        with open(self.path(key), 'rb') as f:
+            archive = f.read()
+        # The archive's mtime is its last use, which is what eviction goes by
+        os.utime(self.path(key))
+        await sandbox.files.write(ARCHIVE_PATH, archive)
+        await sandbox.commands.run(f'cd {APP_DIR} && rm -rf node_modules && tar xzf {ARCHIVE_PATH} && rm -f {ARCHIVE_PATH}')
+        self.hits += 1
+        return True
+
+    def size(self) -> int:
+        if not os.path.isdir(self.root):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.root) if entry.name.endswith('.tgz'))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'saved': self.saved,
+            'evicted': self.evicted,
+            'bytes': self.size(),
+            'max_bytes': self.max_bytes,
+        }
+
+    def _evict(self, keep: str):
+        entries = sorted(
+            (entry for entry in os.scandir(self.root) if entry.name.endswith('.tgz')),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry.name == f'{keep}.tgz':
+                continue
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+            self.evicted += 1
+            logger.info(f'Evicted node_modules archive {entry.name}')
+
+
+dependency_cache = DependencyCache()
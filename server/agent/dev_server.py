@@ -0,0 +1,210 @@
+"""
+Speculative Vite dev server.
+
+Instead of waiting for the model to run `npm run dev` at the end, the dev
+server is started as soon as the project's dependencies are in place and kept
+running while files are still being written; Vite's HMR picks those up. The
+preview URL goes out as a `preview_ready` event the moment the port answers.
+"""
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+from e2b_code_interpreter import AsyncSandbox, CommandExitException
+from agent.sandbox_pool import APP_DIR, _percentile
+from agent.event_bus import ProjectChannel
+import logging
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv('DEV_SERVER_WARMUP', '1') == '1'
+DEV_SERVER_PORT = 5173
+# How long to wait for package.json and an installed vite before giving up
+DEPENDENCY_WAIT = int(os.getenv('DEV_SERVER_DEPENDENCY_WAIT', '600'))
+MAX_RESTARTS = int(os.getenv('DEV_SERVER_MAX_RESTARTS', '3'))
+# How long a model-issued dev server command started by start_detached gets to open its port
+DETACHED_START_WAIT = int(os.getenv('DEV_SERVER_START_WAIT', '30'))
+
+START_COMMAND = f'cd {APP_DIR} && npx vite --host 0.0.0.0 --port {DEV_SERVER_PORT} --strictPort'
+# Loops inside the sandbox so waiting costs one request instead of one per poll
+WAIT_FOR_DEPENDENCIES = (
+    f"bash -c 'cd {APP_DIR}; for i in $(seq 1 {DEPENDENCY_WAIT}); do "
+    "[ -f package.json ] && [ -x node_modules/.bin/vite ] && exit 0; sleep 1; done; exit 1'"
+)
+WAIT_FOR_PORT = (
+    "bash -c 'for i in $(seq 1 {attempts}); do "
+    f"(echo > /dev/tcp/127.0.0.1/{DEV_SERVER_PORT}) 2>/dev/null && exit 0; sleep 0.5; done; exit 1'"
+)
+
+DEV_SERVER_COMMAND = re.compile(r'^\s*(npm\s+(run\s+)?(dev|start)|yarn\s+(dev|start)|pnpm\s+(run\s+)?dev|npx\s+vite)\b')
+
+
+def is_dev_server_command(command: str) -> bool:
+    return bool(DEV_SERVER_COMMAND.match(command))
+
+
+def preview_url(sandbox: AsyncSandbox) -> str:
+    return f'https://{sandbox.get_host(DEV_SERVER_PORT)}'
+
+
+async def _succeeds(sandbox: AsyncSandbox, command: str, timeout: float) -> bool:
+    try:
+        await sandbox.commands.run(command, timeout=timeout)
+        return True
+    except CommandExitException:
+        return False
+
+
+class DevServer:
+    def __init__(self, sandbox: AsyncSandbox, channel: Optional[ProjectChannel], requested_at: float):
+        self.sandbox = sandbox
+        self.channel = channel
+        self.requested_at = requested_at
+        self.ready = asyncio.Event()
+        self.restarts = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def announce(self):
+        url = preview_url(self.sandbox)
+        if self.channel:
+            self.channel.publish({'e': 'preview_ready', 'url': url, 'message': url})
+
+    async def _listening(self, attempts: int = 1) -> bool:
+        return await _succeeds(self.sandbox, WAIT_FOR_PORT.format(attempts=attempts), timeout=attempts + 10)
+
+    async def run(self, on_ready):
+        if await self._listening():
+            # Still up from an earlier run, e.g. after the sandbox was resumed
+            self.ready.set()
+            on_ready(self)
+            return
+
+        if not await _succeeds(self.sandbox, WAIT_FOR_DEPENDENCIES, timeout=DEPENDENCY_WAIT + 10):
+            logger.info('Dev server warmup gave up waiting for package.json and vite')
+            return
+
+        while True:
+            handle = await self.sandbox.commands.run(START_COMMAND, background=True, timeout=0)
+            if not self.ready.is_set():
+                if await self._listening(attempts=120):
+                    self.ready.set()
+                    on_ready(self)
+                else:
+                    logger.warning('Dev server did not open its port in time')
+            try:
+                await handle.wait()
+            except CommandExitException as e:
+                logger.warning(f'Dev server exited with code {e.exit_code}: {e.stderr[-500:]}')
+
+            if self.restarts >= MAX_RESTARTS:
+                logger.error(f'Dev server crashed {self.restarts + 1} times, not restarting')
+                self.ready.clear()
+                return
+            self.restarts += 1
+            await asyncio.sleep(2 ** self.restarts)
+
+
+class DevServerSupervisor:
+    """One speculative dev server per sandbox, started at the beginning of a run."""
+
+    def __init__(self, enabled: bool = WARMUP_ENABLED):
+        self.enabled = enabled
+        self.servers: Dict[str, DevServer] = {}
+        self.started = 0
+        self.restarts = 0
+        self._time_to_preview: Deque[float] = deque(maxlen=1000)
+
+    def ensure(self, sandbox: AsyncSandbox, channel: Optional[ProjectChannel] = None):
+        """Start warming up the sandbox's dev server unless that is already under way."""
+        if not self.enabled:
+            return
+        server = self.servers.get(sandbox.sandbox_id)
+        if server is not None and server.task is not None and not server.task.done():
+            server.channel = channel
+            if server.ready.is_set():
+                server.announce()
+            return
+
+        server = DevServer(sandbox, channel, time.monotonic())
+        server.task = asyncio.create_task(self._supervise(server))
+        self.servers[sandbox.sandbox_id] = server
+        self.started += 1
+
+    async def wait_ready(self, sandbox: AsyncSandbox, timeout: float) -> bool:
+        """True once this sandbox's dev server is up; False if there is none or it is not up in time."""
+        server = self.servers.get(sandbox.sandbox_id)
+        if server is None:
+            return False
+        if server.ready.is_set():
+            return True
+        if server.task is None or server.task.done():
+            return False
+        try:
+            await asyncio.wait_for(server.ready.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def start_detached(
+        self, sandbox: AsyncSandbox, command: str, wait: float = DETACHED_START_WAIT
+    ) -> Tuple[Optional[int], bool, str]:
+        """
+        Run a model-issued dev server command in the background instead of
+        waiting for a process that never exits. Returns once the port answers,
+        the command exits, or `wait` runs out: (exit code if it exited,
+        whether the port answers, output so far).
+        """
+        output: list = []
+        handle = await sandbox.commands.run(
+            f'cd {APP_DIR} && {command}', background=True, timeout=0, on_stdout=output.append, on_stderr=output.append
+        )
+        exited = asyncio.create_task(handle.wait())
+        listening = asyncio.create_task(
+            _succeeds(sandbox, WAIT_FOR_PORT.format(attempts=max(int(wait * 2), 1)), timeout=wait + 10)
+        )
+        await asyncio.wait({exited, listening}, return_when=asyncio.FIRST_COMPLETED)
+        exit_code = None
+        if exited.done():
+            listening.cancel()
+            try:
+                exit_code = exited.result().exit_code
+            except CommandExitException as e:
+                exit_code = e.exit_code
+            return exit_code, False, ''.join(output)
+        # The server keeps running in the sandbox; only stop following it here
+        exited.cancel()
+        return None, listening.result(), ''.join(output)
+
+    def stop(self, sandbox_id: str):
+        server = self.servers.pop(sandbox_id, None)
+        if server is not None and server.task is not None:
+            server.task.cancel()
+
+    def stats(self) -> dict:
+        latencies = sorted(self._time_to_preview)
+        return {
+            'enabled': self.enabled,
+            'running': sum(1 for server in self.servers.values() if server.ready.is_set()),
+            'started': self.started,
+            'restarts': self.restarts,
+            'time_to_preview_p50': _percentile(latencies, 0.5),
+            'time_to_preview_p95': _percentile(latencies, 0.95),
+        }
+
+    def _on_ready(self, server: DevServer):
+        elapsed = time.monotonic() - server.requested_at
+        self._time_to_preview.append(elapsed)
+        logger.info(f'Preview ready {elapsed:.1f}s after the run started: {preview_url(server.sandbox)}')
+        server.announce()
+
+    async def _supervise(self, server: DevServer):
+        try:
+            await server.run(self._on_ready)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f'Dev server warmup failed: {e}')
+        finally:
+            self.restarts += server.restarts
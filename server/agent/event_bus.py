@@ -0,0 +1,212 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Tuple
+from fastapi import WebSocket
+from utils.tracing import record_for_project
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Events that only carry progress text; consecutive ones are merged and they are dropped first.
+# A dropped thinking_delta is made good by the full `thinking` event sent when the turn ends,
+# so that one is never dropped.
+LOW_PRIORITY_EVENTS = {'thinking_delta', 'command_output'}
+QUEUE_SIZE = int(os.getenv('WS_QUEUE_SIZE', '256'))
+MAX_MERGED_CHARS = 16384
+# How often events are exchanged with other workers through the registry
+FORWARD_INTERVAL = 0.1
+FORWARD_OUTBOX_SIZE = 10000
+
+
+def _can_merge(queued: dict, message: dict) -> bool:
+    return (
+        queued.get('e') in LOW_PRIORITY_EVENTS
+        and queued.get('e') == message.get('e')
+        and queued.get('stream') == message.get('stream')
+        and queued.get('turn') == message.get('turn')
+        and isinstance(queued.get('message'), str)
+        and isinstance(message.get('message'), str)
+    )
+
+
+class Connection:
+    """
+    One WebSocket viewer with its own outbound queue, drained by a writer task,
+    so a slow client never holds up the agent loop or other viewers.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int = QUEUE_SIZE, project_id: Optional[str] = None):
+        self.websocket = websocket
+        self.project_id = project_id
+        self.max_queue = max_queue
+        self.queue: Deque[dict] = deque()
+        self.closed = False
+        self.sent = 0
+        self.merged = 0
+        self.dropped = 0
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._drain())
+
+    def push(self, message: dict):
+        if self.closed:
+            return
+        if self.queue and _can_merge(self.queue[-1], message):
+            last = self.queue[-1]
+            last['message'] = (last['message'] + message['message'])[-MAX_MERGED_CHARS:]
+            self.merged += 1
+            return
+
+        if len(self.queue) >= self.max_queue and not self._drop_low_priority():
+            # The client cannot keep up even with progress events gone; stop feeding it
+            logger.warning('WebSocket send queue full, dropping slow connection')
+            self.close()
+            asyncio.create_task(self._close_socket())
+            return
+
+        self.queue.append(dict(message))
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        if self._writer and not self._writer.done() and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    async def _close_socket(self):
+        try:
+            # 1013: try again later, the client is expected to reconnect
+            await self.websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def _drop_low_priority(self) -> bool:
+        for index, queued in enumerate(self.queue):
+            if queued.get('e') in LOW_PRIORITY_EVENTS:
+                del self.queue[index]
+                self.dropped += 1
+                return True
+        return False
+
+    async def _drain(self):
+        while not self.closed:
+            if not self.queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            message = self.queue.popleft()
+            try:
+                started = time.perf_counter()
+                await self.websocket.send_json(message)
+                self.sent += 1
+                if self.project_id is not None:
+                    record_for_project(
+                        self.project_id, 'ws.send', started, time.perf_counter() - started, {'e': message.get('e')}
+                    )
+            except Exception as e:
+                logger.warning(f'Failed to send WebSocket message: {e}')
+                self.close()
+
+
+class ProjectChannel:
+    """Fans events for one project out to every connected viewer."""
+
+    def __init__(self, project_id: str, bus: Optional['EventBus'] = None):
+        self.project_id = project_id
+        self.bus = bus
+        self.connections: Set[Connection] = set()
+
+    def publish(self, message: dict):
+        self.deliver(message)
+        if self.bus is not None:
+            self.bus.forward(self.project_id, message)
+
+    def deliver(self, message: dict):
+        """Push to the viewers connected to this worker only."""
+        for connection in list(self.connections):
+            connection.push(message)
+
+
+class EventBus:
+    """
+    Per-project channels of local viewers. With a shared registry attached,
+    published events are also relayed through it so viewers connected to
+    other workers receive them, and events from other workers are delivered
+    to the local viewers.
+    """
+
+    def __init__(self):
+        self.channels: Dict[str, ProjectChannel] = {}
+        self.registry = None
+        self._outbox: Deque[Tuple[str, dict]] = deque(maxlen=FORWARD_OUTBOX_SIZE)
+
+    def channel(self, project_id: str) -> ProjectChannel:
+        if project_id not in self.channels:
+            self.channels[project_id] = ProjectChannel(project_id, self)
+        return self.channels[project_id]
+
+    def forward(self, project_id: str, message: dict):
+        if self.registry is not None and self.registry.shared:
+            self._outbox.append((project_id, message))
+
+    async def run_forwarding(self, registry, interval: float = FORWARD_INTERVAL):
+        """Relay events between workers until cancelled; a no-op loop for in-process registries."""
+        self.registry = registry
+        if not registry.shared:
+            return
+        last_id = await registry.last_event_id()
+        while True:
+            try:
+                outgoing = list(self._outbox)
+                self._outbox.clear()
+                await registry.publish_events(outgoing)
+
+                watched = [project_id for project_id, channel in self.channels.items() if channel.connections]
+                if watched:
+                    for event_id, project_id, message in await registry.poll_events(last_id, watched):
+                        last_id = max(last_id, event_id)
+                        channel = self.channels.get(project_id)
+                        if channel:
+                            channel.deliver(message)
+                else:
+                    last_id = await registry.last_event_id()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f'Event forwarding failed: {e}')
+            await asyncio.sleep(interval)
+
+    def subscribe(self, project_id: str, websocket: WebSocket) -> Connection:
+        connection = Connection(websocket, project_id=project_id)
+        connection.start()
+        self.channel(project_id).connections.add(connection)
+        return connection
+
+    def unsubscribe(self, project_id: str, connection: Connection):
+        connection.close()
+        channel = self.channels.get(project_id)
+        if channel is not None:
+            channel.connections.discard(connection)
+
+    def discard(self, project_id: str):
+        """Forget a project's channel once nobody is watching it and no run holds it."""
+        channel = self.channels.get(project_id)
+        if channel is not None and not channel.connections:
+            del self.channels[project_id]
+
+    def viewer_count(self, project_id: str) -> int:
+        channel = self.channels.get(project_id)
+        return len(channel.connections) if channel else 0
+
+    def publish(self, project_id: str, message: dict):
+        channel = self.channels.get(project_id)
+        if channel:
+            channel.deliver(message)
+        self.forward(project_id, message)
+
+
+event_bus = EventBus()
@@ -0,0 +1,125 @@
+"""
+Applies edit_file calls: one search/replace pair or the hunks of a unified
+diff, against the current content of a file.
+
+An edit that does not apply cleanly is never guessed at. EditConflict says
+what did not match, and the model either retries with exact text or rewrites
+the file with create_file.
+"""
+import re
+from typing import List, Optional, Tuple
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+# How far from its stated line a hunk may match when its lines occur more than once
+FUZZ_LINES = 3
+
+
+class EditConflict(Exception):
+    pass
+
+
+def _find_all(content: str, search: str) -> List[int]:
+    positions = []
+    start = content.find(search)
+    while start != -1:
+        positions.append(start)
+        start = content.find(search, start + 1)
+    return positions
+
+
+def replace_once(content: str, search: str, replace: str) -> str:
+    """Replace the single occurrence of `search`."""
+    if not search:
+        raise EditConflict('search text is empty')
+    positions = _find_all(content, search)
+    if not positions:
+        # Models often get trailing whitespace wrong; match line by line without it
+        content_lines = content.split('\n')
+        search_lines = [line.rstrip() for line in search.strip('\n').split('\n')]
+        stripped = [line.rstrip() for line in content_lines]
+        matches = [
+            index
+            for index in range(len(stripped) - len(search_lines) + 1)
+            if stripped[index:index + len(search_lines)] == search_lines
+        ]
+        if len(matches) == 1:
+            index = matches[0]
+            replaced = replace.strip('\n').split('\n') if replace.strip('\n') else []
+            return '\n'.join(content_lines[:index] + replaced + content_lines[index + len(search_lines):])
+        if not matches:
+            raise EditConflict('search text not found in the file')
+        positions = matches
+    if len(positions) > 1:
+        raise EditConflict(f'search text occurs {len(positions)} times; include more surrounding lines')
+    start = positions[0]
+    return content[:start] + replace + content[start + len(search):]
+
+
+def parse_hunks(diff: str) -> List[Tuple[int, List[str], List[str]]]:
+    """(old start line, old lines, new lines) for every hunk of a unified diff."""
+    hunks = []
+    current: Optional[Tuple[int, List[str], List[str]]] = None
+    for line in diff.splitlines():
+        header = HUNK_HEADER.match(line)
+        if header:
+            current = (int(header.group(1)), [], [])
+            hunks.append(current)
+            continue
+        if current is None or line.startswith(('---', '+++', '\\')):
+            continue
+        marker, text = (line[0], line[1:]) if line else (' ', '')
+        if marker in (' ', '-'):
+            current[1].append(text)
+        if marker in (' ', '+'):
+            current[2].append(text)
+    if not hunks:
+        raise EditConflict('diff has no @@ hunks')
+    return hunks
+
+
+def apply_diff(content: str, diff: str) -> str:
+    lines = content.split('\n')
+    original_count = len(lines) - 1 if lines[-1] == '' else len(lines)
+    # Line numbers in later hunks refer to the original file; track how far earlier hunks moved them
+    offset = 0
+    for number, (old_start, old_lines, new_lines) in enumerate(parse_hunks(diff), start=1):
+        if not old_lines:
+            # A pure insertion (`@@ -5,0 +6,2 @@`) names the line to insert after, but has no lines to check
+            # that against; only the start and end of the file are certain without context
+            if old_start not in (0, original_count):
+                raise EditConflict(
+                    f'hunk {number} (line {old_start}) inserts lines without context; '
+                    'include a few unchanged lines around the insertion'
+                )
+            at = old_start + offset
+            lines[at:at] = new_lines
+            offset += len(new_lines)
+            continue
+        expected = max(old_start - 1 + offset, 0)
+        candidates = [
+            index
+            for index in range(len(lines) - len(old_lines) + 1)
+            if [line.rstrip() for line in lines[index:index + len(old_lines)]] == [line.rstrip() for line in old_lines]
+        ]
+        if not candidates:
+            raise EditConflict(f'hunk {number} (line {old_start}) does not match the current file')
+        if len(candidates) > 1:
+            # Lines like `}` or `</div>` repeat; only a match right around the stated line is the intended one
+            nearby = [candidate for candidate in candidates if abs(candidate - expected) <= FUZZ_LINES]
+            if len(nearby) != 1:
+                raise EditConflict(
+                    f'hunk {number} (line {old_start}) matches {len(candidates)} places in the file; '
+                    'include more surrounding lines'
+                )
+            candidates = nearby
+        index = candidates[0]
+        lines[index:index + len(old_lines)] = new_lines
+        offset += index - expected + len(new_lines) - len(old_lines)
+    return '\n'.join(lines)
+
+
+def apply_edit(content: str, search: str = '', replace: str = '', diff: str = '') -> str:
+    """New content of a file after an edit_file call, or EditConflict."""
+    if diff:
+        return apply_diff(content, diff)
+    return replace_once(content, search, replace)
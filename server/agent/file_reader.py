@@ -0,0 +1,218 @@
+"""
+Server-side read path for the read_file and read_files tools.
+
+Reads are answered from content already in the process: the agent's own
+writes and the files earlier snapshots pulled out of the sandbox. Only files
+the server has never seen are fetched with `sandbox.files.read`.
+
+What the server holds can go stale in two ways. create_file replaces a path
+and updates the view directly. A command such as npm install or a code
+generator can change any file, so afterwards the view is marked unsynced; the
+next read re-lists the tree once and re-hashes only the files whose mtime or
+size moved, the same way snapshots do. Writes record the mtime and size the
+sandbox gave the file, so the server's own files are never re-hashed.
+Commands that only look at the tree (cat, ls, grep, ...) leave the view alone.
+"""
+import asyncio
+import re
+import shlex
+from typing import Dict, List, Optional
+from e2b_code_interpreter import AsyncSandbox
+from agent.sandbox_pool import APP_DIR
+from agent.snapshot import IGNORED_DIRS, _hash_files, _list_files, _run, content_hash, load_manifest, open_sandbox_cache
+from utils.persistent_store import open_file_store
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Longest answer for one read_file call; larger files have to be read in ranges
+MAX_READ_CHARS = 60000
+
+READ_ONLY_PROGRAMS = {
+    'cat', 'head', 'tail', 'less', 'ls', 'tree', 'find', 'grep', 'rg', 'wc', 'pwd', 'echo', 'stat',
+    'file', 'du', 'df', 'which', 'whoami', 'printenv', 'diff', 'true', 'sleep',
+}
+# Options that make an otherwise read-only program write files or run other programs
+WRITING_OPTIONS = {
+    'find': ('-delete', '-exec', '-execdir', '-ok', '-okdir', '-fprint', '-fprint0', '-fprintf', '-fls'),
+    'tree': ('-o',),
+    'rg': ('--pre',),
+    'file': ('-C', '--compile'),
+    'git': ('--output',),
+}
+COMMAND_SEPARATOR = re.compile(r'&&|\|\||[;|&\n]')
+
+
+def is_read_only_command(command: str) -> bool:
+    """Whether every part of a shell command only inspects the tree."""
+    if '>' in command or '`' in command or '$(' in command:
+        return False
+    for part in COMMAND_SEPARATOR.split(command):
+        words = part.split()
+        if not words:
+            continue
+        program = words[0]
+        if any(word == option or word.startswith(f'{option}=') for word in words for option in WRITING_OPTIONS.get(program, ())):
+            return False
+        if program in ('node', 'npm', 'npx', 'git') and len(words) > 1:
+            # Version checks and read-only git subcommands
+            if words[1] in ('-v', '--version') or (program == 'git' and words[1] in ('status', 'diff', 'log', 'show')):
+                continue
+            return False
+        if program not in READ_ONLY_PROGRAMS:
+            return False
+    return True
+
+
+def select_lines(content: str, start_line: Optional[int] = None, end_line: Optional[int] = None) -> str:
+    """Lines start_line..end_line (1-based, inclusive) with a header saying which part of the file this is."""
+    if start_line is None and end_line is None:
+        if len(content) > MAX_READ_CHARS:
+            total = content.count('\n') + 1
+            return (
+                content[:MAX_READ_CHARS]
+                + f'\n... [truncated at {MAX_READ_CHARS} of {len(content)} chars, {total} lines;'
+                ' read the rest with start_line/end_line]'
+            )
+        return content
+    lines = content.splitlines(keepends=True)
+    start = max(start_line or 1, 1)
+    end = min(end_line or len(lines), len(lines))
+    if start > end:
+        return f'[lines {start}-{end_line} are past the end of the file ({len(lines)} lines)]'
+    return f'[lines {start}-{end} of {len(lines)}]\n' + ''.join(lines[start - 1:end])
+
+
+async def _stat_files(sandbox: AsyncSandbox, paths: List[str]) -> Dict[str, dict]:
+    """mtime and size of `paths`, in the same format as the tree listing."""
+    command = (
+        f'cd {APP_DIR} && find '
+        + ' '.join(shlex.quote(f'./{path}') for path in paths)
+        + " -maxdepth 0 -type f -printf '%p\\t%T@\\t%s\\n'"
+    )
+    stats = {}
+    for line in (await _run(sandbox, command)).splitlines():
+        parts = line.split('\t')
+        if len(parts) == 3:
+            stats[parts[0][len('./'):]] = {'mtime': parts[1], 'size': int(parts[2])}
+    return stats
+
+
+class SandboxView:
+    """What the server knows about one sandbox's tree: path -> mtime, size and content hash."""
+
+    def __init__(self, stamps: Dict[str, dict]):
+        self.stamps = stamps
+        self.synced = False
+        self.lock = asyncio.Lock()
+
+
+class FileReader:
+    def __init__(self):
+        self._views: Dict[str, SandboxView] = {}
+        self.served_from_memory = 0
+        self.served_from_sandbox = 0
+        self.syncs = 0
+
+    def _view(self, project_id: str, sandbox: AsyncSandbox) -> SandboxView:
+        view = self._views.get(sandbox.sandbox_id)
+        if view is None:
+            # The last snapshot's manifest; a rehydrated sandbox has new mtimes and is simply re-hashed
+            view = self._views[sandbox.sandbox_id] = SandboxView(dict(load_manifest(project_id)))
+        return view
+
+    async def wrote(self, sandbox: AsyncSandbox, files: Dict[str, str]):
+        """
+        create_file or edit_file put these contents in the sandbox. Their mtime
+        and size are read back in one command, before anything else can run,
+        so the next sync knows the files are unchanged.
+        """
+        view = self._views.get(sandbox.sandbox_id)
+        if view is None or not files:
+            return
+        try:
+            stats = await _stat_files(sandbox, list(files))
+        except Exception as e:
+            logger.debug(f'Could not stat written files: {e}')
+            stats = {}
+        for file_path, content in files.items():
+            # Without a stat the next sync re-hashes the file and finds it unchanged
+            stat = stats.get(file_path, {'mtime': None, 'size': None})
+            view.stamps[file_path] = {**stat, 'hash': content_hash(content)}
+
+    def command_ran(self, sandbox: AsyncSandbox, command: str):
+        """A command ran in the sandbox; unless it only looked, any file may have changed."""
+        view = self._views.get(sandbox.sandbox_id)
+        if view is not None and not is_read_only_command(command):
+            view.synced = False
+
+    def forget(self, sandbox_id: str):
+        self._views.pop(sandbox_id, None)
+
+    async def _sync(self, view: SandboxView, sandbox: AsyncSandbox):
+        listing = await _list_files(sandbox)
+        changed = [
+            path
+            for path, stat in listing.items()
+            if path not in view.stamps
+            or view.stamps[path]['mtime'] != stat['mtime']
+            or view.stamps[path]['size'] != stat['size']
+        ]
+        hashes = await _hash_files(sandbox, changed) if changed else {}
+        view.stamps = {
+            path: {**stat, 'hash': hashes.get(path) or view.stamps[path]['hash']}
+            for path, stat in listing.items()
+            if hashes.get(path) or path in view.stamps
+        }
+        view.synced = True
+        self.syncs += 1
+
+    async def read(self, project_id: str, sandbox: AsyncSandbox, file_path: str) -> Optional[str]:
+        """Current content of `file_path` in the sandbox, or None if there is no such file."""
+        file_path = file_path.strip()
+        for prefix in (f'{APP_DIR}/', './'):
+            if file_path.startswith(prefix):
+                file_path = file_path[len(prefix):]
+        if file_path.split('/', 1)[0] in IGNORED_DIRS:
+            # Never listed or cached; dependencies and build output are read straight from the sandbox
+            return await self._read_from_sandbox(project_id, sandbox, file_path, cache=False)
+
+        view = self._view(project_id, sandbox)
+        async with view.lock:
+            if not view.synced:
+                await self._sync(view, sandbox)
+        stamp = view.stamps.get(file_path)
+        if stamp is None:
+            return None
+
+        for store in (open_file_store(project_id), open_sandbox_cache(project_id)):
+            entry = store.get(file_path)
+            if entry is not None and content_hash(entry['content']) == stamp['hash']:
+                self.served_from_memory += 1
+                return entry['content']
+        return await self._read_from_sandbox(project_id, sandbox, file_path, cache=True)
+
+    async def _read_from_sandbox(
+        self, project_id: str, sandbox: AsyncSandbox, file_path: str, cache: bool
+    ) -> Optional[str]:
+        try:
+            content = await sandbox.files.read(f'{APP_DIR}/{file_path}')
+        except Exception as e:
+            logger.debug(f'Could not read {file_path} from sandbox: {e}')
+            return None
+        self.served_from_sandbox += 1
+        if cache:
+            open_sandbox_cache(project_id).put(file_path, content)
+        return content
+
+    async def read_many(self, project_id: str, sandbox: AsyncSandbox, file_paths: List[str]) -> Dict[str, Optional[str]]:
+        contents = await asyncio.gather(*(self.read(project_id, sandbox, path) for path in file_paths))
+        return dict(zip(file_paths, contents))
+
+    def stats(self) -> dict:
+        return {
+            'sandboxes': len(self._views),
+            'served_from_memory': self.served_from_memory,
+            'served_from_sandbox': self.served_from_sandbox,
+            'syncs': self.syncs,
+        }
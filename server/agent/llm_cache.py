@@ -0,0 +1,116 @@
+"""
+Response cache for LLM calls.
+
+A response is stored under a hash of everything that went into the request:
+the system prompt and conversation as sent (after compaction), normalized so
+random tool call ids and whitespace do not matter, plus the bound tool schema.
+Replays get fresh message and tool call ids so they can sit next to the
+original in one conversation.
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Sequence
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv('LLM_CACHE', '0') == '1'
+CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '512'))
+CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', '86400'))
+
+
+def tool_schema(tools: Sequence) -> str:
+    return json.dumps([convert_to_openai_tool(tool) for tool in tools], sort_keys=True)
+
+
+def _normalize(message: BaseMessage) -> dict:
+    content = message.content
+    normalized = {
+        'type': message.type,
+        'content': content.strip() if isinstance(content, str) else content,
+    }
+    if isinstance(message, AIMessage) and message.tool_calls:
+        normalized['tool_calls'] = [{'name': call['name'], 'args': call['args']} for call in message.tool_calls]
+    if isinstance(message, ToolMessage):
+        normalized['status'] = message.status
+    return normalized
+
+
+def cache_key(messages: Sequence[BaseMessage], schema: str) -> str:
+    payload = json.dumps(
+        {'messages': [_normalize(message) for message in messages], 'tools': schema}, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _replay(message: AIMessage) -> AIMessage:
+    return message.model_copy(
+        update={
+            'id': None,
+            'tool_calls': [{**call, 'id': f'cached-{uuid.uuid4().hex}'} for call in message.tool_calls],
+        },
+        deep=True,
+    )
+
+
+class LLMResponseCache:
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL, enabled: bool = CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, message = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return _replay(message)
+
+    def put(self, key: str, message: AIMessage):
+        # Truncated or blocked responses are not worth replaying
+        if not message.content and not message.tool_calls:
+            return
+        self._entries[key] = (time.monotonic(), message)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evicted': self.evicted,
+            'expired': self.expired,
+        }
+
+
+llm_cache = LLMResponseCache()
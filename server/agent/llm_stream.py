@@ -0,0 +1,215 @@
+"""
+Following a model response while it streams.
+
+StreamedTurn turns the AIMessageChunks of one LLM call into text deltas and
+create_file milestones: the path as soon as it has been parsed, and the
+whole call once the next call starts and its arguments can no longer change.
+
+EarlyWrites lets complete create_file calls hit the sandbox while the model
+is still generating the rest of the turn. The regular tool path later claims
+them instead of writing again. Only writes that come before any other kind
+of call in the turn are started early, so nothing overtakes a command the
+model meant to run first. Early writes count against the same sandbox
+limits as the regular tool path, and the ones no tool call claimed (the LLM
+call failed after streaming them, or the run was cancelled) are rolled back
+to what the project's file store holds.
+"""
+import asyncio
+import json
+import os
+import re
+import uuid
+from typing import Dict, List, Optional, Tuple
+from langchain_core.messages import AIMessageChunk
+from e2b_code_interpreter import AsyncSandbox
+from agent.run_scheduler import Limiter, sandbox_limiter as default_sandbox_limiter
+from agent.sandbox_pool import APP_DIR
+from utils.persistent_store import FileStore
+import logging
+
+logger = logging.getLogger(__name__)
+
+EARLY_WRITES_ENABLED = os.getenv('EARLY_FILE_WRITES', '1') == '1'
+
+FILE_PATH_ARG = re.compile(r'"file_path"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def chunk_text(content) -> str:
+    """Text of a chunk's content, which some providers send as a list of parts."""
+    if isinstance(content, str):
+        return content
+    return ''.join(part.get('text', '') if isinstance(part, dict) else str(part) for part in content)
+
+
+class StreamedCall:
+    def __init__(self, index: int):
+        self.index = index
+        self.name: Optional[str] = None
+        self.id: Optional[str] = None
+        self.args = ''
+        self.file_path: Optional[str] = None
+
+
+class StreamedTurn:
+    """One LLM call, chunk by chunk."""
+
+    def __init__(self):
+        # Sent with the turn's thinking events, so viewers give every turn its own bubble
+        self.id = uuid.uuid4().hex[:12]
+        self.calls: Dict[int, StreamedCall] = {}
+        self.current: Optional[StreamedCall] = None
+        # True while every tool call so far is a create_file
+        self.only_writes = True
+
+    def feed(self, chunk: AIMessageChunk) -> List[Tuple[str, object]]:
+        """
+        Events for one chunk: ('text', str), ('file_path', StreamedCall) and
+        ('write_ready', StreamedCall, args) for a finished create_file that
+        only other create_file calls come before.
+        """
+        events: List[Tuple[str, object]] = []
+        text = chunk_text(chunk.content)
+        if text:
+            events.append(('text', text))
+
+        for piece in chunk.tool_call_chunks:
+            index = piece.get('index')
+            if index is None:
+                # Providers without indices send each call whole or start it with its name
+                index = len(self.calls) if piece.get('name') or self.current is None else self.current.index
+            call = self.calls.get(index)
+            if call is None:
+                if self.current is not None:
+                    events.extend(self._complete(self.current))
+                call = self.calls[index] = self.current = StreamedCall(index)
+            call.name = call.name or piece.get('name')
+            call.id = call.id or piece.get('id')
+            call.args += piece.get('args') or ''
+            if call.name != 'create_file':
+                self.only_writes = False
+            elif call.file_path is None:
+                match = FILE_PATH_ARG.search(call.args)
+                if match:
+                    call.file_path = json.loads(f'"{match.group(1)}"')
+                    events.append(('file_path', call))
+        return events
+
+    def _complete(self, call: StreamedCall) -> List[Tuple[str, object]]:
+        if call.name != 'create_file' or not self.only_writes:
+            return []
+        try:
+            args = json.loads(call.args) if call.args else {}
+        except json.JSONDecodeError:
+            return []
+        return [('write_ready', call, args)]
+
+
+class EarlyWrites:
+    """create_file writes started during streaming, by sandbox and path, until the tool path claims them."""
+
+    def __init__(self, enabled: bool = EARLY_WRITES_ENABLED, max_concurrency: int = 8, limiter: Optional[Limiter] = None):
+        self.enabled = enabled
+        self.max_concurrency = max_concurrency
+        self.limiter = limiter if limiter is not None else default_sandbox_limiter
+        self._pending: Dict[Tuple[str, str], Tuple[str, asyncio.Task]] = {}
+        self._announced: set = set()
+        # Per sandbox, like the tool path's bound on concurrent writes within a turn
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self.started = 0
+        self.claimed = 0
+        self.rolled_back = 0
+
+    def announce(self, sandbox: AsyncSandbox, file_path: str) -> bool:
+        """Record that the client was told about this file; False if it already was."""
+        key = (sandbox.sandbox_id, file_path)
+        if key in self._announced:
+            return False
+        self._announced.add(key)
+        return True
+
+    def was_announced(self, sandbox: AsyncSandbox, file_path: str) -> bool:
+        key = (sandbox.sandbox_id, file_path)
+        if key in self._announced:
+            self._announced.discard(key)
+            return True
+        return False
+
+    def start(self, sandbox: AsyncSandbox, file_path: str, content: str):
+        key = (sandbox.sandbox_id, file_path)
+        if not self.enabled or key in self._pending:
+            # A second write of the same path in one turn is left to the regular path, in order
+            return
+        task = asyncio.create_task(self._write(sandbox, file_path, content))
+        self._pending[key] = (content, task)
+        self.started += 1
+
+    async def _write(self, sandbox: AsyncSandbox, file_path: str, content: str):
+        slots = self._slots.setdefault(sandbox.sandbox_id, asyncio.Semaphore(self.max_concurrency))
+        async with slots, self.limiter.slot():
+            await sandbox.files.write(f'{APP_DIR}/{file_path}', content)
+
+    async def claim(self, sandbox: AsyncSandbox, file_path: str, content: str) -> bool:
+        """True when an early write already put exactly `content` at `file_path`."""
+        entry = self._pending.pop((sandbox.sandbox_id, file_path), None)
+        if entry is None:
+            return False
+        early_content, task = entry
+        try:
+            # Even when the content differs, the early write has to land before the real one
+            await task
+        except Exception as e:
+            logger.warning(f'Early write of {file_path} failed, writing again: {e}')
+            return False
+        if early_content != content:
+            return False
+        self.claimed += 1
+        return True
+
+    async def settle(self, sandbox: AsyncSandbox, file_store: FileStore):
+        """
+        End of a run: put every path an unclaimed early write may have touched
+        back to its content in the file store, and remove the ones the store
+        does not have, so the sandbox and the persisted project agree.
+        """
+        unclaimed = [
+            (key[1], task) for key, (_, task) in list(self._pending.items()) if key[0] == sandbox.sandbox_id
+        ]
+        for key in [key for key in self._pending if key[0] == sandbox.sandbox_id]:
+            del self._pending[key]
+        self._announced = {key for key in self._announced if key[0] != sandbox.sandbox_id}
+        self._slots.pop(sandbox.sandbox_id, None)
+        if not unclaimed:
+            return
+
+        for _, task in unclaimed:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in unclaimed), return_exceptions=True)
+        restore, remove = {}, []
+        for file_path, _ in unclaimed:
+            entry = file_store.get(file_path)
+            if entry is not None:
+                restore[file_path] = entry['content']
+            else:
+                remove.append(file_path)
+        try:
+            async with self.limiter.slot():
+                if restore:
+                    await sandbox.files.write_files(
+                        [{'path': f'{APP_DIR}/{file_path}', 'data': content} for file_path, content in restore.items()]
+                    )
+                for file_path in remove:
+                    await sandbox.files.remove(f'{APP_DIR}/{file_path}')
+        except Exception as e:
+            logger.warning(f'Could not roll back {len(unclaimed)} unclaimed early writes: {e}')
+            return
+        self.rolled_back += len(unclaimed)
+        logger.info(f'Rolled back {len(unclaimed)} early writes no tool call claimed')
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'started': self.started,
+            'claimed': self.claimed,
+            'rolled_back': self.rolled_back,
+            'pending': len(self._pending),
+        }
@@ -0,0 +1,205 @@
+"""
+Admission control for agent runs.
+
+At most `max_running` runs execute at once. Further runs wait in a bounded
+queue that hands out free slots round-robin across tenants, so one tenant
+submitting many projects cannot starve the others. Once the queue (or a
+tenant's share of it) is full, new runs are shed with QueueFull, which
+carries a retry-after estimate.
+
+Inside a run, LLM calls and sandbox operations each go through their own
+Limiter, so a burst of runs cannot fan out unbounded into the LLM quota or
+into E2B.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, List, Optional, Set
+from utils.tracing import span
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_RUNS = int(os.getenv('MAX_CONCURRENT_RUNS', '32'))
+RUN_QUEUE_SIZE = int(os.getenv('RUN_QUEUE_SIZE', '200'))
+# Queued runs a single tenant may hold, so one tenant cannot fill the whole queue
+RUN_QUEUE_PER_TENANT = int(os.getenv('RUN_QUEUE_PER_TENANT', '20'))
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '16'))
+SANDBOX_CONCURRENCY = int(os.getenv('SANDBOX_CONCURRENCY', '32'))
+# Assumed run duration until real runs have been timed
+INITIAL_RUN_SECONDS = 60.0
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One run's place in the scheduler, from submission until release."""
+
+    def __init__(self, run_id: str, project_id: str, tenant: str):
+        self.run_id = run_id
+        self.project_id = project_id
+        self.tenant = tenant
+        self.position: Optional[int] = None
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.admitted = asyncio.Event()
+
+
+class RunScheduler:
+    def __init__(
+        self,
+        max_running: int = MAX_CONCURRENT_RUNS,
+        max_queued: int = RUN_QUEUE_SIZE,
+        max_queued_per_tenant: int = RUN_QUEUE_PER_TENANT,
+    ):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.max_queued_per_tenant = max_queued_per_tenant
+        self.running: Set[Ticket] = set()
+        self._queues: Dict[str, Deque[Ticket]] = {}
+        # Tenants with queued runs, in the order they get their next slot
+        self._turns: Deque[str] = deque()
+        # Called for every queued ticket whose position changed
+        self.on_position: Optional[Callable[[Ticket], None]] = None
+        self._average_run = INITIAL_RUN_SECONDS
+        self.admitted_total = 0
+        self.shed_total = 0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, run_id: str, project_id: str, tenant: str) -> Ticket:
+        """Admit the run or queue it; raises QueueFull when it has to be shed."""
+        ticket = Ticket(run_id, project_id, tenant)
+        if len(self.running) < self.max_running and not self._turns:
+            self._admit(ticket)
+            return ticket
+
+        if self.queued >= self.max_queued:
+            reason = 'Server is at capacity'
+        elif len(self._queues.get(tenant, ())) >= self.max_queued_per_tenant:
+            reason = 'Too many queued runs for this tenant'
+        else:
+            queue = self._queues.get(tenant)
+            if queue is None:
+                queue = self._queues[tenant] = deque()
+                self._turns.append(tenant)
+            queue.append(ticket)
+            self._notify_positions()
+            return ticket
+
+        self.shed_total += 1
+        logger.warning(f'Shedding run {run_id} of project {project_id}: {reason}')
+        raise QueueFull(self.retry_after(), reason)
+
+    def release(self, ticket: Ticket):
+        """The run finished, failed or was cancelled; free its slot or its place in the queue."""
+        if ticket in self.running:
+            self.running.discard(ticket)
+            duration = time.monotonic() - ticket.started_at  # type: ignore
+            self._average_run = 0.8 * self._average_run + 0.2 * duration
+        else:
+            queue = self._queues.get(ticket.tenant)
+            if queue is None or ticket not in queue:
+                return
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.tenant]
+                self._turns.remove(ticket.tenant)
+        self._dispatch()
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up for a run submitted now."""
+        waves = (self.queued + 1) / max(self.max_running, 1)
+        return max(1, round(waves * self._average_run))
+
+    def _admit(self, ticket: Ticket):
+        ticket.position = None
+        ticket.started_at = time.monotonic()
+        self.running.add(ticket)
+        self.admitted_total += 1
+        ticket.admitted.set()
+
+    def _dispatch(self):
+        while len(self.running) < self.max_running and self._turns:
+            tenant = self._turns.popleft()
+            queue = self._queues[tenant]
+            self._admit(queue.popleft())
+            if queue:
+                self._turns.append(tenant)
+            else:
+                del self._queues[tenant]
+        self._notify_positions()
+
+    def order(self) -> List[Ticket]:
+        """Queued tickets in the order they will be admitted."""
+        tenants = [self._queues[tenant] for tenant in self._turns]
+        ordered = []
+        for depth in range(max((len(queue) for queue in tenants), default=0)):
+            ordered.extend(queue[depth] for queue in tenants if depth < len(queue))
+        return ordered
+
+    def _notify_positions(self):
+        for position, ticket in enumerate(self.order(), start=1):
+            if ticket.position != position:
+                ticket.position = position
+                if self.on_position is not None:
+                    self.on_position(ticket)
+
+    def stats(self) -> dict:
+        return {
+            'running': len(self.running),
+            'max_running': self.max_running,
+            'queued': self.queued,
+            'max_queued': self.max_queued,
+            'queued_by_tenant': {tenant: len(queue) for tenant, queue in self._queues.items()},
+            'admitted': self.admitted_total,
+            'shed': self.shed_total,
+            'average_run_seconds': round(self._average_run, 2),
+            'llm': llm_limiter.stats(),
+            'sandbox': sandbox_limiter.stats(),
+        }
+
+
+class Limiter:
+    """Concurrency cap on one kind of outbound call; time spent waiting shows up as a `<name>.wait` span."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked():
+            self.waiting += 1
+            try:
+                with span(f'{self.name}.wait'):
+                    await self._semaphore.acquire()
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {'limit': self.limit, 'active': self.active, 'waiting': self.waiting}
+
+
+scheduler = RunScheduler()
+llm_limiter = Limiter('llm', LLM_CONCURRENCY)
+sandbox_limiter = Limiter('sandbox', SANDBOX_CONCURRENCY)
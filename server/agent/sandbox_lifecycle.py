@@ -0,0 +1,299 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional
+from e2b_code_interpreter import AsyncSandbox
+from agent.sandbox_pool import APP_DIR, SANDBOX_TIMEOUT, SandboxConnector, SandboxPool, _percentile
+from agent.dependency_cache import DependencyCache, dependency_cache as default_dependency_cache
+from agent.dependency_cache import dependency_key, sandbox_dependency_key
+from agent.run_scheduler import Limiter, sandbox_limiter as default_sandbox_limiter
+from agent.snapshot import known_files
+from utils.persistent_store import close_file_store
+from utils.tracing import span
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LiveSandbox:
+    sandbox: AsyncSandbox
+    last_used: float = field(default_factory=time.monotonic)
+    pins: int = 0
+
+
+class SandboxLifecycle:
+    """
+    Owns the live sandbox of every project on this worker.
+
+    When the last viewer leaves, a sandbox is kept for `grace_period` seconds
+    so a browser refresh finds it still running. After that, or when it has
+    been idle longer than `idle_ttl`, or when `max_live` is reached and it is
+    the least recently used one, it is hibernated (paused, resumable by id) or,
+    if pausing is off or fails, killed after its node_modules were cached.
+
+    A project without a live sandbox is resumed from its paused sandbox when
+    possible, otherwise rehydrated into a fresh pool sandbox from the persisted
+    file store plus the cached node_modules layer.
+    """
+
+    def __init__(
+        self,
+        pool: SandboxPool,
+        registry,
+        connect: SandboxConnector,
+        dependency_cache: Optional[DependencyCache] = None,
+        max_live: int = 20,
+        idle_ttl: float = 480,
+        grace_period: float = 60,
+        hibernate: bool = True,
+        sweep_interval: float = 30,
+        limiter: Optional[Limiter] = None,
+    ):
+        self.pool = pool
+        self.registry = registry
+        self.connect = connect
+        self.dependency_cache = dependency_cache if dependency_cache is not None else default_dependency_cache
+        self.max_live = max_live
+        self.idle_ttl = idle_ttl
+        self.grace_period = grace_period
+        self.hibernate = hibernate
+        self.sweep_interval = sweep_interval
+        # Resuming or rehydrating a sandbox counts against the worker's sandbox concurrency
+        self.limiter = limiter if limiter is not None else default_sandbox_limiter
+
+        self.live: 'OrderedDict[str, LiveSandbox]' = OrderedDict()
+        # One bring-up per project at a time, so concurrent acquires share a sandbox instead of each making one
+        self._acquire_locks: Dict[str, asyncio.Lock] = {}
+        self._teardowns: Dict[str, asyncio.Task] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        # Called with the sandbox id whenever a sandbox stops being live here
+        self.on_teardown: List[Callable[[str], None]] = []
+
+        self.created = 0
+        self.resumed = 0
+        self.rehydrated = 0
+        self.hibernated = 0
+        self.killed = 0
+        self.evicted = 0
+        self._rehydrate_latencies: Deque[float] = deque(maxlen=1000)
+
+    @classmethod
+    def from_env(
+        cls, pool: SandboxPool, registry, connect: SandboxConnector, dependency_cache: Optional[DependencyCache] = None
+    ) -> 'SandboxLifecycle':
+        return cls(
+            pool,
+            registry,
+            connect,
+            dependency_cache,
+            max_live=int(os.getenv('MAX_LIVE_SANDBOXES', '20')),
+            idle_ttl=float(os.getenv('SANDBOX_IDLE_TTL', '480')),
+            grace_period=float(os.getenv('SANDBOX_GRACE_PERIOD', '60')),
+            hibernate=os.getenv('SANDBOX_HIBERNATE', '1') == '1',
+        )
+
+    @property
+    def sandboxes(self) -> Dict[str, AsyncSandbox]:
+        return {project_id: entry.sandbox for project_id, entry in self.live.items()}
+
+    def start(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        """Tear down every live sandbox, e.g. on server shutdown."""
+        if self._sweeper:
+            self._sweeper.cancel()
+        for task in self._teardowns.values():
+            task.cancel()
+        self._teardowns.clear()
+        for project_id in list(self.live):
+            await self._teardown(project_id, 'shutdown')
+
+    async def acquire(self, project_id: str) -> AsyncSandbox:
+        self._cancel_teardown(project_id)
+        sandbox = self._live_sandbox(project_id)
+        if sandbox is not None:
+            return sandbox
+
+        async with self._acquire_locks.setdefault(project_id, asyncio.Lock()):
+            # Another acquire may have brought it up while this one waited
+            sandbox = self._live_sandbox(project_id)
+            if sandbox is not None:
+                return sandbox
+            async with self.limiter.slot():
+                return await self._bring_up(project_id)
+
+    def _live_sandbox(self, project_id: str) -> Optional[AsyncSandbox]:
+        entry = self.live.get(project_id)
+        if entry is None:
+            return None
+        entry.last_used = time.monotonic()
+        self.live.move_to_end(project_id)
+        return entry.sandbox
+
+    async def _bring_up(self, project_id: str) -> AsyncSandbox:
+        with span('sandbox.acquire') as attrs:
+            await self._make_room()
+            sandbox = await self._resume(project_id)
+            attrs['source'] = 'resumed'
+            if sandbox is None:
+                sandbox = await self._rehydrate(project_id)
+                attrs['source'] = 'pool'
+            attrs['sandbox_id'] = sandbox.sandbox_id
+        self.live[project_id] = LiveSandbox(sandbox)
+        await self.registry.set_sandbox_id(project_id, sandbox.sandbox_id)
+        return sandbox
+
+    @asynccontextmanager
+    async def in_use(self, project_id: str):
+        """Keep the project's sandbox from being evicted while a run needs it."""
+        sandbox = await self.acquire(project_id)
+        entry = self.live[project_id]
+        entry.pins += 1
+        try:
+            yield sandbox
+        finally:
+            entry.pins -= 1
+            entry.last_used = time.monotonic()
+
+    def release(self, project_id: str):
+        """Schedule teardown after the grace period; a new acquire in between keeps the sandbox."""
+        if project_id not in self.live or project_id in self._teardowns:
+            return
+        self._teardowns[project_id] = asyncio.create_task(self._teardown_later(project_id))
+
+    def keep(self, project_id: str):
+        """Someone is looking at the project again; call off a pending teardown."""
+        self._cancel_teardown(project_id)
+        entry = self.live.get(project_id)
+        if entry is not None:
+            entry.last_used = time.monotonic()
+
+    async def close(self, project_id: str):
+        """Tear the sandbox down right away."""
+        self._cancel_teardown(project_id)
+        if project_id in self.live:
+            await self._teardown(project_id, 'closed')
+
+    def stats(self) -> dict:
+        latencies = sorted(self._rehydrate_latencies)
+        return {
+            'live': len(self.live),
+            'max_live': self.max_live,
+            'pending_teardown': len(self._teardowns),
+            'created': self.created,
+            'resumed': self.resumed,
+            'rehydrated': self.rehydrated,
+            'hibernated': self.hibernated,
+            'killed': self.killed,
+            'evicted': self.evicted,
+            'rehydrate_latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+            'rehydrate_latency_p95': _percentile(latencies, 0.95),
+        }
+
+    def _cancel_teardown(self, project_id: str):
+        task = self._teardowns.pop(project_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _teardown_later(self, project_id: str):
+        await asyncio.sleep(self.grace_period)
+        self._teardowns.pop(project_id, None)
+        entry = self.live.get(project_id)
+        if entry is not None and entry.pins == 0:
+            await self._teardown(project_id, 'grace period over')
+
+    async def _make_room(self):
+        while len(self.live) >= self.max_live:
+            victim = next((project_id for project_id, entry in self.live.items() if entry.pins == 0), None)
+            if victim is None:
+                # Every live sandbox is busy; going over the cap beats failing the run
+                logger.warning(f'All {len(self.live)} live sandboxes are in use, exceeding cap of {self.max_live}')
+                return
+            self.evicted += 1
+            await self._teardown(victim, 'evicted (LRU)')
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            now = time.monotonic()
+            for project_id, entry in list(self.live.items()):
+                if entry.pins == 0 and now - entry.last_used > self.idle_ttl:
+                    self.evicted += 1
+                    try:
+                        await self._teardown(project_id, 'idle')
+                    except Exception as e:
+                        logger.warning(f'Failed to evict idle sandbox of {project_id}: {e}')
+
+    async def _teardown(self, project_id: str, reason: str):
+        entry = self.live.pop(project_id, None)
+        if entry is None:
+            return
+        sandbox = entry.sandbox
+        for callback in self.on_teardown:
+            callback(sandbox.sandbox_id)
+        # Nothing runs for the project anymore; the next run reloads its files from the log
+        close_file_store(project_id)
+
+        if self.hibernate:
+            try:
+                await sandbox.beta_pause()
+                self.hibernated += 1
+                logger.info(f'Hibernated sandbox of {project_id} ({reason})')
+                return
+            except Exception as e:
+                logger.warning(f'Could not pause sandbox of {project_id}, killing it: {e}')
+
+        try:
+            key = await sandbox_dependency_key(sandbox)
+            if key:
+                await self.dependency_cache.save_from_sandbox(sandbox, key)
+        except Exception as e:
+            logger.warning(f'Could not cache node_modules of {project_id}: {e}')
+        try:
+            await sandbox.kill()
+        finally:
+            self.killed += 1
+            await self.registry.clear_sandbox_id(project_id)
+            logger.info(f'Killed sandbox of {project_id} ({reason})')
+
+    async def _resume(self, project_id: str) -> Optional[AsyncSandbox]:
+        sandbox_id = await self.registry.get_sandbox_id(project_id)
+        if not sandbox_id:
+            return None
+        try:
+            sandbox = await self.connect(sandbox_id)
+            await sandbox.set_timeout(SANDBOX_TIMEOUT)
+            self.resumed += 1
+            logger.info(f'Resumed sandbox {sandbox_id} for project {project_id}')
+            return sandbox
+        except Exception as e:
+            logger.warning(f'Could not resume sandbox {sandbox_id} for {project_id}: {e}')
+            await self.registry.clear_sandbox_id(project_id)
+            return None
+
+    async def _rehydrate(self, project_id: str) -> AsyncSandbox:
+        sandbox = await self.pool.acquire()
+        started = time.monotonic()
+
+        files = known_files(project_id)
+        if not files:
+            self.created += 1
+            return sandbox
+
+        await sandbox.files.write_files(
+            [{'path': f'{APP_DIR}/{file_path}', 'data': content} for file_path, content in files.items()]
+        )
+        if 'package.json' in files:
+            key = dependency_key(files['package.json'], files.get('package-lock.json'))
+            await self.dependency_cache.restore_into(sandbox, key)
+
+        self.rehydrated += 1
+        self._rehydrate_latencies.append(time.monotonic() - started)
+        logger.info(f'Rehydrated {project_id} with {len(files)} files in {time.monotonic() - started:.2f}s')
+        return sandbox
@@ -0,0 +1,230 @@
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Optional
+from e2b_code_interpreter import AsyncSandbox
+import logging
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_TEMPLATE = 'temp-react'
+SANDBOX_TIMEOUT = 600
+APP_DIR = '/home/user/react-app'
+
+SandboxFactory = Callable[[], Awaitable[AsyncSandbox]]
+SandboxConnector = Callable[[str], Awaitable[AsyncSandbox]]
+
+
+async def create_react_sandbox() -> AsyncSandbox:
+    """Boot a fresh sandbox from the React template."""
+    return await AsyncSandbox.create(SANDBOX_TEMPLATE, timeout=SANDBOX_TIMEOUT)
+
+
+async def connect_sandbox(sandbox_id: str) -> AsyncSandbox:
+    """Attach to a sandbox another worker created."""
+    return await AsyncSandbox.connect(sandbox_id, timeout=SANDBOX_TIMEOUT)
+
+
+@dataclass
+class PooledSandbox:
+    sandbox: AsyncSandbox
+    created_at: float = field(default_factory=time.monotonic)
+    idle_since: float = field(default_factory=time.monotonic)
+
+
+class SandboxPool:
+    """
+    Keeps a number of pre-booted sandboxes ready so the first prompt of a
+    project does not wait for a cold start.
+
+    A background task refills the pool up to `target_size`, health-checks idle
+    sandboxes and evicts the ones that are too old or have sat idle too long.
+    `acquire` falls back to creating a sandbox inline when the pool is empty.
+    """
+
+    def __init__(
+        self,
+        factory: SandboxFactory = create_react_sandbox,
+        target_size: int = 2,
+        max_age: float = 480,
+        max_idle: float = 300,
+        refill_interval: float = 5,
+        health_check_timeout: float = 5,
+    ):
+        self.factory = factory
+        self.target_size = target_size
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.refill_interval = refill_interval
+        self.health_check_timeout = health_check_timeout
+
+        self._idle: Deque[PooledSandbox] = deque()
+        self._booting = 0
+        self._refill_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.create_failures = 0
+        self._acquire_latencies: Deque[float] = deque(maxlen=1000)
+
+    @classmethod
+    def from_env(cls, factory: SandboxFactory = create_react_sandbox) -> 'SandboxPool':
+        """Build a pool sized from SANDBOX_POOL_* environment variables."""
+        return cls(
+            factory=factory,
+            target_size=int(os.getenv('SANDBOX_POOL_SIZE', '2')),
+            max_age=float(os.getenv('SANDBOX_POOL_MAX_AGE', '480')),
+            max_idle=float(os.getenv('SANDBOX_POOL_MAX_IDLE', '300')),
+            refill_interval=float(os.getenv('SANDBOX_POOL_REFILL_INTERVAL', '5')),
+        )
+
+    @property
+    def size(self) -> int:
+        return len(self._idle)
+
+    def start(self):
+        """Start the background refill task. Safe to call more than once."""
+        if self.target_size <= 0:
+            return
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill_loop())
+
+    async def stop(self):
+        """Stop refilling and kill every idle sandbox."""
+        if self._refill_task:
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+            self._refill_task = None
+
+        while self._idle:
+            await self._kill(self._idle.popleft())
+
+    async def acquire(self) -> AsyncSandbox:
+        """
+        Take a warm sandbox from the pool, or create one inline if none is ready.
+        """
+        started = time.monotonic()
+        sandbox = None
+
+        while self._idle:
+            entry = self._idle.popleft()
+            if self._is_expired(entry) or not await self._is_healthy(entry):
+                await self._kill(entry)
+                continue
+            sandbox = entry.sandbox
+            break
+
+        if sandbox is not None:
+            self.hits += 1
+            try:
+                # Give the handed-out sandbox a full lifetime from now on
+                await sandbox.set_timeout(SANDBOX_TIMEOUT)
+            except Exception as e:
+                logger.warning(f'Could not extend sandbox timeout: {e}')
+        else:
+            self.misses += 1
+            sandbox = await self.factory()
+
+        self._acquire_latencies.append(time.monotonic() - started)
+        self._wakeup.set()
+        return sandbox
+
+    def stats(self) -> dict:
+        latencies = sorted(self._acquire_latencies)
+        acquired = self.hits + self.misses
+        return {
+            'target_size': self.target_size,
+            'idle': len(self._idle),
+            'booting': self._booting,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / acquired if acquired else 0.0,
+            'evicted': self.evicted,
+            'create_failures': self.create_failures,
+            'acquire_latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+            'acquire_latency_p50': _percentile(latencies, 0.5),
+            'acquire_latency_p95': _percentile(latencies, 0.95),
+            'acquire_latency_max': latencies[-1] if latencies else 0.0,
+        }
+
+    async def _refill_loop(self):
+        while True:
+            try:
+                await self._evict_stale()
+                await self._fill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f'Sandbox pool refill failed: {e}', exc_info=True)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fill(self):
+        missing = self.target_size - len(self._idle) - self._booting
+        if missing <= 0:
+            return
+        self._booting += missing
+        await asyncio.gather(*(self._boot_one() for _ in range(missing)))
+
+    async def _boot_one(self):
+        try:
+            sandbox = await self.factory()
+            self._idle.append(PooledSandbox(sandbox))
+            logger.info(f'Sandbox pool warmed: {len(self._idle)}/{self.target_size}')
+        except Exception as e:
+            self.create_failures += 1
+            logger.warning(f'Failed to pre-boot sandbox: {e}')
+        finally:
+            self._booting -= 1
+
+    async def _evict_stale(self):
+        """
+        Drop expired or unhealthy idle sandboxes. Entries stay in the pool while
+        their health check runs, so an acquire in the meantime still gets one.
+        """
+        async def usable(entry: PooledSandbox) -> bool:
+            return not self._is_expired(entry) and await self._is_healthy(entry)
+
+        entries = list(self._idle)
+        for entry, ok in zip(entries, await asyncio.gather(*(usable(entry) for entry in entries))):
+            if ok or entry not in self._idle:
+                # Healthy, or acquire() took it meanwhile and checks it itself
+                continue
+            self._idle.remove(entry)
+            await self._kill(entry)
+
+    def _is_expired(self, entry: PooledSandbox) -> bool:
+        now = time.monotonic()
+        return now - entry.created_at > self.max_age or now - entry.idle_since > self.max_idle
+
+    async def _is_healthy(self, entry: PooledSandbox) -> bool:
+        try:
+            return await entry.sandbox.is_running(request_timeout=self.health_check_timeout)
+        except Exception as e:
+            logger.warning(f'Sandbox health check failed: {e}')
+            return False
+
+    async def _kill(self, entry: PooledSandbox):
+        self.evicted += 1
+        try:
+            await entry.sandbox.kill()
+        except Exception as e:
+            logger.warning(f'Failed to kill evicted sandbox: {e}')
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
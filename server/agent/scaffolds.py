@@ -0,0 +1,243 @@
+"""
+Library of starter scaffolds learned from earlier projects.
+
+Almost every new project begins with the model writing the same Vite/React
+boilerplate (package.json, vite.config, index.html, src/main.jsx,
+src/index.css) before it gets to the actual app. The library keeps the
+boilerplate files of every finished project, content-hashed and
+deduplicated, as starter sets indexed by stack and features. A new
+project whose prompt asks for the same features gets the most common
+matching set written to its sandbox before the first LLM call, and the
+model is told the files are already there.
+
+A set is only used once at least `min_projects` projects ended up with
+exactly those files, so one project's odd setup is never handed to others.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+from utils.persistent_store import FileStore, PROJECT_DIR
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCAFFOLDS_ENABLED = os.getenv('SCAFFOLD_CACHE', '1') == '1'
+LIBRARY_PATH = os.getenv('SCAFFOLD_LIBRARY', 'data/scaffolds.json')
+SCAFFOLD_MIN_PROJECTS = int(os.getenv('SCAFFOLD_MIN_PROJECTS', '2'))
+
+# The stack of the sandbox template; scaffolds for anything else are never applied
+TEMPLATE_STACK = 'vite-react'
+
+# Files that are the same across apps; everything else (App.jsx, components, ...) is the app itself
+BOILERPLATE = re.compile(
+    r'^(package\.json|index\.html|vite\.config\.[cm]?[jt]s|tsconfig(\.\w+)?\.json|'
+    r'(postcss|tailwind)\.config\.[cm]?[jt]s|eslint\.config\.[cm]?js|'
+    r'src/(main\.[jt]sx|index\.css|vite-env\.d\.ts))$'
+)
+
+# feature: (dependencies that show it in package.json, words that ask for it in a prompt)
+FEATURES = {
+    'typescript': (('typescript',), re.compile(r'\btype\s?script\b|\btsx?\b', re.IGNORECASE)),
+    'tailwind': (('tailwindcss', '@tailwindcss/vite'), re.compile(r'\btailwind', re.IGNORECASE)),
+    'router': (
+        ('react-router-dom', 'react-router'),
+        re.compile(r'\brout(?:er|ing|es)\b|\bmulti-?page\b|\bpages\b', re.IGNORECASE),
+    ),
+}
+
+
+def blob_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]
+
+
+def boilerplate_files(entries: List[dict]) -> Dict[str, str]:
+    """The boilerplate part of a project's files, by path."""
+    return {entry['file_path']: entry['content'] for entry in entries if BOILERPLATE.match(entry['file_path'])}
+
+
+def describe(files: Dict[str, str]) -> Optional[dict]:
+    """Stack and features of a starter set; None if it is not a usable scaffold."""
+    if 'package.json' not in files or not any(path.startswith('src/main.') for path in files):
+        return None
+    try:
+        manifest = json.loads(files['package.json'])
+    except json.JSONDecodeError:
+        return None
+    dependencies = {**manifest.get('dependencies', {}), **manifest.get('devDependencies', {})}
+    stack = '-'.join(name for name in ('vite', 'react') if name in dependencies)
+    features = sorted(
+        feature for feature, (names, _) in FEATURES.items() if any(name in dependencies for name in names)
+    )
+    return {'stack': stack, 'features': features}
+
+
+def requested_features(prompt: str) -> List[str]:
+    return sorted(feature for feature, (_, words) in FEATURES.items() if words.search(prompt))
+
+
+class ScaffoldLibrary:
+    """
+    Starter sets and their file contents, persisted as one JSON file:
+    `blobs` maps a content hash to the content, `scaffolds` maps a set's hash
+    to its files (path -> blob hash), stack and features, and `projects`
+    records which set each project contributed.
+    """
+
+    def __init__(
+        self, path: str = LIBRARY_PATH, min_projects: int = SCAFFOLD_MIN_PROJECTS, enabled: bool = SCAFFOLDS_ENABLED
+    ):
+        self.path = path
+        self.min_projects = min_projects
+        self.enabled = enabled
+        self.blobs: Dict[str, str] = {}
+        self.scaffolds: Dict[str, dict] = {}
+        self.projects: Dict[str, str] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+        self.applied = 0
+        self.misses = 0
+        self.files_applied = 0
+        self.chars_applied = 0
+
+    def load(self):
+        """Read the library, building it from the projects' file stores the first time."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                self.blobs, self.scaffolds, self.projects = data['blobs'], data['scaffolds'], data['projects']
+                return
+        self.rebuild()
+
+    def rebuild(self, project_dir: str = PROJECT_DIR):
+        """Learn from every project's stored files, replacing what the library held."""
+        with self._lock:
+            self.blobs, self.scaffolds, self.projects = {}, {}, {}
+            if os.path.isdir(project_dir):
+                for project_id in sorted(os.listdir(project_dir)):
+                    entries = _stored_entries(os.path.join(project_dir, project_id))
+                    if entries:
+                        self._learn(project_id, entries)
+            self._save()
+        logger.info(f'Built scaffold library from {len(self.projects)} projects: {len(self.scaffolds)} starter sets')
+
+    def learn(self, project_id: str, entries: List[dict]):
+        """Record the starter set of a project after a run, replacing the one it had before."""
+        if not self.enabled:
+            return
+        self.load()
+        with self._lock:
+            if self._learn(project_id, entries):
+                self._save()
+
+    def _learn(self, project_id: str, entries: List[dict]) -> bool:
+        files = boilerplate_files(entries)
+        description = describe(files)
+        if description is None:
+            # The project no longer has a usable starter set; stop counting the one it had
+            if self.projects.pop(project_id, None) is None:
+                return False
+            self._collect()
+            return True
+        hashes = {path: blob_hash(content) for path, content in sorted(files.items())}
+        key = blob_hash(json.dumps(hashes, sort_keys=True))
+        if self.projects.get(project_id) == key:
+            return False
+        for path, content in files.items():
+            self.blobs[hashes[path]] = content
+        self.scaffolds.setdefault(key, {'files': hashes, **description})['updated_at'] = time.time()
+        self.projects[project_id] = key
+        self._collect()
+        return True
+
+    def _collect(self):
+        """Drop sets no project uses anymore, and contents no set refers to."""
+        used = set(self.projects.values())
+        self.scaffolds = {key: scaffold for key, scaffold in self.scaffolds.items() if key in used}
+        referenced = {blob for scaffold in self.scaffolds.values() for blob in scaffold['files'].values()}
+        self.blobs = {blob: content for blob, content in self.blobs.items() if blob in referenced}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'blobs': self.blobs, 'scaffolds': self.scaffolds, 'projects': self.projects}, f)
+        os.replace(tmp_path, self.path)
+
+    def match(self, prompt: str) -> Optional[Dict[str, str]]:
+        """Files of the most used starter set for the template stack with exactly the features the prompt asks for."""
+        if not self.enabled:
+            return None
+        self.load()
+        features = requested_features(prompt)
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for key in self.projects.values():
+                counts[key] = counts.get(key, 0) + 1
+            candidates = [
+                key
+                for key, scaffold in self.scaffolds.items()
+                if scaffold['stack'] == TEMPLATE_STACK
+                and scaffold['features'] == features
+                and counts.get(key, 0) >= self.min_projects
+            ]
+            if not candidates:
+                self.misses += 1
+                return None
+            key = max(candidates, key=lambda key: (counts[key], self.scaffolds[key]['updated_at']))
+            files = {path: self.blobs[blob] for path, blob in self.scaffolds[key]['files'].items()}
+        self.applied += 1
+        self.files_applied += len(files)
+        self.chars_applied += sum(len(content) for content in files.values())
+        logger.info(f'Scaffold {key} ({", ".join(features) or "no extra features"}) matches: {len(files)} files')
+        return files
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'scaffolds': len(self.scaffolds),
+            'projects': len(self.projects),
+            'applied': self.applied,
+            'misses': self.misses,
+            'files_applied': self.files_applied,
+            'chars_applied': self.chars_applied,
+        }
+
+
+def _stored_entries(project_path: str) -> List[dict]:
+    """A project's latest files from its file store log, or from a legacy file_store.json."""
+    log_path = os.path.join(project_path, 'file_store.log')
+    if os.path.exists(log_path):
+        store = FileStore(log_path)
+        store.close()
+        return store.entries()
+    legacy_path = os.path.join(project_path, 'file_store.json')
+    if os.path.exists(legacy_path):
+        with open(legacy_path, 'r') as f:
+            return json.load(f)
+    return []
+
+
+def scaffold_note(files: Dict[str, str], dependencies_installed: bool) -> str:
+    """What the model is told about a scaffold that was written before its first turn."""
+    installed = (
+        'Its dependencies are already installed.'
+        if dependencies_installed
+        else 'Its dependencies are not installed yet; run npm install before building.'
+    )
+    return (
+        '\n\nThis project already contains a starter scaffold with these files: '
+        f'{", ".join(sorted(files))}. Do not create them again; read or edit them if they need changes. '
+        f'{installed}\npackage.json:\n{files["package.json"]}'
+    )
+
+
+scaffold_library = ScaffoldLibrary()
@@ -0,0 +1,186 @@
+"""
+Post-run project snapshot built from what the server already knows.
+
+The agent's own writes are in the project's FileStore. Everything else in
+the sandbox is compared against a manifest of path -> (mtime, size, sha1)
+from the previous snapshot, so only files that were changed by
+execute_command (npm, generators, ...) are transferred.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shlex
+from typing import Dict, List, Optional
+from e2b_code_interpreter import AsyncSandbox, CommandExitException
+from utils.persistent_store import FileStore, get_project_path, open_file_store
+from agent.sandbox_pool import APP_DIR
+import logging
+
+logger = logging.getLogger(__name__)
+
+IGNORED_DIRS = ('node_modules', '.git', 'dist')
+# Keep each sha1sum command line well below the shell's argument limit
+HASH_BATCH = 200
+
+LIST_COMMAND = (
+    f'cd {APP_DIR} && find . \\( '
+    + ' -o '.join(f'-name {name}' for name in IGNORED_DIRS)
+    + " \\) -prune -o -type f -printf '%P\\t%T@\\t%s\\n'"
+)
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def _manifest_path(project_id: str) -> str:
+    return os.path.join(get_project_path(project_id), 'manifest.json')
+
+
+def load_manifest(project_id: str) -> Dict[str, dict]:
+    path = _manifest_path(project_id)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(project_id: str, manifest: Dict[str, dict]):
+    path = _manifest_path(project_id)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def open_sandbox_cache(project_id: str) -> FileStore:
+    """Contents of files the sandbox produced itself, cached from earlier snapshots."""
+    return open_file_store(project_id, 'sandbox_files')
+
+
+def known_files(project_id: str) -> Dict[str, str]:
+    """
+    Latest content the server holds for every project file: the agent's own
+    writes, plus sandbox-produced files from the last snapshot.
+    """
+    files = {}
+    sandbox_cache = open_sandbox_cache(project_id)
+    for file_path in load_manifest(project_id):
+        cached = sandbox_cache.get(file_path)
+        if cached is not None:
+            files[file_path] = cached['content']
+    for entry in open_file_store(project_id).entries():
+        files[entry['file_path']] = entry['content']
+    return files
+
+
+async def _run(sandbox: AsyncSandbox, command: str) -> str:
+    try:
+        result = await sandbox.commands.run(command)
+    except CommandExitException as e:
+        # sha1sum exits non-zero when a file vanished in between; the rest of its output is still good
+        result = e
+    return result.stdout
+
+
+async def _list_files(sandbox: AsyncSandbox) -> Dict[str, dict]:
+    listing = {}
+    for line in (await _run(sandbox, LIST_COMMAND)).splitlines():
+        parts = line.split('\t')
+        if len(parts) == 3:
+            listing[parts[0]] = {'mtime': parts[1], 'size': int(parts[2])}
+    return listing
+
+
+async def _hash_files(sandbox: AsyncSandbox, paths: List[str]) -> Dict[str, str]:
+    hashes = {}
+    for start in range(0, len(paths), HASH_BATCH):
+        batch = paths[start:start + HASH_BATCH]
+        command = f'cd {APP_DIR} && sha1sum -- ' + ' '.join(shlex.quote(path) for path in batch)
+        for line in (await _run(sandbox, command)).splitlines():
+            digest, _, path = line.partition('  ')
+            hashes[path] = digest
+    return hashes
+
+
+async def snapshot_project(project_id: str, sandbox: AsyncSandbox, include_contents: bool = True) -> List[dict]:
+    """
+    Return every project file as {file_path, hash, size} plus `content` when
+    `include_contents` is set.
+
+    Costs one listing command, one hashing command for the files whose mtime
+    or size changed since the last snapshot, and one read per file whose
+    content is known neither from the FileStore nor from an earlier snapshot.
+    """
+    file_store = open_file_store(project_id)
+    sandbox_cache = open_sandbox_cache(project_id)
+    manifest = load_manifest(project_id)
+    listing = await _list_files(sandbox)
+
+    candidates = [
+        path
+        for path, stat in listing.items()
+        if path not in manifest
+        or manifest[path]['mtime'] != stat['mtime']
+        or manifest[path]['size'] != stat['size']
+    ]
+    hashes = await _hash_files(sandbox, candidates) if candidates else {}
+
+    new_manifest = {}
+    for path, stat in listing.items():
+        digest = hashes.get(path) or manifest.get(path, {}).get('hash')
+        if digest:
+            new_manifest[path] = {**stat, 'hash': digest}
+
+    def known_content(path: str) -> Optional[str]:
+        digest = new_manifest[path]['hash']
+        for store in (file_store, sandbox_cache):
+            entry = store.get(path)
+            if entry is not None and content_hash(entry['content']) == digest:
+                return entry['content']
+        return None
+
+    contents = {path: known_content(path) for path in new_manifest}
+    missing = [path for path, content in contents.items() if content is None]
+    if missing and include_contents:
+        fetched = await asyncio.gather(
+            *(sandbox.files.read(f'{APP_DIR}/{path}') for path in missing), return_exceptions=True
+        )
+        for path, content in zip(missing, fetched):
+            if isinstance(content, Exception):
+                logger.warning(f'Could not read {path} from sandbox: {content}')
+                continue
+            contents[path] = content
+            sandbox_cache.put(path, content)
+
+    logger.info(
+        f'Snapshot of {project_id}: {len(new_manifest)} files, {len(candidates)} rehashed, '
+        f'{len(missing) if include_contents else 0} fetched from sandbox'
+    )
+    save_manifest(project_id, new_manifest)
+
+    files = []
+    for path, entry in new_manifest.items():
+        item = {'file_path': path, 'hash': entry['hash'], 'size': entry['size']}
+        if include_contents:
+            if contents[path] is None:
+                continue
+            item['content'] = contents[path]
+        files.append(item)
+    return files
+
+
+async def read_project_file(project_id: str, sandbox: Optional[AsyncSandbox], file_path: str) -> Optional[str]:
+    """Content of one file for lazy loading, served from the caches when its hash still matches."""
+    entry = load_manifest(project_id).get(file_path)
+    if entry is None:
+        return None
+    for store in (open_file_store(project_id), open_sandbox_cache(project_id)):
+        cached = store.get(file_path)
+        if cached is not None and content_hash(cached['content']) == entry['hash']:
+            return cached['content']
+    if sandbox is None:
+        return None
+    content = await sandbox.files.read(f'{APP_DIR}/{file_path}')
+    open_sandbox_cache(project_id).put(file_path, content)
+    return content
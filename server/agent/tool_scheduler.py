@@ -0,0 +1,60 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Tools that only write a single path and can run alongside each other
+CONCURRENT_TOOLS = {'create_file'}
+
+
+def _barrier_key(call: dict):
+    """Return the path a concurrent call touches, or None if the call must run alone."""
+    if call.get('name') not in CONCURRENT_TOOLS:
+        return None
+    return call.get('args', {}).get('file_path') or ''
+
+
+async def run_tool_calls(
+    calls: List[dict],
+    execute: Callable[[dict], Awaitable[Any]],
+    max_concurrency: int = 8,
+    execute_batch: Optional[Callable[[List[dict]], Awaitable[List[Any]]]] = None,
+) -> List[Any]:
+    """
+    Run the tool calls of one LLM turn and return their results in call order.
+
+    Consecutive file writes run concurrently (bounded by `max_concurrency`),
+    while any other call such as execute_command acts as a barrier: it waits for
+    every call before it and every call after it waits for it. Writes to the
+    same path inside a concurrent batch keep their original order.
+
+    If `execute_batch` is given, each concurrent batch of more than one call is
+    handed to it in one go instead, and it must return one result per call.
+    """
+    results: List[Any] = [None] * len(calls)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_chain(indices: List[int]):
+        for index in indices:
+            async with semaphore:
+                results[index] = await execute(calls[index])
+
+    batch: Dict[str, List[int]] = {}
+
+    async def flush():
+        indices = sorted(index for chain in batch.values() for index in chain)
+        if execute_batch is not None and len(indices) > 1:
+            for index, result in zip(indices, await execute_batch([calls[index] for index in indices])):
+                results[index] = result
+        elif batch:
+            await asyncio.gather(*(run_chain(chain) for chain in batch.values()))
+        batch.clear()
+
+    for index, call in enumerate(calls):
+        key = _barrier_key(call)
+        if key is None:
+            await flush()
+            results[index] = await execute(call)
+        else:
+            batch.setdefault(key, []).append(index)
+    await flush()
+
+    return results
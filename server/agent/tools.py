@@ -1,7 +1,7 @@
 from langchain_core.tools import tool
 from pathlib import Path
 import json
-from typing import Optional
+from typing import List, Optional
 
 
 @tool
@@ -22,12 +22,34 @@ async def create_file(file_path: str, content: str) -> str:
 
 
 @tool
-async def read_file(file_path: str) -> str:
+async def edit_file(file_path: str, search: str = "", replace: str = "", diff: str = "") -> str:
+    """
+    Change part of an existing file without sending the whole file again.
+    Prefer this over create_file for small changes to existing files.
+    
+    Args:
+        file_path: The path of the file to change (e.g., "src/App.jsx")
+        search: Exact text to replace; must occur exactly once in the file
+        replace: Text to put in place of `search`
+        diff: Alternatively, a unified diff with one or more @@ hunks against the current file,
+            each with a few unchanged context lines
+    
+    Returns:
+        Success message, or the reason the edit did not apply
+    """
+    # Tool interface - actual execution handled in agent_service
+    return f"File {file_path} will be edited"
+
+
+@tool
+async def read_file(file_path: str, start_line: Optional[int] = None, end_line: Optional[int] = None) -> str:
     """
     Read the content of a file from the project.
     
     Args:
         file_path: The path of the file to read (relative to project root)
+        start_line: Optional first line to return (1-based)
+        end_line: Optional last line to return (inclusive)
     
     Returns:
         The content of the file, or an error message if file doesn't exist
@@ -37,12 +59,28 @@ async def read_file(file_path: str) -> str:
 
 
 @tool
-async def execute_command(command: str) -> str:
+async def read_files(file_paths: List[str]) -> str:
+    """
+    Read several files from the project at once. Prefer this over repeated read_file calls.
+    
+    Args:
+        file_paths: The paths of the files to read (relative to project root)
+    
+    Returns:
+        The content of each file under a header with its path
+    """
+    # Tool interface - actual execution handled in agent_service
+    return f"Reading {len(file_paths)} files"
+
+
+@tool
+async def execute_command(command: str, timeout: Optional[int] = None) -> str:
     """
     Execute a shell command in the project environment.
     
     Args:
         command: The command to execute (e.g., "npm install", "npm run dev")
+        timeout: Optional limit in seconds after which the command is killed
     
     Returns:
         Command output including stdout, stderr, and exit code
@@ -76,8 +114,24 @@ async def get_context() -> str:
     and episodic memory along with the code map from previous sessions.
 
     Returns:
-        The previous context data including semantic, procedural, episodic memory, and code_map,
-        or a message indicating no context exists for a fresh project.
+        The previous context data including semantic, procedural, episodic memory and a
+        compact map of the project's files, or a message indicating no context exists.
     """
-    # Tool interface - actual execution handled in agent_service
+    # Tool interface - actual execution handled in the graph
     return "Retrieving context from previous sessions"
+
+
+@tool
+async def retrieve_context(query: str) -> str:
+    """
+    Search the project's files by path, export, component name or import.
+    Read the files it finds with read_files.
+
+    Args:
+        query: Words to match against file paths, exports, component names and imports
+
+    Returns:
+        The paths of the best matching files, with their components, exports and local imports.
+    """
+    # Tool interface - actual execution handled in the graph
+    return "Searching files from previous sessions"
@@ -0,0 +1,122 @@
+"""
+Time `npm install` across several projects with the same dependency set,
+with and without the node_modules cache.
+
+Runs offline: each project gets a LocalSandbox, and `npm` on its PATH is a
+stand-in that copies packages out of a local registry directory, sleeping
+per package the way a real registry fetch would.
+
+Run from the server directory:
+
+    python -m benchmarks.dependency_install
+"""
+import asyncio
+import json
+import os
+import stat
+import sys
+import tempfile
+import time
+from benchmarks.fakes import LocalSandbox
+from agent.agent_service import AgentService
+from agent.dependency_cache import DependencyCache
+from agent.sandbox_pool import APP_DIR, SandboxPool
+
+PROJECTS = 5
+PACKAGES = 40
+FILES_PER_PACKAGE = 25
+FILE_SIZE = 4096
+# Per package: metadata lookup plus tarball download
+REGISTRY_LATENCY = 0.05
+
+FAKE_NPM = f"""#!{sys.executable}
+import json, os, shutil, sys, time
+registry = os.environ["FAKE_REGISTRY"]
+latency = float(os.environ["FAKE_REGISTRY_LATENCY"])
+with open("package.json") as f:
+    manifest = json.load(f)
+deps = {{**manifest.get("dependencies", {{}}), **manifest.get("devDependencies", {{}})}}
+packages = {{}}
+for name, version in sorted(deps.items()):
+    time.sleep(latency)
+    shutil.copytree(os.path.join(registry, name), os.path.join("node_modules", name), dirs_exist_ok=True)
+    packages["node_modules/" + name] = {{"version": version.lstrip("^~")}}
+with open("package-lock.json", "w") as f:
+    json.dump({{"name": manifest.get("name"), "lockfileVersion": 3, "packages": packages}}, f, indent=2)
+print("added %d packages" % len(deps))
+"""
+
+
+def build_registry(root: str) -> dict:
+    """Write PACKAGES fake packages and return the dependencies section naming them."""
+    dependencies = {}
+    for index in range(PACKAGES):
+        name = f"pkg-{index}"
+        package_dir = os.path.join(root, name)
+        os.makedirs(package_dir)
+        with open(os.path.join(package_dir, "package.json"), "w") as f:
+            json.dump({"name": name, "version": "1.0.0"}, f)
+        for number in range(FILES_PER_PACKAGE):
+            with open(os.path.join(package_dir, f"file{number}.js"), "w") as f:
+                f.write(f"// {name} {number}\n" + "x" * FILE_SIZE)
+        dependencies[name] = "^1.0.0"
+    return dependencies
+
+
+def install_fake_npm(bin_dir: str):
+    os.makedirs(bin_dir)
+    path = os.path.join(bin_dir, "npm")
+    with open(path, "w") as f:
+        f.write(FAKE_NPM)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+
+async def run(cached: bool, work_dir: str, dependencies: dict, envs: dict):
+    cache = DependencyCache(os.path.join(work_dir, f"cache-{cached}"), enabled=cached)
+    service = AgentService(pool=SandboxPool(target_size=0), dependency_cache=cache)
+    package_json = json.dumps({"name": "app", "dependencies": dependencies}, indent=2)
+
+    timings = []
+    for project in range(PROJECTS):
+        sandbox = LocalSandbox(os.path.join(work_dir, f"sandbox-{cached}-{project}"), envs)
+        await sandbox.files.write(f"{APP_DIR}/package.json", package_json)
+
+        started = time.perf_counter()
+        result = await service.exec_in_sandbox("execute_command", {"command": "npm install"}, sandbox)  # type: ignore
+        timings.append(time.perf_counter() - started)
+        if "Exit code: 0" not in result:
+            raise RuntimeError(result)
+        installed = os.listdir(sandbox.local_path(f"{APP_DIR}/node_modules"))
+        assert len(installed) == PACKAGES, installed
+
+        # Let the archive of the first install land before the next project asks for it
+        await asyncio.gather(*service._dependency_saves.values())
+    return timings, cache.stats()
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as work_dir:
+        registry_dir = os.path.join(work_dir, "registry")
+        bin_dir = os.path.join(work_dir, "bin")
+        dependencies = build_registry(registry_dir)
+        install_fake_npm(bin_dir)
+        envs = {
+            "PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+            "FAKE_REGISTRY": registry_dir,
+            "FAKE_REGISTRY_LATENCY": str(REGISTRY_LATENCY),
+        }
+
+        print(f"{PACKAGES} packages, {PACKAGES * FILES_PER_PACKAGE} files, {PROJECTS} projects")
+        print(f"{'mode':>10} {'first':>8} {'rest avg':>9} {'total':>8} {'hits':>5}")
+        for cached in (False, True):
+            timings, stats = await run(cached, work_dir, dependencies, envs)
+            rest = timings[1:]
+            mode = "cache" if cached else "no cache"
+            print(
+                f"{mode:>10} {timings[0]:>8.3f} {sum(rest) / len(rest):>9.3f} "
+                f"{sum(timings):>8.3f} {stats['hits']:>5}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
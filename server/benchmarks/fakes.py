@@ -0,0 +1,320 @@
+"""
+In-process stand-ins for the E2B sandbox and the LLM used by the benchmarks.
+
+Every call into the fake counts as one round trip and sleeps for `latency`
+seconds, which is what dominates against the real service. LocalSandbox
+instead runs commands for real on the local machine.
+"""
+import asyncio
+import itertools
+import json
+import os
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from e2b_code_interpreter import CommandExitException
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from agent.sandbox_pool import APP_DIR
+
+_ids = itertools.count()
+# Chunks each streamed tool call's arguments arrive in
+STREAM_PIECES = 4
+
+
+@dataclass
+class FakeCommandResult:
+    stdout: str = ""
+    stderr: str = ""
+    exit_code: int = 0
+
+
+class FakeFiles:
+    def __init__(self, sandbox: "FakeSandbox"):
+        self.sandbox = sandbox
+        self.data = {}
+
+    async def write(self, path, data, **kwargs):
+        await self.sandbox.round_trip()
+        self.data[path] = data
+
+    async def write_files(self, files, **kwargs):
+        await self.sandbox.round_trip()
+        for entry in files:
+            self.data[entry["path"]] = entry["data"]
+
+    async def read(self, path, **kwargs):
+        await self.sandbox.round_trip()
+        return self.data[path]
+
+    async def remove(self, path, **kwargs):
+        await self.sandbox.round_trip()
+        self.data.pop(path, None)
+
+
+class FakeCommandHandle:
+    def __init__(self, sandbox: "FakeSandbox", on_stdout=None):
+        self.sandbox = sandbox
+        self.on_stdout = on_stdout
+        self.killed = False
+
+    async def wait(self):
+        await self.sandbox.round_trip()
+        if self.on_stdout:
+            self.on_stdout("ok\n")
+        return FakeCommandResult(stdout="ok\n")
+
+    async def kill(self):
+        self.killed = True
+        return True
+
+
+class FakeCommands:
+    def __init__(self, sandbox: "FakeSandbox"):
+        self.sandbox = sandbox
+        self.history = []
+
+    async def run(self, cmd, background=False, on_stdout=None, on_stderr=None, **kwargs):
+        self.history.append(cmd)
+        handle = FakeCommandHandle(self.sandbox, on_stdout)
+        return handle if background else await handle.wait()
+
+
+class FakeSandbox:
+    def __init__(self, latency: float = 0.0):
+        self.sandbox_id = f"fake-{next(_ids)}"
+        self.latency = latency
+        self.round_trips = 0
+        self.running = True
+        self.files = FakeFiles(self)
+        self.commands = FakeCommands(self)
+
+    async def round_trip(self):
+        self.round_trips += 1
+        await asyncio.sleep(self.latency)
+
+    async def is_running(self, request_timeout=None):
+        return self.running
+
+    async def set_timeout(self, timeout):
+        pass
+
+    async def kill(self):
+        self.running = False
+        return True
+
+    async def beta_pause(self):
+        await self.round_trip()
+        self.running = False
+        return self.sandbox_id
+
+    def get_host(self, port: int):
+        return f"{port}-{self.sandbox_id}.e2b.app"
+
+
+class LocalCommandHandle:
+    def __init__(self, process, on_stdout=None, on_stderr=None):
+        self.process = process
+        self.on_stdout = on_stdout
+        self.on_stderr = on_stderr
+
+    async def _pump(self, stream, callback, chunks):
+        while True:
+            line = await stream.readline()
+            if not line:
+                return
+            text = line.decode("utf-8", errors="replace")
+            chunks.append(text)
+            if callback:
+                callback(text)
+
+    async def wait(self):
+        stdout, stderr = [], []
+        await asyncio.gather(
+            self._pump(self.process.stdout, self.on_stdout, stdout),
+            self._pump(self.process.stderr, self.on_stderr, stderr),
+        )
+        exit_code = await self.process.wait()
+        if exit_code != 0:
+            raise CommandExitException(stderr="".join(stderr), stdout="".join(stdout), exit_code=exit_code, error=None)
+        return FakeCommandResult(stdout="".join(stdout), stderr="".join(stderr), exit_code=0)
+
+    async def kill(self):
+        if self.process.returncode is None:
+            self.process.kill()
+        return True
+
+
+class LocalFiles:
+    def __init__(self, sandbox: "LocalSandbox"):
+        self.sandbox = sandbox
+
+    async def write(self, path, data, **kwargs):
+        local = self.sandbox.local_path(path)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        with open(local, "wb" if isinstance(data, (bytes, bytearray)) else "w") as f:
+            f.write(data)
+
+    async def write_files(self, files, **kwargs):
+        for entry in files:
+            await self.write(entry["path"], entry["data"])
+
+    async def read(self, path, format="text", **kwargs):
+        if format == "stream":
+            return self._stream(self.sandbox.local_path(path))
+        with open(self.sandbox.local_path(path), "rb" if format == "bytes" else "r") as f:
+            return f.read()
+
+    async def _stream(self, local, chunk_size=64 * 1024):
+        with open(local, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+    async def remove(self, path, **kwargs):
+        local = self.sandbox.local_path(path)
+        if os.path.exists(local):
+            os.remove(local)
+
+
+class LocalCommands:
+    def __init__(self, sandbox: "LocalSandbox"):
+        self.sandbox = sandbox
+
+    async def run(self, cmd, background=False, on_stdout=None, on_stderr=None, envs=None, **kwargs):
+        process = await asyncio.create_subprocess_shell(
+            self.sandbox.local_command(cmd),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env={**os.environ, **self.sandbox.envs, **(envs or {})},
+        )
+        handle = LocalCommandHandle(process, on_stdout, on_stderr)
+        return handle if background else await handle.wait()
+
+
+class LocalSandbox:
+    """
+    Runs commands for real in a scratch directory, with the sandbox's app and
+    /tmp directories mapped below `root`. `envs` lets a benchmark put stand-in
+    tools such as a fake npm on PATH.
+    """
+
+    def __init__(self, root: str, envs: dict = None):
+        self.sandbox_id = f"local-{next(_ids)}"
+        self.root = root
+        self.envs = envs or {}
+        self.running = True
+        self.files = LocalFiles(self)
+        self.commands = LocalCommands(self)
+        for directory in (APP_DIR, "/tmp"):
+            os.makedirs(self.local_path(directory), exist_ok=True)
+
+    def local_path(self, path: str) -> str:
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def local_command(self, cmd: str) -> str:
+        return re.sub(f"{re.escape(APP_DIR)}|/tmp/", lambda match: self.local_path(match.group(0)), cmd)
+
+    async def is_running(self, request_timeout=None):
+        return self.running
+
+    async def set_timeout(self, timeout):
+        pass
+
+    async def kill(self):
+        self.running = False
+        return True
+
+    def get_host(self, port: int):
+        return f"localhost:{port}"
+
+
+def scripted_turns(components: int = 6) -> list:
+    """A typical generation: scaffold, install, components, build, summary."""
+    component_files = [
+        {"file_path": f"src/components/Component{i}.jsx", "content": f"export default function Component{i}() {{\n  return <div>{i}</div>\n}}\n" * 10}
+        for i in range(components)
+    ]
+    return [
+        ("Setting up the project.", [
+            ("create_file", {"file_path": "package.json", "content": '{"name": "app", "dependencies": {"react": "^18.3.1"}}'}),
+            ("create_file", {"file_path": "index.html", "content": "<div id=\"root\"></div>" * 20}),
+            ("create_file", {"file_path": "src/main.jsx", "content": "import App from './App'\n" * 20}),
+        ]),
+        ("Installing dependencies.", [("execute_command", {"command": "npm install"})]),
+        ("Writing the components.", [("create_file", args) for args in component_files]),
+        ("Building.", [("execute_command", {"command": "npm run build"})]),
+        ("Your app is ready.", []),
+    ]
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model stand-in that answers from `turns`, picking the turn by how many
+    AI messages the conversation already holds, so concurrent runs each follow
+    the script independently. When streamed, `latency` is spread over the
+    chunks: text word by word, then each tool call's arguments in STREAM_PIECES
+    parts, the way a real model emits them.
+    """
+
+    turns: list = []
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _response(self, messages) -> AIMessage:
+        step = min(sum(1 for message in messages if isinstance(message, AIMessage)), len(self.turns) - 1)
+        content, calls = self.turns[step]
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        output_tokens = len(str(calls)) // 4
+        return AIMessage(
+            content=content,
+            tool_calls=[{"name": name, "args": args, "id": f"call-{uuid.uuid4().hex}"} for name, args in calls],
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._response(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._response(messages))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        response = self._response(messages)
+        words = str(response.content).split(" ") if response.content else []
+        words = [word + " " for word in words[:-1]] + words[-1:]
+        pieces = []
+        for index, call in enumerate(response.tool_calls):
+            args = json.dumps(call["args"])
+            step = max(1, -(-len(args) // STREAM_PIECES))
+            for start in range(0, len(args), step):
+                pieces.append({
+                    "name": call["name"] if start == 0 else None,
+                    "args": args[start:start + step],
+                    "id": call["id"] if start == 0 else None,
+                    "index": index,
+                })
+        delay = self.latency / max(len(words) + len(pieces), 1)
+
+        for word in words:
+            await asyncio.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word))
+            if run_manager:
+                await run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
+        for piece in pieces:
+            await asyncio.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[piece]))
+            if run_manager:
+                await run_manager.on_llm_new_token("", chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=response.usage_metadata))
@@ -0,0 +1,69 @@
+"""
+Compare the legacy file store (full JSON rewrite per create_file) with the
+append-only FileStore.
+
+Run from the server directory:
+
+    python -m benchmarks.file_store
+"""
+import json
+import os
+import tempfile
+import time
+from utils.persistent_store import FileStore
+
+SIZES = (10, 100, 1000)
+FILE_SIZE = 2000
+
+
+def make_files(count: int):
+    content = "x" * FILE_SIZE
+    return [(f"src/components/Component{i}.jsx", content) for i in range(count)]
+
+
+def bench_legacy(path: str, files: list):
+    file_store = []
+    written = 0
+    started = time.perf_counter()
+    for file_path, content in files:
+        file_store.append({"file_path": file_path, "content": content})
+        with open(path, "w") as f:
+            json.dump(file_store, f, indent=2)
+        written += os.path.getsize(path)
+    write_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with open(path, "r") as f:
+        json.load(f)
+    load_time = time.perf_counter() - started
+    return write_time, load_time, written
+
+
+def bench_log(path: str, files: list):
+    store = FileStore(path)
+    started = time.perf_counter()
+    for file_path, content in files:
+        store.put(file_path, content)
+    store.close()
+    write_time = time.perf_counter() - started
+    written = os.path.getsize(path)
+
+    started = time.perf_counter()
+    FileStore(path).entries()
+    load_time = time.perf_counter() - started
+    return write_time, load_time, written
+
+
+def main():
+    print(f"{'files':>6} {'store':>8} {'write s':>10} {'load s':>10} {'bytes written':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in SIZES:
+            files = make_files(count)
+            for name, bench in (("legacy", bench_legacy), ("log", bench_log)):
+                path = os.path.join(tmp, f"{name}-{count}")
+                write_time, load_time, written = bench(path, files)
+                print(f"{count:>6} {name:>8} {write_time:>10.4f} {load_time:>10.4f} {written:>15,}")
+
+
+if __name__ == "__main__":
+    main()
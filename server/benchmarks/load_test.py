@@ -0,0 +1,174 @@
+"""
+Offline load test of the whole server: N projects each open /ws/{id}, POST
+/chat/{id} and wait for their `completed` event, against a real uvicorn
+instance in this process. The LLM is a scripted fake and sandboxes are
+FakeSandbox, so no network access or API keys are needed.
+
+Run from the server directory:
+
+    python -m benchmarks.load_test --projects 50 --llm-latency 0.3 --sandbox-latency 0.02
+
+The clients share the server's event loop, so the reported loop lag is an
+upper bound of what the server alone would see. Admission limits come from
+the server's own settings, e.g. MAX_CONCURRENT_RUNS=8 RUN_QUEUE_SIZE=20; shed
+runs are retried after their Retry-After (capped by --max-retry-wait).
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import statistics
+import tempfile
+import time
+import httpx
+import uvicorn
+import websockets
+from benchmarks.fakes import FakeSandbox, ScriptedChatModel, scripted_turns
+from agent.sandbox_pool import _percentile
+
+LAG_INTERVAL = 0.01
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=20, help="concurrent projects")
+    parser.add_argument("--rounds", type=int, default=1, help="runs per project, one after another")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--sandbox-latency", type=float, default=0.02, help="seconds per fake sandbox round trip")
+    parser.add_argument("--components", type=int, default=6, help="files written in the components turn")
+    parser.add_argument("--max-retry-wait", type=float, default=1.0, help="cap on the wait before retrying a shed run")
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def monitor_loop_lag(samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(time.perf_counter() - started - LAG_INTERVAL)
+
+
+async def run_project(
+    base_url: str, ws_url: str, project_id: str, client: httpx.AsyncClient, max_retry_wait: float
+) -> dict:
+    async with websockets.connect(f"{ws_url}/ws/{project_id}") as ws:
+        started = time.perf_counter()
+        shed = 0
+        while True:
+            response = await client.post(f"{base_url}/chat/{project_id}", json={"prompt": "Build a todo app"})
+            if response.status_code != 429:
+                break
+            shed += 1
+            await asyncio.sleep(min(float(response.headers["Retry-After"]), max_retry_wait))
+        response.raise_for_status()
+        run_id = response.json()["run_id"]
+
+        events = 0
+        first_event = None
+        queued = None
+        while True:
+            message = json.loads(await ws.recv())
+            events += 1
+            if first_event is None:
+                first_event = time.perf_counter() - started
+            if message.get("e") == "started" and queued is None:
+                queued = time.perf_counter() - started
+            if message.get("e") in ("completed", "error", "cancelled") and message.get("run_id") == run_id:
+                return {
+                    "latency": time.perf_counter() - started,
+                    "first_event": first_event,
+                    "queued": queued or 0.0,
+                    "shed": shed,
+                    "events": events,
+                    "ok": message["e"] == "completed",
+                }
+
+
+async def main():
+    args = parse_args()
+    work_dir = tempfile.mkdtemp(prefix="load-test-")
+    os.chdir(work_dir)
+
+    # Imported only now so the checkpoint database and stores open inside work_dir
+    import agent.core
+
+    agent.core.llm_with_tools = ScriptedChatModel(turns=scripted_turns(args.components), latency=args.llm_latency)
+    import main as server
+
+    async def fake_sandbox():
+        return FakeSandbox(latency=args.sandbox_latency)
+
+    server.agent_service.pool.factory = fake_sandbox
+    # The fake cannot produce a node_modules archive, and pooling would only hide sandbox creation
+    server.agent_service.dependency_cache.enabled = False
+    server.agent_service.pool.target_size = 0
+
+    port = free_port()
+    uvicorn_server = uvicorn.Server(uvicorn.Config(server.app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(uvicorn_server.serve())
+    while not uvicorn_server.started:
+        await asyncio.sleep(0.01)
+
+    base_url = f"http://127.0.0.1:{port}"
+    ws_url = f"ws://127.0.0.1:{port}"
+    lag_samples: list = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(lag_samples, stop))
+    rss_before = rss_mb()
+
+    async def project_rounds(index: int, client: httpx.AsyncClient):
+        results = []
+        for _ in range(args.rounds):
+            results.append(await run_project(base_url, ws_url, f"load-{index}", client, args.max_retry_wait))
+        return results
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=None) as client:
+        per_project = await asyncio.gather(*(project_rounds(index, client) for index in range(args.projects)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await lag_task
+    rss_after = rss_mb()
+    uvicorn_server.should_exit = True
+    await serving
+
+    results = [result for rounds in per_project for result in rounds]
+    latencies = sorted(result["latency"] for result in results)
+    first_events = sorted(result["first_event"] for result in results)
+    queued = sorted(result["queued"] for result in results)
+    lags = sorted(lag_samples)
+    runs = len(results)
+
+    print(f"{args.projects} projects x {args.rounds} rounds, llm {args.llm_latency}s, sandbox {args.sandbox_latency}s")
+    print(f"runs           {runs} ({sum(1 for result in results if not result['ok'])} failed)")
+    print(f"throughput     {runs / elapsed:.2f} runs/s over {elapsed:.2f}s")
+    print(
+        f"end-to-end     p50 {_percentile(latencies, 0.5):.3f}s  p95 {_percentile(latencies, 0.95):.3f}s  "
+        f"p99 {_percentile(latencies, 0.99):.3f}s  max {latencies[-1]:.3f}s"
+    )
+    print(f"first event    p50 {_percentile(first_events, 0.5):.3f}s  p95 {_percentile(first_events, 0.95):.3f}s")
+    print(f"until started  p50 {_percentile(queued, 0.5):.3f}s  p95 {_percentile(queued, 0.95):.3f}s")
+    print(f"shed (429)     {sum(result['shed'] for result in results)}")
+    print(f"events/run     {statistics.mean(result['events'] for result in results):.1f}")
+    print(
+        f"loop lag       p50 {_percentile(lags, 0.5) * 1000:.1f}ms  p99 {_percentile(lags, 0.99) * 1000:.1f}ms  "
+        f"max {lags[-1] * 1000:.1f}ms"
+    )
+    print(f"memory         {rss_after:.1f} MB peak RSS, {(rss_after - rss_before) / runs * 1024:.1f} KB per run")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+"""
+Count sandbox round trips for a burst of create_file calls, one write per
+file versus one bulk write per LLM turn.
+
+Run from the server directory:
+
+    python -m benchmarks.sandbox_writes
+"""
+import asyncio
+import os
+import tempfile
+import time
+from benchmarks.fakes import FakeSandbox
+from agent.agent_service import AgentService
+from agent.sandbox_pool import SandboxPool
+from agent.tool_scheduler import run_tool_calls
+from utils.persistent_store import FileStore
+
+SIZES = (5, 20, 50)
+LATENCY = 0.05
+
+
+def make_calls(count: int):
+    return [
+        {"name": "create_file", "args": {"file_path": f"src/File{i}.jsx", "content": "x" * 500}, "id": f"call-{i}"}
+        for i in range(count)
+    ]
+
+
+async def run(count: int, batched: bool, store_dir: str):
+    service = AgentService(pool=SandboxPool(target_size=0))
+    sandbox = FakeSandbox(latency=LATENCY)
+    file_store = FileStore(os.path.join(store_dir, f"{count}-{batched}.log"))
+    calls = make_calls(count)
+
+    started = time.perf_counter()
+    await run_tool_calls(
+        calls,
+        lambda call: service._run_sandbox_tool(call, sandbox, None, file_store),  # type: ignore
+        execute_batch=(lambda calls: service.write_files_bulk(calls, sandbox, None, file_store)) if batched else None,  # type: ignore
+    )
+    return time.perf_counter() - started, sandbox.round_trips
+
+
+async def main():
+    print(f"{'files':>6} {'mode':>10} {'seconds':>10} {'round trips':>12}")
+    with tempfile.TemporaryDirectory() as store_dir:
+        for count in SIZES:
+            for batched in (False, True):
+                elapsed, round_trips = await run(count, batched, store_dir)
+                mode = "bulk" if batched else "per-file"
+                print(f"{count:>6} {mode:>10} {elapsed:>10.3f} {round_trips:>12}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
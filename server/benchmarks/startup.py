@@ -0,0 +1,122 @@
+"""
+Measure how long the server takes to become useful: `import main` in a fresh
+interpreter, the lifespan's startup, and the background warmup (graph,
+checkpoint database, model client). Every sample runs in its own process in
+a scratch directory, with no GOOGLE_API_KEY for the import and an offline
+placeholder key for the warmup, and an empty sandbox pool, so no network
+access is needed.
+
+Run from the server directory:
+
+    python -m benchmarks.startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def serve():
+    async with main.lifespan(main.app):
+        ready = time.perf_counter()
+        while main.agent_service.warmup_stats["state"] != "ready":
+            await asyncio.sleep(0.005)
+        warm = time.perf_counter()
+    return ready, warm
+
+ready, warm = asyncio.run(serve())
+print(json.dumps({
+    "import": imported - started,
+    "lifespan": ready - imported,
+    "warmup": warm - ready,
+    "steps": main.agent_service.warmup_stats,
+}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to time")
+    parser.add_argument("--top", type=int, default=10, help="packages to list by import time")
+    return parser.parse_args()
+
+
+def child_env(api_key: bool) -> dict:
+    env = {key: value for key, value in os.environ.items() if key != "GOOGLE_API_KEY"}
+    env["PYTHONPATH"] = SERVER_DIR
+    env["SANDBOX_POOL_SIZE"] = "0"
+    env["WARMUP"] = "1"
+    env.pop("REGISTRY_URL", None)
+    if api_key:
+        env["GOOGLE_API_KEY"] = "offline-benchmark"
+    return env
+
+
+def run_child(work_dir: str, api_key: bool) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=work_dir, env=child_env(api_key), capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def import_profile(work_dir: str) -> dict:
+    """Self time of `import main` per top-level package, from -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=work_dir,
+        env=child_env(api_key=False),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    totals = defaultdict(int)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        totals[name.strip().split(".")[0]] += int(self_us)
+    return totals
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="startup-") as work_dir:
+        # The first process also fills __pycache__, so it is not counted
+        run_child(work_dir, api_key=False)
+        cold = [run_child(work_dir, api_key=False) for _ in range(args.runs)]
+        warm = [run_child(work_dir, api_key=True) for _ in range(args.runs)]
+        profile = import_profile(work_dir)
+
+    def median(samples, key):
+        return statistics.median(sample[key] for sample in samples)
+
+    print(f"median of {args.runs} fresh processes")
+    print(f"{'import main (no API key)':<28} {median(cold, 'import'):>8.3f}s")
+    print(f"{'lifespan startup':<28} {median(warm, 'lifespan'):>8.3f}s")
+    print(f"{'background warmup':<28} {median(warm, 'warmup'):>8.3f}s")
+    for step in ("graph", "model"):
+        values = [sample["steps"][step] for sample in warm if isinstance(sample["steps"].get(step), float)]
+        if values:
+            print(f"{'  ' + step:<28} {statistics.median(values):>8.3f}s")
+        else:
+            print(f"{'  ' + step:<28} {warm[-1]['steps'].get(step)}")
+
+    print(f"\nimport main, self time by package (top {args.top})")
+    total = sum(profile.values())
+    for name, self_us in sorted(profile.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{name:<28} {self_us / 1e6:>8.3f}s {100 * self_us / total:>5.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,377 @@
-from fastapi import FastAPI,WebSocket,WebSocketDisconnect 
+from fastapi import FastAPI,Request,WebSocket,WebSocketDisconnect 
 from fastapi.middleware.cors  import CORSMiddleware
-from fastapi.responses import JSONResponse 
+from fastapi.responses import JSONResponse, PlainTextResponse
 import asyncio
+import os
+from contextlib import asynccontextmanager
 from agent.agent_service import agent_service
-from inject import inject
-import json
-app = FastAPI()
-app.add_middleware(CORSMiddleware,allow_origins=["*"],allow_methods=["*"],allow_headers=["*"])
+from agent.event_bus import event_bus
+from agent.llm_cache import llm_cache
+from agent.run_scheduler import QueueFull, Ticket, scheduler
+from utils.persistent_store import load_project_settings, save_project_settings
+from utils.registry import registry
+from utils.tracing import load_trace, render_metrics, span, start_trace
+from agent.snapshot import read_project_file, snapshot_project
+import time
+import uuid
 
-active_sockets={}
-active_runs={}
+# Finished runs are kept this long so clients can still poll their result
+RUN_RETENTION_SECONDS = 3600
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+# How often this worker heartbeats its runs and picks up cancel requests from other workers
+SUPERVISE_INTERVAL = 1.0
+# Build the model client and the graph and pre-fill the sandbox pool while the server starts,
+# instead of inside the first run
+WARMUP = os.getenv("WARMUP", "1") == "1"
 
-@app.post("/chat/{project_id}")
-async def create_project(project_id:str,payload:dict):
+# Runs executing in this worker, with their asyncio.Task under "task"
+local_runs={}
+
+
+def run_view(run: dict):
+    return {key: value for key, value in run.items() if key not in ("task", "ticket")}
+
+
+def publish_queue_position(ticket: Ticket):
+    event_bus.publish(
+        ticket.project_id,
+        {
+            "e": "queued",
+            "run_id": ticket.run_id,
+            "position": ticket.position,
+            "message": f"Waiting for a free slot, position {ticket.position} in the queue",
+        },
+    )
+
+
+scheduler.on_position = publish_queue_position
+
+
+async def shed_run(project_id: str, run_id: str, e: QueueFull):
+    """Give the claim back and tell the client when to try again."""
+    await registry.release_run(project_id, run_id)
+    return JSONResponse(
+        {"error": f"{e}, try again later", "retry_after": e.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+async def supervise_runs():
+    last_prune = 0.0
+    while True:
+        try:
+            running = [run_id for run_id, run in local_runs.items() if run.get("task")]
+            await registry.heartbeat(running)
+            for run_id in await registry.take_cancel_requests(running):
+                task = local_runs.get(run_id, {}).get("task")
+                if task:
+                    task.cancel()
+
+            if time.time() - last_prune > 60:
+                last_prune = time.time()
+                await registry.prune_runs(time.time() - RUN_RETENTION_SECONDS)
+                for run_id, run in list(local_runs.items()):
+                    if run["status"] in TERMINAL_STATUSES and time.time() - run["finished_at"] > RUN_RETENTION_SECONDS:
+                        local_runs.pop(run_id, None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Run supervisor failed: {e}")
+        await asyncio.sleep(SUPERVISE_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    agent_service.pool.start()
+    agent_service.lifecycle.start()
+    background = [
+        asyncio.create_task(supervise_runs()),
+        asyncio.create_task(event_bus.run_forwarding(registry)),
+    ]
+    if WARMUP:
+        # In the background so the server accepts requests right away; a run that starts
+        # earlier builds whatever is still missing itself
+        background.append(asyncio.create_task(agent_service.warmup()))
+    yield
+    for task in background:
+        task.cancel()
+    await agent_service.lifecycle.stop()
+    await agent_service.pool.stop()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CORSMiddleware,allow_origins=["*"],allow_methods=["*"],allow_headers=["*"],expose_headers=["Retry-After"])
+
+
+async def collect_files(project_id: str, include_contents: bool = True):
+    sandbox = agent_service.sandboxes.get(project_id)
+    if sandbox is None:
+        return []
+    with span("snapshot") as attrs:
+        files = await snapshot_project(project_id, sandbox, include_contents)
+        attrs["files"] = len(files)
+    return files
+
+
+@app.post("/chat/{project_id}", status_code=202)
+async def create_project(project_id:str,payload:dict,request:Request):
     prompt = payload.get("prompt")
+    # With "contents": false the run result only lists paths and hashes; fetch files lazily
+    include_contents = payload.get("contents", True)
     if not prompt:
         return JSONResponse({"error":"Too short or no description" }, status_code=400)
-    
-    if project_id in  active_runs:
-        return JSONResponse({"error": "Project is being created.Kindly wait"}, status_code=409)
- 
+    run_id = uuid.uuid4().hex
+    active_run_id = await registry.claim_run(project_id, run_id)
+    if active_run_id is not None:
+        return JSONResponse(
+            {"error": "Project is being created.Kindly wait", "run_id": active_run_id},
+            status_code=409,
+        )
+    # "cache": false opts the project out of the LLM response cache, for this and every later run
+    if "cache" in payload:
+        save_project_settings(project_id, llm_cache=bool(payload["cache"]))
+
+    # Runs are queued fairly per tenant; without a tenant header every project counts as its own
+    tenant = request.headers.get("x-tenant-id", project_id)
+    try:
+        run = await start_run(run_id, project_id, prompt, include_contents, tenant=tenant)
+    except QueueFull as e:
+        return await shed_run(project_id, run_id, e)
+    return {"run_id": run_id, "project_id": project_id, "status": run["status"], "position": run["position"]}
+
+
+async def start_run(
+    run_id: str,
+    project_id: str,
+    prompt: str,
+    include_contents: bool = True,
+    resumed_from: str = None,
+    tenant: str = None,
+):
+    """
+    Start the agent for an already claimed project in the background, once
+    the scheduler admits it. Raises QueueFull when the run is shed.
+    """
+    tenant = tenant or project_id
+    # Read per project, so follow-up prompts and resumes keep a project's cache opt-out
+    use_llm_cache = load_project_settings(project_id).get("llm_cache", True)
+    ticket = scheduler.submit(run_id, project_id, tenant)
+    run = {
+        "run_id": run_id,
+        "project_id": project_id,
+        "tenant": tenant,
+        "status": "running" if ticket.admitted.is_set() else "queued",
+        "position": ticket.position,
+        "prompt": prompt,
+        "resumed_from": resumed_from,
+        "include_contents": include_contents,
+        "created_at": time.time(),
+        "finished_at": None,
+        "error": None,
+        "file_count": 0,
+        "files": [],
+        "sandbox_id": None,
+    }
+
     async def task():
-        try:
-            socket = active_sockets[project_id]
-            await agent_service.run_agent_stream(prompt, project_id, socket)
-            
-        except Exception as e:
-            print(f"❌ Error in task: {e}")
-            ws = active_sockets.get(project_id)
-            if ws:
-                try:
-                    await ws.send_json({
-                        "e": "error",
-                        "message": str(e)
-                    })
-                except:
-                    pass
-        finally:
-            active_runs.pop(project_id, None)
-    
-    active_runs[project_id] = asyncio.create_task(task())
-    await active_runs[project_id]
-    
+        with start_trace(run_id, project_id) as trace:
+            try:
+                if not ticket.admitted.is_set():
+                    with span("run.queued"):
+                        await ticket.admitted.wait()
+                    run["status"] = "running"
+                    run["position"] = None
+                    await registry.save_run(run_view(run))
+                channel = event_bus.channel(project_id)
+                async with agent_service.lifecycle.in_use(project_id):
+                    await agent_service.run_agent_stream(
+                        prompt, project_id, channel, use_llm_cache, run_id=run_id, resume=resumed_from is not None
+                    )
+                    files = await collect_files(project_id, include_contents)
+                run["files"] = files
+                run["file_count"] = len(files)
+                run["status"] = "completed"
+                event_bus.publish(project_id, {"e": "completed", "run_id": run_id, "message": f"{len(files)} files"})
+
+            except asyncio.CancelledError:
+                print(f"Run {run_id} cancelled for project {project_id}")
+                run["status"] = "cancelled"
+                event_bus.publish(project_id, {"e": "cancelled", "run_id": run_id, "message": "Run cancelled"})
+
+            except Exception as e:
+                print(f"❌ Error in task: {e}")
+                run["status"] = "failed"
+                run["error"] = str(e)
+                event_bus.publish(project_id, {"e": "error", "run_id": run_id, "message": str(e)})
+            finally:
+                trace.status = run["status"]
+                await finish_run(run)
+
+    local_runs[run_id] = run
+    run["ticket"] = ticket
+    await registry.save_run(run_view(run))
+    run["task"] = asyncio.create_task(task())
+    return run
+
+
+async def finish_run(run: dict):
+    project_id = run["project_id"]
     sandbox = agent_service.sandboxes.get(project_id)
-    if sandbox is None :
-        return {
-            "status": "success",
-            "project_id": project_id,
-            "file_count": 0,
-            "files": [],
-            "sandbox_id": sandbox.sandbox_id if sandbox else None,
-            "sandbox_active": project_id in agent_service.sandboxes
-        } 
-    result = await sandbox.commands.run(inject)
-    files = json.loads(result.stdout)
-    
-    return {
-        "status": "success",
-        "project_id": project_id,
-        "file_count": len(files),
-        "files": files,
-        "sandbox_id": sandbox.sandbox_id if sandbox else None,
-        "sandbox_active": project_id in agent_service.sandboxes
-}
+    run["sandbox_id"] = sandbox.sandbox_id if sandbox else None
+    run["finished_at"] = time.time()
+    run.pop("task", None)
+    ticket = run.pop("ticket", None)
+    if ticket is not None:
+        scheduler.release(ticket)
+    await registry.save_run(run_view(run))
+    await registry.release_run(project_id, run["run_id"])
+    event_bus.discard(project_id)
+    if event_bus.viewer_count(project_id) == 0:
+        agent_service.release_sandbox(project_id)
+
+
+@app.get("/runs/{run_id}")
+async def get_run(run_id: str):
+    run = local_runs.get(run_id) or await registry.get_run(run_id)
+    if run is None:
+        return JSONResponse({"error": "Run not found"}, status_code=404)
+    return {**run_view(run), "sandbox_active": run["project_id"] in agent_service.sandboxes}
+
+@app.post("/runs/{run_id}/resume", status_code=202)
+async def resume_run(run_id: str):
+    """Continue a failed or cancelled run from its last checkpoint instead of starting over."""
+    previous = local_runs.get(run_id) or await registry.get_run(run_id)
+    if previous is None:
+        return JSONResponse({"error": "Run not found"}, status_code=404)
+    if previous["status"] not in ("failed", "cancelled"):
+        return JSONResponse({"error": f"Run is {previous['status']}, only failed or cancelled runs resume"}, status_code=409)
+    project_id = previous["project_id"]
+    if not await agent_service.can_resume(project_id):
+        return JSONResponse({"error": "Nothing to resume for this project"}, status_code=409)
+
+    new_run_id = uuid.uuid4().hex
+    active_run_id = await registry.claim_run(project_id, new_run_id)
+    if active_run_id is not None:
+        return JSONResponse(
+            {"error": "Project is being created.Kindly wait", "run_id": active_run_id},
+            status_code=409,
+        )
+    try:
+        run = await start_run(
+            new_run_id,
+            project_id,
+            previous.get("prompt", ""),
+            previous.get("include_contents", True),
+            resumed_from=run_id,
+            tenant=previous.get("tenant"),
+        )
+    except QueueFull as e:
+        return await shed_run(project_id, new_run_id, e)
+    return {"run_id": new_run_id, "project_id": project_id, "status": run["status"], "resumed_from": run_id}
+
+@app.get("/projects/{project_id}/settings")
+async def get_project_settings(project_id: str):
+    return load_project_settings(project_id)
+
+@app.patch("/projects/{project_id}/settings")
+async def update_project_settings(project_id: str, payload: dict):
+    """Only "llm_cache" (bool) is recognized: false sends every LLM call of the project's runs to the model."""
+    if "llm_cache" not in payload:
+        return JSONResponse({"error": "Nothing to update"}, status_code=400)
+    return save_project_settings(project_id, llm_cache=bool(payload["llm_cache"]))
+
+@app.get("/runs/{run_id}/trace")
+async def get_run_trace(run_id: str):
+    run = local_runs.get(run_id) or await registry.get_run(run_id)
+    if run is None:
+        return JSONResponse({"error": "Run not found"}, status_code=404)
+    trace = load_trace(run["project_id"], run_id)
+    if trace is None:
+        return JSONResponse({"error": "No trace recorded for this run"}, status_code=404)
+    return trace
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.post("/runs/{run_id}/cancel")
+async def cancel_run(run_id: str):
+    run = local_runs.get(run_id)
+    if run is None:
+        remote = await registry.get_run(run_id)
+        if remote is None:
+            return JSONResponse({"error": "Run not found"}, status_code=404)
+        if remote["status"] in TERMINAL_STATUSES:
+            return JSONResponse({"error": f"Run already {remote['status']}"}, status_code=409)
+        # The run belongs to another worker, which picks this up on its next supervise tick
+        await registry.request_cancel(run_id)
+        return JSONResponse({**remote, "status": "cancelling"}, status_code=202)
+
+    task = run.get("task")
+    if task is None or task.done():
+        return JSONResponse({"error": f"Run already {run['status']}"}, status_code=409)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        # Cancelled before the task got to run, so its own cleanup never happened
+        run["status"] = "cancelled"
+        await finish_run(run)
+    return run_view(run)
+
+@app.get("/projects/{project_id}/files/{file_path:path}")
+async def get_project_file(project_id: str, file_path: str):
+    content = await read_project_file(project_id, agent_service.sandboxes.get(project_id), file_path)
+    if content is None:
+        return JSONResponse({"error": "File not found"}, status_code=404)
+    return {"file_path": file_path, "content": content}
+
+@app.get("/sandbox-pool")
+async def sandbox_pool_stats():
+    return agent_service.pool.stats()
+
+@app.get("/sandboxes")
+async def sandbox_lifecycle_stats():
+    return agent_service.lifecycle.stats()
+
+@app.get("/dependency-cache")
+async def dependency_cache_stats():
+    return agent_service.dependency_cache.stats()
+
+@app.get("/llm-cache")
+async def llm_cache_stats():
+    return llm_cache.stats()
+
+@app.get("/dev-servers")
+async def dev_server_stats():
+    return agent_service.dev_servers.stats()
+
+@app.get("/scheduler")
+async def scheduler_stats():
+    return scheduler.stats()
+
+@app.get("/early-writes")
+async def early_write_stats():
+    return agent_service.early_writes.stats()
+
+@app.get("/warmup")
+async def warmup_stats():
+    return agent_service.warmup_stats
+
+@app.get("/scaffolds")
+async def scaffold_stats():
+    return agent_service.scaffolds.stats()
+
+@app.get("/file-reads")
+async def file_read_stats():
+    return agent_service.file_reader.stats()
 
 @app.websocket("/ws/{project_id}")
 async def ws_listener(websocket: WebSocket, project_id: str):
     await websocket.accept()
-    active_sockets[project_id] = websocket
+    connection = event_bus.subscribe(project_id, websocket)
+    # A refresh within the grace period finds the previous sandbox still running
+    agent_service.lifecycle.keep(project_id)
 
     try:
         while True:
@@ -75,9 +379,9 @@ async def ws_listener(websocket: WebSocket, project_id: str):
     except WebSocketDisconnect:
         print(f"WebSocket disconnected for project {project_id}")
     finally:
-        active_sockets.pop(project_id, None)
-        try:
-            await agent_service.close_sandbox(project_id)
-        except Exception as e:
-            print(f"Error closing sandbox for project {project_id}: {e}")
+        event_bus.unsubscribe(project_id, connection)
+        # Other viewers may still be watching the same project, and a running agent still needs its sandbox
+        if event_bus.viewer_count(project_id) == 0 and await registry.active_run(project_id) is None:
+            event_bus.discard(project_id)
+            agent_service.release_sandbox(project_id)
 
@@ -0,0 +1,99 @@
+import asyncio
+import operator
+from typing import Annotated, List, TypedDict
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.graph import END, START, StateGraph
+from agent.checkpointer import SqliteCheckpointSaver
+
+CONFIG = {"configurable": {"thread_id": "project-1", "checkpoint_ns": ""}}
+
+
+def checkpoint(saver, config, checkpoint_id, values):
+    stored = empty_checkpoint()
+    stored["id"] = checkpoint_id
+    stored["channel_values"] = values
+    stored["channel_versions"] = {channel: saver.get_next_version(None, None) for channel in values}
+    return saver.put(config, stored, {"source": "loop", "step": 1}, stored["channel_versions"])
+
+
+def test_put_and_read_back(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"))
+    first = checkpoint(saver, CONFIG, "0001", {"messages": ["hello"]})
+    checkpoint(saver, first, "0002", {"messages": ["hello", "hi"]})
+
+    # A new connection to the same file, as after a restart
+    reopened = SqliteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"))
+    latest = reopened.get_tuple(CONFIG)
+    assert latest.checkpoint["id"] == "0002"
+    assert latest.checkpoint["channel_values"] == {"messages": ["hello", "hi"]}
+    assert latest.metadata["step"] == 1
+    assert latest.parent_config["configurable"]["checkpoint_id"] == "0001"
+    assert reopened.get_tuple(first).checkpoint["channel_values"] == {"messages": ["hello"]}
+    assert [item.checkpoint["id"] for item in reopened.list(CONFIG)] == ["0002", "0001"]
+
+
+def test_put_writes_are_pending_writes_of_the_checkpoint(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"))
+    config = checkpoint(saver, CONFIG, "0001", {"messages": []})
+
+    saver.put_writes(config, [("messages", "a"), ("files", "b")], task_id="task-1")
+    # Regular writes are kept as first recorded, even when a task is retried
+    saver.put_writes(config, [("messages", "changed")], task_id="task-1")
+
+    assert saver.get_tuple(config).pending_writes == [("task-1", "messages", "a"), ("task-1", "files", "b")]
+
+
+def test_prune_keeps_the_latest_checkpoints(tmp_path):
+    saver = SqliteCheckpointSaver(str(tmp_path / "checkpoints.sqlite"), keep=2)
+    config = CONFIG
+    for number in range(1, 6):
+        config = checkpoint(saver, config, f"{number:04}", {"messages": [number]})
+
+    asyncio.run(saver.aprune("project-1"))
+
+    assert [item.checkpoint["id"] for item in saver.list(CONFIG)] == ["0005", "0004"]
+    assert saver.get_tuple(CONFIG).checkpoint["channel_values"] == {"messages": [5]}
+    blobs = saver._query("SELECT COUNT(*) FROM blobs WHERE thread_id = ?", ("project-1",))[0][0]
+    assert blobs == 2
+
+
+class State(TypedDict):
+    steps: Annotated[List[str], operator.add]
+
+
+def test_an_interrupted_run_resumes_from_its_last_completed_node(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    calls = []
+    fail = [True]
+
+    def plan(state):
+        calls.append("plan")
+        return {"steps": ["plan"]}
+
+    def build(state):
+        calls.append("build")
+        if fail[0]:
+            raise RuntimeError("sandbox went away")
+        return {"steps": ["build"]}
+
+    def graph(saver):
+        workflow = StateGraph(State)
+        workflow.add_node("plan", plan)
+        workflow.add_node("build", build)
+        workflow.add_edge(START, "plan")
+        workflow.add_edge("plan", "build")
+        workflow.add_edge("build", END)
+        return workflow.compile(checkpointer=saver)
+
+    config = {"configurable": {"thread_id": "project-1"}}
+    with pytest.raises(RuntimeError):
+        graph(SqliteCheckpointSaver(path)).invoke({"steps": []}, config)
+
+    fail[0] = False
+    resumed = graph(SqliteCheckpointSaver(path))
+    assert resumed.get_state(config).next == ("build",)
+    result = resumed.invoke(None, config)
+
+    assert result["steps"] == ["plan", "build"]
+    assert calls == ["plan", "build", "build"]
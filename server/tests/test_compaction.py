@@ -0,0 +1,42 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from agent.compaction import compact_messages
+
+
+def _turn(index: int, output_chars: int):
+    call_id = f"call-{index}"
+    return [
+        AIMessage(content="", tool_calls=[{"name": "execute_command", "args": {"command": "ls"}, "id": call_id}]),
+        ToolMessage(content="x" * output_chars, tool_call_id=call_id),
+    ]
+
+
+def test_dropping_turns_keeps_every_prompt_of_a_two_prompt_thread():
+    first = HumanMessage(content="build a todo app")
+    second = HumanMessage(content="now add a dark mode")
+    messages = (
+        [SystemMessage(content="system"), first]
+        + _turn(0, 1000)
+        + _turn(1, 1000)
+        + [AIMessage(content="done")]
+        + [second]
+        + _turn(2, 1000)
+    )
+
+    compacted, stats = compact_messages(messages, token_budget=100, keep_recent_turns=1)
+
+    assert stats["dropped_turns"] > 0
+    humans = [message.content for message in compacted if isinstance(message, HumanMessage)]
+    assert humans == [first.content, second.content]
+    # The latest turn stays, after the prompt it answers
+    assert compacted.index(second) < compacted.index(messages[-2])
+    assert compacted[-1].tool_call_id == "call-2"
+
+
+def test_dropped_turns_take_their_tool_results_with_them():
+    messages = [SystemMessage(content="system"), HumanMessage(content="go")] + _turn(0, 4000) + _turn(1, 4000)
+
+    compacted, _ = compact_messages(messages, token_budget=50, keep_recent_turns=0)
+
+    call_ids = {call["id"] for message in compacted if isinstance(message, AIMessage) for call in message.tool_calls}
+    results = {message.tool_call_id for message in compacted if isinstance(message, ToolMessage)}
+    assert results == call_ids
@@ -0,0 +1,39 @@
+from agent import context_store
+from utils.persistent_store import close_file_store, open_file_store
+
+PROJECT = "context-test"
+
+
+def write_project(files):
+    store = open_file_store(PROJECT)
+    for file_path, content in files.items():
+        store.put(file_path, content)
+
+
+def test_retrieve_context_returns_matching_paths_without_contents(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_project({
+        "src/components/Cart.jsx": "export default function Cart() {\n  return <ul>SECRET</ul>\n}\n",
+        "src/App.jsx": "import Cart from './components/Cart'\nexport default function App() {\n  return <Cart />\n}\n",
+        "src/main.jsx": "import App from './App'\n",
+    })
+    try:
+        result = context_store.retrieve_context(PROJECT, "cart")
+    finally:
+        close_file_store(PROJECT)
+
+    lines = result.split("\n")
+    # The file defining Cart ranks above the one importing it
+    assert lines[0].startswith("src/components/Cart.jsx")
+    assert lines[1].startswith("src/App.jsx")
+    assert "SECRET" not in result
+    assert "read_files" in lines[-1]
+
+
+def test_retrieve_context_without_matches(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_project({"src/main.jsx": "import App from './App'\n"})
+    try:
+        assert context_store.retrieve_context(PROJECT, "checkout") == "No matching files."
+    finally:
+        close_file_store(PROJECT)
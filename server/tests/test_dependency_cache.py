@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import stat
+import sys
+from agent.agent_service import AgentService
+from agent.dependency_cache import DependencyCache
+from agent.sandbox_pool import APP_DIR, SandboxPool
+from benchmarks.fakes import LocalSandbox
+from utils.registry import MemoryRegistry
+
+FAKE_NPM = f"""#!{sys.executable}
+import os
+os.makedirs("node_modules/react", exist_ok=True)
+with open("node_modules/react/index.js", "w") as f:
+    f.write("module.exports = 'react'")
+with open("package-lock.json", "w") as f:
+    f.write('{{"lockfileVersion": 3}}')
+print("added 1 package")
+"""
+
+
+def make_sandbox(root, envs=None):
+    sandbox = LocalSandbox(str(root), envs)
+    os.makedirs(sandbox.local_path(f"{APP_DIR}/node_modules/react"))
+    with open(sandbox.local_path(f"{APP_DIR}/node_modules/react/index.js"), "w") as f:
+        f.write("module.exports = 'react'")
+    os.makedirs(sandbox.local_path(f"{APP_DIR}/node_modules/.vite"))
+    with open(sandbox.local_path(f"{APP_DIR}/node_modules/.vite/deps.json"), "w") as f:
+        f.write("{}")
+    return sandbox
+
+
+def test_saved_tree_restores_into_another_sandbox(tmp_path):
+    cache = DependencyCache(str(tmp_path / "cache"))
+    source = make_sandbox(tmp_path / "source")
+    target = LocalSandbox(str(tmp_path / "target"))
+
+    async def main():
+        assert await cache.save_from_sandbox(source, "key")
+        assert await cache.restore_into(target, "key")
+
+    asyncio.run(main())
+
+    with open(target.local_path(f"{APP_DIR}/node_modules/react/index.js")) as f:
+        assert f.read() == "module.exports = 'react'"
+    # The dev server's cache stays out of the archive
+    assert not os.path.exists(target.local_path(f"{APP_DIR}/node_modules/.vite"))
+    # Neither the archive nor a partial download is left behind
+    assert not os.path.exists(source.local_path("/tmp/node_modules.tgz"))
+    assert os.listdir(tmp_path / "cache") == ["key.tgz"]
+    assert cache.stats()["saved"] == 1 and cache.stats()["hits"] == 1
+
+
+def test_nothing_to_save_without_node_modules(tmp_path):
+    cache = DependencyCache(str(tmp_path / "cache"))
+    sandbox = LocalSandbox(str(tmp_path / "sandbox"))
+
+    assert not asyncio.run(cache.save_from_sandbox(sandbox, "key"))
+    assert not cache.has("key")
+
+
+def test_oldest_archives_are_evicted_past_the_size_limit(tmp_path):
+    cache = DependencyCache(str(tmp_path / "cache"), max_bytes=1)
+    sandbox = make_sandbox(tmp_path / "sandbox")
+
+    async def main():
+        await cache.save_from_sandbox(sandbox, "first")
+        await cache.save_from_sandbox(sandbox, "second")
+
+    asyncio.run(main())
+
+    assert not cache.has("first") and cache.has("second")
+    assert cache.evicted == 1
+
+
+def test_install_returns_before_the_archive_and_the_next_command_waits_for_it(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    npm = bin_dir / "npm"
+    npm.write_text(FAKE_NPM)
+    npm.chmod(npm.stat().st_mode | stat.S_IEXEC)
+    sandbox = LocalSandbox(str(tmp_path / "sandbox"), {"PATH": f"{bin_dir}:{os.environ['PATH']}"})
+    cache = DependencyCache(str(tmp_path / "cache"))
+    service = AgentService(pool=SandboxPool(target_size=0), registry=MemoryRegistry(), dependency_cache=cache)
+    service.dev_servers.enabled = False
+    events = []
+    save = cache.save_from_sandbox
+
+    async def slow_save(sandbox, key):
+        await asyncio.sleep(0.2)
+        saved = await save(sandbox, key)
+        events.append("archived")
+        return saved
+
+    cache.save_from_sandbox = slow_save
+
+    async def main():
+        await sandbox.files.write(f"{APP_DIR}/package.json", json.dumps({"dependencies": {"react": "^18"}}))
+        result = await service.exec_in_sandbox("execute_command", {"command": "npm install"}, sandbox)
+        events.append("install returned")
+        assert "Exit code: 0" in result
+        # Reading the tree does not wait; anything that may change it does
+        await service.exec_in_sandbox("execute_command", {"command": "ls node_modules"}, sandbox)
+        events.append("ls returned")
+        await service.exec_in_sandbox("execute_command", {"command": "rm -rf node_modules"}, sandbox)
+        events.append("rm returned")
+
+    asyncio.run(main())
+
+    assert events == ["install returned", "ls returned", "archived", "rm returned"]
+    assert len(os.listdir(tmp_path / "cache")) == 1
@@ -0,0 +1,43 @@
+from agent.event_bus import Connection
+
+
+def test_thinking_deltas_merge_instead_of_filling_the_queue():
+    connection = Connection(websocket=None, max_queue=4)
+
+    for index in range(1000):
+        connection.push({"e": "thinking_delta", "message": str(index % 10)})
+
+    assert not connection.closed
+    assert len(connection.queue) == 1
+    assert connection.queue[0]["message"] == "0123456789" * 100
+
+
+def test_thinking_deltas_are_dropped_before_a_slow_viewer_is_disconnected():
+    connection = Connection(websocket=None, max_queue=2)
+
+    connection.push({"e": "thinking_delta", "message": "Hel"})
+    connection.push({"e": "file_created", "message": "a.js"})
+    connection.push({"e": "file_created", "message": "b.js"})
+
+    assert not connection.closed
+    assert [message["message"] for message in connection.queue] == ["a.js", "b.js"]
+
+
+def test_the_thinking_event_that_ends_a_turn_is_kept_when_the_queue_is_full():
+    connection = Connection(websocket=None, max_queue=2)
+
+    connection.push({"e": "thinking_delta", "message": "Hel", "turn": "a"})
+    connection.push({"e": "thinking", "message": "Hello", "turn": "a"})
+    connection.push({"e": "file_created", "message": "a.js"})
+
+    assert not connection.closed
+    assert [message["e"] for message in connection.queue] == ["thinking", "file_created"]
+
+
+def test_thinking_deltas_of_different_turns_are_not_merged():
+    connection = Connection(websocket=None, max_queue=4)
+
+    connection.push({"e": "thinking_delta", "message": "First", "turn": "a"})
+    connection.push({"e": "thinking_delta", "message": "Second", "turn": "b"})
+
+    assert [(message["turn"], message["message"]) for message in connection.queue] == [("a", "First"), ("b", "Second")]
@@ -0,0 +1,67 @@
+import pytest
+from agent.file_edit import EditConflict, apply_edit
+
+CONTENT = "\n".join(f"line {number}" for number in range(1, 9))
+# Two identical blocks, far enough apart that only one is near any stated line
+REPEATED = "\n".join(["function a() {", "  return 1", "}"] + [f"// {number}" for number in range(10)] + [
+    "function b() {", "  return 1", "}",
+])
+
+
+def test_insertion_with_context_lands_after_the_context():
+    diff = "@@ -5,2 +5,4 @@\n line 5\n+new a\n+new b\n line 6\n"
+
+    result = apply_edit(CONTENT, diff=diff).split("\n")
+
+    assert result[4:8] == ["line 5", "new a", "new b", "line 6"]
+
+
+def test_insertion_without_context_in_the_middle_is_a_conflict():
+    with pytest.raises(EditConflict):
+        apply_edit(CONTENT, diff="@@ -5,0 +6,2 @@\n+new a\n+new b\n")
+
+
+def test_insertion_at_the_top_and_end_of_the_file():
+    result = apply_edit(CONTENT, diff="@@ -0,0 +1 @@\n+first\n@@ -8,0 +10 @@\n+last\n").split("\n")
+
+    assert result[:2] == ["first", "line 1"]
+    assert result[-2:] == ["line 8", "last"]
+
+
+def test_shifted_insertion_follows_its_context():
+    # The stated line is two off; the context lines still pin the insertion down
+    diff = "@@ -3,2 +3,3 @@\n line 5\n+inserted\n line 6\n"
+
+    result = apply_edit(CONTENT, diff=diff).split("\n")
+
+    assert result[4:7] == ["line 5", "inserted", "line 6"]
+
+
+def test_hunks_after_an_insertion_still_match():
+    diff = "@@ -2,2 +2,3 @@\n line 2\n+inserted\n line 3\n@@ -6 +7 @@\n-line 6\n+line six\n"
+
+    result = apply_edit(CONTENT, diff=diff).split("\n")
+
+    assert result[1:4] == ["line 2", "inserted", "line 3"]
+    assert result[6] == "line six"
+
+
+def test_repeated_hunk_lines_far_from_the_stated_line_are_a_conflict():
+    diff = "@@ -8,2 +8,2 @@\n-  return 1\n+  return 2\n }\n"
+
+    with pytest.raises(EditConflict):
+        apply_edit(REPEATED, diff=diff)
+
+
+def test_repeated_hunk_lines_match_the_occurrence_at_the_stated_line():
+    diff = "@@ -15,2 +15,2 @@\n-  return 1\n+  return 2\n }\n"
+
+    result = apply_edit(REPEATED, diff=diff).split("\n")
+
+    assert result[1] == "  return 1"
+    assert result[14] == "  return 2"
+
+
+def test_search_text_that_occurs_twice_is_a_conflict():
+    with pytest.raises(EditConflict):
+        apply_edit("a\nb\na\n", search="a", replace="c")
@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+from agent.file_reader import FileReader, is_read_only_command
+from agent.sandbox_pool import APP_DIR
+from benchmarks.fakes import LocalSandbox
+from utils.persistent_store import close_file_store, open_file_store
+
+PROJECT = "reader-test"
+
+
+@pytest.fixture
+def sandbox(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sandbox = LocalSandbox(str(tmp_path / "sandbox"))
+    commands = []
+    run = sandbox.commands.run
+
+    async def counted(cmd, **kwargs):
+        commands.append(cmd)
+        return await run(cmd, **kwargs)
+
+    sandbox.commands.run = counted
+    sandbox.commands_run = commands
+    yield sandbox
+    close_file_store(PROJECT)
+
+
+async def create_file(reader, sandbox, file_path, content):
+    """What create_file does: write to the sandbox and the file store, then tell the reader."""
+    await sandbox.files.write(f"{APP_DIR}/{file_path}", content)
+    open_file_store(PROJECT).put(file_path, content)
+    await reader.wrote(sandbox, {file_path: content})
+
+
+def test_reads_of_written_files_are_served_from_memory(sandbox):
+    reader = FileReader()
+
+    async def main():
+        await create_file(reader, sandbox, "src/App.jsx", "old")
+        assert await reader.read(PROJECT, sandbox, "src/App.jsx") == "old"
+        await create_file(reader, sandbox, "src/App.jsx", "export default function App() {}\n")
+        before = len(sandbox.commands_run)
+        # A command that changes nothing still makes the next read re-list the tree
+        reader.command_ran(sandbox, "npm run build")
+        content = await reader.read(PROJECT, sandbox, "src/App.jsx")
+        return content, sandbox.commands_run[before:]
+
+    content, commands = asyncio.run(main())
+
+    assert content == "export default function App() {}\n"
+    # The listing only; the written file's mtime is known, so nothing is hashed or read
+    assert len(commands) == 1 and "sha1sum" not in commands[0]
+    assert reader.served_from_sandbox == 0
+    assert reader.served_from_memory == 2
+
+
+def test_a_command_that_changes_a_file_invalidates_it(sandbox):
+    reader = FileReader()
+
+    async def main():
+        await create_file(reader, sandbox, "src/App.jsx", "before\n")
+        assert await reader.read(PROJECT, sandbox, "src/App.jsx") == "before\n"
+        command = f"echo after > {APP_DIR}/src/App.jsx"
+        await sandbox.commands.run(command)
+        reader.command_ran(sandbox, command)
+        return await reader.read(PROJECT, sandbox, "src/App.jsx")
+
+    assert asyncio.run(main()) == "after\n"
+    assert reader.served_from_sandbox == 1
+
+
+def test_read_only_commands_keep_the_view(sandbox):
+    reader = FileReader()
+
+    async def main():
+        await create_file(reader, sandbox, "package.json", "{}")
+        await reader.read(PROJECT, sandbox, "package.json")
+
+    asyncio.run(main())
+    view = reader._views[sandbox.sandbox_id]
+
+    reader.command_ran(sandbox, "ls src && cat package.json | grep react")
+    assert view.synced
+    reader.command_ran(sandbox, "npm install")
+    assert not view.synced
+
+
+@pytest.mark.parametrize("command", [
+    "ls -la",
+    "cat src/App.jsx | head -20",
+    "find src -name '*.jsx'",
+    "grep -rn useState src",
+    "git status && git diff",
+    "node --version",
+])
+def test_read_only_commands(command):
+    assert is_read_only_command(command)
+
+
+@pytest.mark.parametrize("command", [
+    "npm install",
+    "env npm install",
+    "find . -name '*.tmp' -delete",
+    "find . -exec rm {} ;",
+    "find . -fprint listing.txt",
+    "tree -o tree.txt",
+    "git diff --output=patch.diff",
+    "rg --pre ./script.sh foo",
+    "echo hi > src/a.js",
+    "cat $(which node)",
+    "ls & npm run build",
+])
+def test_commands_that_may_write(command):
+    assert not is_read_only_command(command)
@@ -0,0 +1,64 @@
+import asyncio
+from fastapi.testclient import TestClient
+from langchain_core.messages import HumanMessage
+from agent import core
+from agent.llm_cache import LLMResponseCache
+from benchmarks.fakes import ScriptedChatModel, scripted_turns
+from utils.persistent_store import load_project_settings
+
+
+class CountingChatModel(ScriptedChatModel):
+    calls: int = 0
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+
+def call(state, use_cache=True):
+    return asyncio.run(core.call_llm(state, {"configurable": {"llm_cache": use_cache}}))
+
+
+def test_identical_requests_are_replayed_from_the_cache(monkeypatch):
+    model = CountingChatModel(turns=scripted_turns())
+    monkeypatch.setattr(core, "llm_with_tools", model)
+    monkeypatch.setattr(core, "llm_cache", LLMResponseCache(enabled=True))
+    state = {"messages": [HumanMessage(content="Build a todo app")], "iteration_count": 0}
+
+    first = call(state)["messages"][0]
+    replayed = call(state)["messages"][0]
+
+    assert model.calls == 1
+    assert replayed.content == first.content
+    assert [c["args"] for c in replayed.tool_calls] == [c["args"] for c in first.tool_calls]
+    # Replays get their own tool call ids so they can follow the original in one thread
+    assert {c["id"] for c in replayed.tool_calls}.isdisjoint(c["id"] for c in first.tool_calls)
+
+
+def test_runs_that_opted_out_always_call_the_model(monkeypatch):
+    model = CountingChatModel(turns=scripted_turns())
+    monkeypatch.setattr(core, "llm_with_tools", model)
+    monkeypatch.setattr(core, "llm_cache", LLMResponseCache(enabled=True))
+    state = {"messages": [HumanMessage(content="Build a todo app")], "iteration_count": 0}
+
+    call(state, use_cache=False)
+    call(state, use_cache=False)
+
+    assert model.calls == 2
+    assert core.llm_cache.stats()["entries"] == 0
+
+
+def test_a_rejected_chat_does_not_change_the_cache_setting(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import main
+
+    async def busy(project_id, run_id):
+        return "other-run"
+
+    monkeypatch.setattr(main.registry, "claim_run", busy)
+    client = TestClient(main.app)
+
+    response = client.post("/chat/busy-project", json={"prompt": "Build a todo app", "cache": False})
+
+    assert response.status_code == 409
+    assert load_project_settings("busy-project").get("llm_cache", True) is True
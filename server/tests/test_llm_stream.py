@@ -0,0 +1,64 @@
+import asyncio
+import os
+import pytest
+from agent import core
+from agent.agent_service import AgentService
+from agent.checkpointer import SqliteCheckpointSaver
+from agent.sandbox_pool import APP_DIR, SandboxPool
+from agent.scaffolds import ScaffoldLibrary
+from benchmarks.fakes import LocalSandbox, ScriptedChatModel
+from utils.persistent_store import close_file_store, open_file_store
+from utils.registry import MemoryRegistry
+
+PROJECT = "stream-test"
+
+
+class FailingStreamModel(ScriptedChatModel):
+    """Streams the first turn's tool calls, then fails before the response is complete."""
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+            if chunk.message.tool_call_chunks and chunk.message.tool_call_chunks[0]["name"] == "execute_command":
+                raise RuntimeError("connection reset by the model provider")
+
+
+def test_early_writes_of_a_failed_llm_call_are_rolled_back(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model = FailingStreamModel(turns=[("Writing files.", [
+        ("create_file", {"file_path": "src/App.jsx", "content": "half of a new App"}),
+        ("create_file", {"file_path": "src/New.jsx", "content": "export default function New() {}"}),
+        ("execute_command", {"command": "npm run build"}),
+    ])])
+    monkeypatch.setattr(core, "llm_with_tools", model)
+    monkeypatch.setattr(core, "_checkpointer", SqliteCheckpointSaver(":memory:"))
+    monkeypatch.setattr(core, "_agent", None)
+
+    sandbox = LocalSandbox(str(tmp_path / "sandbox"))
+
+    async def factory():
+        return sandbox
+
+    service = AgentService(
+        pool=SandboxPool(factory, target_size=0),
+        registry=MemoryRegistry(),
+        scaffolds=ScaffoldLibrary(str(tmp_path / "scaffolds.json"), enabled=False),
+    )
+    service.dev_servers.enabled = False
+    open_file_store(PROJECT).put("src/App.jsx", "the App the project has")
+
+    async def main():
+        await sandbox.files.write(f"{APP_DIR}/src/App.jsx", "the App the project has")
+        with pytest.raises(RuntimeError):
+            await service.run_agent_stream("Add a page", PROJECT, use_llm_cache=False)
+
+    try:
+        asyncio.run(main())
+    finally:
+        close_file_store(PROJECT)
+
+    assert service.early_writes.started == 2
+    assert service.early_writes.rolled_back == 2
+    with open(sandbox.local_path(f"{APP_DIR}/src/App.jsx")) as f:
+        assert f.read() == "the App the project has"
+    assert not os.path.exists(sandbox.local_path(f"{APP_DIR}/src/New.jsx"))
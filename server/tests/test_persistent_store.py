@@ -0,0 +1,64 @@
+from utils import persistent_store
+from utils.persistent_store import FileStore
+
+
+def test_compaction_by_a_stale_instance_keeps_records_another_instance_appended(tmp_path):
+    path = str(tmp_path / "file_store.log")
+    first = FileStore(path, compact_min_stale=1)
+    second = FileStore(path)
+
+    first.put("a.js", "1")
+    second.put("b.js", "2")
+    # Rewriting a.js a few times makes `first` compact the log
+    for content in ("3", "4", "5"):
+        first.put("a.js", content)
+    assert first.records == len(first.index)
+
+    reloaded = FileStore(path)
+    assert {entry["file_path"]: entry["content"] for entry in reloaded.entries()} == {"a.js": "5", "b.js": "2"}
+
+
+def test_refresh_picks_up_appends_and_compaction_from_another_instance(tmp_path):
+    path = str(tmp_path / "file_store.log")
+    reader = FileStore(path)
+    writer = FileStore(path)
+
+    writer.put("a.js", "1")
+    reader.refresh()
+    assert reader.get("a.js")["content"] == "1"
+
+    writer.put("a.js", "2")
+    writer.compact()
+    reader.refresh()
+    assert reader.get("a.js")["content"] == "2"
+    assert reader.records == 1
+
+    # The reader's own appends go to the compacted log, not the replaced file
+    reader.put("b.js", "3")
+    assert FileStore(path).get("b.js")["content"] == "3"
+
+
+def test_torn_last_line_is_dropped(tmp_path):
+    path = tmp_path / "file_store.log"
+    path.write_text('{"file_path": "a.js", "content": "1"}\n{"file_path": "b.js", "con')
+
+    store = FileStore(str(path))
+
+    assert [entry["file_path"] for entry in store.entries()] == ["a.js"]
+    assert path.read_text() == '{"file_path": "a.js", "content": "1"}\n'
+
+
+def test_open_stores_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(persistent_store, "MAX_OPEN_STORES", 2)
+    monkeypatch.setattr(persistent_store, "_stores", persistent_store.OrderedDict())
+
+    first = persistent_store.open_file_store("p1")
+    first.put("a.js", "1")
+    persistent_store.open_file_store("p2")
+    persistent_store.open_file_store("p3")
+
+    assert [key[0] for key in persistent_store._stores] == ["p2", "p3"]
+    # The evicted store still works for whoever holds it
+    first.put("b.js", "2")
+    assert [entry["file_path"] for entry in persistent_store.open_file_store("p1").entries()] == ["a.js", "b.js"]
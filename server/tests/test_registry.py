@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+import pytest
+from sqlalchemy import insert
+from utils.registry import MemoryRegistry
+from utils.sql_registry import SqlRegistry, forwarded_events
+
+
+@pytest.fixture
+def workers(tmp_path):
+    url = f"sqlite:///{tmp_path}/registry.sqlite"
+    return SqlRegistry(url), SqlRegistry(url)
+
+
+@pytest.fixture(params=["memory", "sql"])
+def registry(request, tmp_path):
+    if request.param == "memory":
+        return MemoryRegistry()
+    return SqlRegistry(f"sqlite:///{tmp_path}/registry.sqlite")
+
+
+def test_a_project_has_one_claim_until_it_is_released(registry):
+    async def scenario():
+        assert await registry.claim_run("p", "run-1") is None
+        assert await registry.claim_run("p", "run-2") == "run-1"
+        # Only the holder's release counts
+        await registry.release_run("p", "run-2")
+        assert await registry.active_run("p") == "run-1"
+        await registry.release_run("p", "run-1")
+        assert await registry.claim_run("p", "run-2") is None
+
+    asyncio.run(scenario())
+
+
+def test_runs_cancel_requests_and_sandbox_ids_round_trip(registry):
+    async def scenario():
+        await registry.save_run({"run_id": "run-1", "project_id": "p", "status": "running"})
+        await registry.save_run({"run_id": "run-1", "project_id": "p", "status": "done", "finished_at": 1.0})
+        assert (await registry.get_run("run-1"))["status"] == "done"
+
+        await registry.request_cancel("run-1")
+        assert await registry.take_cancel_requests(["run-1", "run-2"]) == ["run-1"]
+        assert await registry.take_cancel_requests(["run-1"]) == []
+
+        await registry.set_sandbox_id("p", "sbx-1")
+        await registry.set_sandbox_id("p", "sbx-2")
+        assert await registry.get_sandbox_id("p") == "sbx-2"
+        await registry.clear_sandbox_id("p")
+        assert await registry.get_sandbox_id("p") is None
+
+        await registry.prune_runs(finished_before=2.0)
+        assert await registry.get_run("run-1") is None
+
+    asyncio.run(scenario())
+
+
+def test_claims_are_shared_between_workers(workers):
+    a, b = workers
+
+    async def scenario():
+        assert await a.claim_run("p", "run-a") is None
+        assert await b.claim_run("p", "run-b") == "run-a"
+
+    asyncio.run(scenario())
+
+
+def test_events_reach_other_workers_once(workers):
+    a, b = workers
+
+    async def scenario():
+        last_id = await b.last_event_id()
+        await a.publish_events([("p", {"e": "file_created", "message": "a.js"}), ("q", {"e": "other"})])
+        await b.publish_events([("p", {"e": "own"})])
+
+        events = await b.poll_events(last_id, ["p"])
+        assert [message for _, _, message in events] == [{"e": "file_created", "message": "a.js"}]
+        assert await b.poll_events(events[-1][0], ["p"]) == []
+
+    asyncio.run(scenario())
+
+
+def test_an_event_committed_after_a_higher_id_was_polled_is_not_skipped(workers):
+    a, b = workers
+
+    async def scenario():
+        last_id = await b.last_event_id()
+        await a.publish_events([("p", {"e": "first"})])
+        # Leave a gap below the next id, as an insert still in flight would
+        with a.engine.begin() as conn:
+            conn.execute(
+                insert(forwarded_events).values(
+                    id=last_id + 10, project_id="p", worker_id=a.worker_id, created_at=time.time(),
+                    payload=json.dumps({"e": "third"}),
+                )
+            )
+        events = await b.poll_events(last_id, ["p"])
+        assert [message["e"] for _, _, message in events] == ["first", "third"]
+        last_id = events[-1][0]
+
+        # The in-flight insert commits with its lower id
+        with a.engine.begin() as conn:
+            conn.execute(
+                insert(forwarded_events).values(
+                    id=last_id - 1, project_id="p", worker_id=a.worker_id, created_at=time.time(),
+                    payload=json.dumps({"e": "second"}),
+                )
+            )
+        assert [message["e"] for _, _, message in await b.poll_events(last_id, ["p"])] == ["second"]
+        assert await b.poll_events(last_id, ["p"]) == []
+
+    asyncio.run(scenario())
+
+
+def test_a_new_poller_does_not_replay_earlier_events(workers):
+    a, b = workers
+
+    async def scenario():
+        await a.publish_events([("p", {"e": "before"})])
+        last_id = await b.last_event_id()
+        await a.publish_events([("p", {"e": "after"})])
+
+        assert [message["e"] for _, _, message in await b.poll_events(last_id, ["p"])] == ["after"]
+
+    asyncio.run(scenario())
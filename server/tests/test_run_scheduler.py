@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from agent.run_scheduler import Limiter, QueueFull, RunScheduler
+
+
+def test_runs_over_capacity_queue_round_robin_across_tenants():
+    scheduler = RunScheduler(max_running=1, max_queued=10, max_queued_per_tenant=10)
+    running = scheduler.submit("run-0", "p0", "busy")
+    queued = [
+        scheduler.submit("run-1", "p1", "busy"),
+        scheduler.submit("run-2", "p2", "busy"),
+        scheduler.submit("run-3", "p3", "quiet"),
+    ]
+
+    assert running.admitted.is_set()
+    # The quiet tenant's run goes ahead of the busy tenant's second one
+    assert [ticket.run_id for ticket in scheduler.order()] == ["run-1", "run-3", "run-2"]
+    assert [ticket.position for ticket in queued] == [1, 3, 2]
+
+    admitted = []
+    current = running
+    for _ in queued:
+        scheduler.release(current)
+        current = next(ticket for ticket in queued if ticket.admitted.is_set() and ticket.run_id not in admitted)
+        admitted.append(current.run_id)
+    assert admitted == ["run-1", "run-3", "run-2"]
+
+
+def test_cancelling_a_queued_run_moves_the_others_up():
+    scheduler = RunScheduler(max_running=1, max_queued=10)
+    scheduler.submit("run-0", "p0", "a")
+    first = scheduler.submit("run-1", "p1", "b")
+    second = scheduler.submit("run-2", "p2", "c")
+
+    scheduler.release(first)
+
+    assert not first.admitted.is_set()
+    assert second.position == 1
+
+
+def test_full_queue_and_tenant_share_are_shed_with_a_retry_after():
+    scheduler = RunScheduler(max_running=1, max_queued=2, max_queued_per_tenant=1)
+    scheduler.submit("run-0", "p0", "a")
+    scheduler.submit("run-1", "p1", "a")
+
+    with pytest.raises(QueueFull) as tenant_full:
+        scheduler.submit("run-2", "p2", "a")
+    scheduler.submit("run-3", "p3", "b")
+    with pytest.raises(QueueFull) as queue_full:
+        scheduler.submit("run-4", "p4", "c")
+
+    assert "tenant" in str(tenant_full.value)
+    assert queue_full.value.retry_after >= 1
+    assert scheduler.shed_total == 2
+
+
+def test_limiter_caps_concurrent_slots():
+    limiter = Limiter("test", 2)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.active)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(main())
+
+    assert peak == 2
+    assert limiter.stats() == {"limit": 2, "active": 0, "waiting": 0}
+
+
+def test_chat_is_shed_with_429_and_gives_the_project_back(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import main
+
+    monkeypatch.setattr(main, "scheduler", RunScheduler(max_running=0, max_queued=0))
+    client = TestClient(main.app)
+
+    for _ in range(2):
+        # The second request would get a 409 if the first had kept the project claimed
+        response = client.post("/chat/shed-project", json={"prompt": "Build a todo app"})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
@@ -0,0 +1,59 @@
+import asyncio
+from agent.run_scheduler import Limiter
+from agent.sandbox_lifecycle import SandboxLifecycle
+from agent.sandbox_pool import SandboxPool
+from benchmarks.fakes import FakeSandbox
+from utils.registry import MemoryRegistry
+
+
+def lifecycle(factory, limiter=None, **kwargs):
+    async def connect(sandbox_id):
+        raise RuntimeError("nothing to resume")
+
+    return SandboxLifecycle(SandboxPool(factory, target_size=0), MemoryRegistry(), connect, limiter=limiter, **kwargs)
+
+
+def test_bringing_up_sandboxes_goes_through_the_sandbox_limiter(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    limiter = Limiter("sandbox", 1)
+    booting = []
+
+    async def factory():
+        booting.append(1)
+        peak.append(len(booting))
+        await asyncio.sleep(0.01)
+        booting.pop()
+        return FakeSandbox()
+
+    peak = []
+
+    async def main():
+        projects = lifecycle(factory, limiter)
+        await asyncio.gather(*(projects.acquire(f"project-{number}") for number in range(3)))
+        return projects
+
+    projects = asyncio.run(main())
+
+    assert max(peak) == 1
+    assert len(projects.live) == 3
+
+
+def test_concurrent_acquires_of_one_project_share_a_sandbox(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    made = []
+
+    async def factory():
+        await asyncio.sleep(0.01)
+        made.append(FakeSandbox())
+        return made[-1]
+
+    async def main():
+        projects = lifecycle(factory, Limiter("sandbox", 4))
+        # The viewer's /sandbox and a run asking at the same time
+        return projects, await asyncio.gather(projects.acquire("project"), projects.acquire("project"))
+
+    projects, sandboxes = asyncio.run(main())
+
+    assert len(made) == 1
+    assert sandboxes[0] is sandboxes[1] is made[0]
+    assert projects.live["project"].sandbox is made[0]
@@ -0,0 +1,97 @@
+import asyncio
+from agent.sandbox_pool import SandboxPool
+from benchmarks.fakes import FakeSandbox
+
+
+class SlowHealthSandbox(FakeSandbox):
+    async def is_running(self, request_timeout=None):
+        await asyncio.sleep(0.05)
+        return self.running
+
+
+def counting_factory(sandbox_class=FakeSandbox):
+    created = []
+
+    async def factory():
+        sandbox = sandbox_class()
+        created.append(sandbox)
+        return sandbox
+
+    return factory, created
+
+
+async def wait_until(condition, timeout=1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.005)
+
+
+def test_acquire_hands_out_a_warm_sandbox_and_the_pool_refills():
+    factory, created = counting_factory()
+
+    async def main():
+        pool = SandboxPool(factory, target_size=2, refill_interval=0.01)
+        pool.start()
+        await wait_until(lambda: pool.size == 2)
+        sandbox = await pool.acquire()
+        assert sandbox is created[0]
+        await wait_until(lambda: pool.size == 2)
+        await pool.stop()
+        return pool
+
+    pool = asyncio.run(main())
+
+    assert pool.hits == 1 and pool.misses == 0
+    assert len(created) == 3
+
+
+def test_acquire_from_an_empty_pool_creates_a_sandbox_inline():
+    factory, created = counting_factory()
+
+    async def main():
+        pool = SandboxPool(factory, target_size=0)
+        return pool, await pool.acquire()
+
+    pool, sandbox = asyncio.run(main())
+
+    assert sandbox is created[0]
+    assert pool.misses == 1 and pool.hits == 0
+
+
+def test_expired_and_dead_sandboxes_are_evicted():
+    factory, created = counting_factory()
+
+    async def main():
+        pool = SandboxPool(factory, target_size=2, refill_interval=60)
+        await pool._fill()
+        created[0].running = False
+        await pool._evict_stale()
+        assert pool.size == 1
+        pool.max_age = 0
+        await pool._evict_stale()
+        return pool
+
+    pool = asyncio.run(main())
+
+    assert pool.size == 0
+    assert pool.evicted == 2
+    assert not created[1].running
+
+
+def test_acquire_during_health_checks_still_gets_a_warm_sandbox():
+    factory, created = counting_factory(SlowHealthSandbox)
+
+    async def main():
+        pool = SandboxPool(factory, target_size=1, refill_interval=60)
+        await pool._fill()
+        eviction = asyncio.create_task(pool._evict_stale())
+        await asyncio.sleep(0.01)
+        sandbox = await pool.acquire()
+        await eviction
+        return pool, sandbox
+
+    pool, sandbox = asyncio.run(main())
+
+    assert sandbox is created[0]
+    assert pool.hits == 1 and pool.evicted == 0
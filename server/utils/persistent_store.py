@@ -1,24 +1,253 @@
+import fcntl
 import os
 import json
+from contextlib import contextmanager
+from collections import OrderedDict
+from typing import Dict, List, Optional
 PROJECT_DIR = "data/project"
 
+# Rewrite the log once it holds this many superseded records
+COMPACT_MIN_STALE = 64
+# Stores kept open per process; the least recently used one is closed beyond this
+MAX_OPEN_STORES = int(os.getenv("FILE_STORE_MAX_OPEN", "256"))
 
 
-def get_store_path(project_id: str):
+def get_project_path(project_id: str):
     project_path = os.path.join(PROJECT_DIR, f"{project_id}")
     os.makedirs(project_path, exist_ok=True)
-    return os.path.join(project_path, "file_store.json")
+    return project_path
+
+
+def get_store_path(project_id: str):
+    """Path of the legacy full-JSON store, only read to migrate old projects."""
+    return os.path.join(get_project_path(project_id), "file_store.json")
+
+
+def get_settings_path(project_id: str):
+    return os.path.join(get_project_path(project_id), "settings.json")
+
+
+def load_project_settings(project_id: str) -> dict:
+    """Per-project options that outlive a single request, e.g. {"llm_cache": False}."""
+    path = get_settings_path(project_id)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_project_settings(project_id: str, **changes) -> dict:
+    settings = {**load_project_settings(project_id), **changes}
+    path = get_settings_path(project_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(settings, f)
+    os.replace(tmp_path, path)
+    return settings
+
+
+def get_log_path(project_id: str, name: str = "file_store"):
+    return os.path.join(get_project_path(project_id), f"{name}.log")
+
+
+class FileStore:
+    """
+    Append-only log of file writes with an in-memory, latest-wins index keyed
+    by file_path.
+
+    Every `put` appends one JSON line, so a run that writes N files costs O(N)
+    bytes of I/O. Rewriting a path leaves a stale record in the log; once
+    enough of those pile up the log is compacted into a fresh file and swapped
+    in atomically.
+
+    Several workers may hold the same log. Appends and compactions take a
+    lock on `<log>.lock` and first catch up on what other processes wrote,
+    so a compaction never rewrites the log from a stale index; `refresh`
+    does the same catch-up for readers.
+    """
+
+    def __init__(self, path: str, durable: bool = False, compact_min_stale: int = COMPACT_MIN_STALE):
+        self.path = path
+        self.durable = durable
+        self.compact_min_stale = compact_min_stale
+        self.index: Dict[str, dict] = {}
+        self.records = 0
+        self._log = None
+        self._lock_file = None
+        # Identity and length of the log as far as the index reflects it
+        self._inode: Optional[int] = None
+        self._offset = 0
+        with self._locked():
+            self._load()
+
+    @property
+    def stale(self) -> int:
+        return self.records - len(self.index)
+
+    def entries(self) -> List[dict]:
+        return list(self.index.values())
+
+    def get(self, file_path: str) -> Optional[dict]:
+        return self.index.get(file_path)
+
+    def put(self, file_path: str, content: str) -> dict:
+        entry = {"file_path": file_path, "content": content}
+        with self._locked():
+            self._catch_up()
+            self._append(entry)
+        # Re-insert so iteration order follows the latest write
+        self.index.pop(file_path, None)
+        self.index[file_path] = entry
+        if self.stale >= self.compact_min_stale and self.stale > len(self.index):
+            self.compact()
+        return entry
+
+    def replace_all(self, file_store: list):
+        """Replace the whole store with `file_store`, deduplicating by path."""
+        with self._locked():
+            self.index = {}
+            for entry in file_store:
+                self.index.pop(entry["file_path"], None)
+                self.index[entry["file_path"]] = entry
+            self._rewrite()
+
+    def compact(self):
+        """Rewrite the log with only the live records and atomically swap it in."""
+        with self._locked():
+            self._catch_up()
+            self._rewrite()
+
+    def refresh(self):
+        """Pick up records other workers appended, or their compaction, since this index was built."""
+        with self._locked():
+            self._catch_up()
+
+    def close(self):
+        self._close_log()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    @contextmanager
+    def _locked(self):
+        if self._lock_file is None:
+            self._lock_file = open(f"{self.path}.lock", "a")
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _rewrite(self):
+        self._close_log()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.index.values():
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.records = len(self.index)
+        stat = os.stat(self.path)
+        self._inode, self._offset = stat.st_ino, stat.st_size
+
+    def _catch_up(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # Another worker compacted the log; our append handle points at the replaced file
+            self._close_log()
+            self.index = {}
+            self.records = 0
+            self._offset = 0
+            self._load()
+        elif stat.st_size > self._offset:
+            self._load()
+
+    def _load(self):
+        """Apply the log's records from where the index left off."""
+        if not os.path.exists(self.path):
+            return
+        torn = False
+        with open(self.path, "rb") as f:
+            self._inode = os.fstat(f.fileno()).st_ino
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # A crash mid-append can leave a torn last line; everything before it is intact
+                    torn = True
+                    break
+                self._offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    torn = True
+                    continue
+                self.records += 1
+                self.index.pop(entry["file_path"], None)
+                self.index[entry["file_path"]] = entry
+        if torn:
+            # Drop the torn line so the next append starts on a clean line
+            self._rewrite()
+
+    def _append(self, entry: dict):
+        if self._log is None:
+            self._log = open(self.path, "ab")
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        self._log.write(line)
+        self._log.flush()
+        if self.durable:
+            os.fsync(self._log.fileno())
+        if self._inode is None:
+            self._inode = os.fstat(self._log.fileno()).st_ino
+        self._offset += len(line)
+        self.records += 1
+
+    def _close_log(self):
+        if self._log is not None:
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._log.close()
+            self._log = None
+
+
+_stores: "OrderedDict[tuple, FileStore]" = OrderedDict()
+
+
+def open_file_store(project_id: str, name: str = "file_store") -> FileStore:
+    """
+    Return the project's store, loading it (and migrating a legacy JSON store)
+    once per process. A cached store first catches up on what other workers
+    wrote, since a run may have moved here from another worker.
+    """
+    store = _stores.get((project_id, name))
+    if store is not None:
+        _stores.move_to_end((project_id, name))
+        store.refresh()
+    else:
+        store = FileStore(get_log_path(project_id, name), durable=os.getenv("FILE_STORE_FSYNC") == "1")
+        legacy_path = get_store_path(project_id)
+        if name == "file_store" and store.records == 0 and os.path.exists(legacy_path):
+            with open(legacy_path, "r") as f:
+                store.replace_all(json.load(f))
+            os.remove(legacy_path)
+        _stores[(project_id, name)] = store
+        while len(_stores) > MAX_OPEN_STORES:
+            # A holder of the evicted store can keep using it; it reopens its log on the next write
+            _stores.popitem(last=False)[1].close()
+    return store
+
+
+def close_file_store(project_id: str):
+    for key in [key for key in _stores if key[0] == project_id]:
+        _stores.pop(key).close()
 
 
 def save_file_store(project_id: str, file_store: list):
-    with open(get_store_path(project_id), "w") as f:
-        json.dump(file_store, f, indent=2)
+    open_file_store(project_id).replace_all(file_store)
 
 
 def load_file_store(project_id: str):
-    path = get_store_path(project_id)
-    # print(path)
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            return json.load(f)
-    return []
+    return open_file_store(project_id).entries()
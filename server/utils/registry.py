@@ -0,0 +1,103 @@
+"""
+Shared state that has to be visible to every uvicorn worker: which worker owns
+the run of a project, which sandbox belongs to a project, the run records
+polled through /runs, and events that must reach viewers connected to another
+worker.
+
+`MemoryRegistry` keeps all of it in-process and is the default for a single
+worker. `SqlRegistry` keeps it in a database reachable from every worker (a
+SQLite file or Postgres, through SQLAlchemy; see utils.sql_registry). Pick
+one with REGISTRY_URL.
+"""
+import os
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# A run whose owner has not sent a heartbeat for this long is considered abandoned
+CLAIM_TTL_SECONDS = 30
+# Forwarded events are only kept long enough for every worker to poll them
+EVENT_RETENTION_SECONDS = 60
+# How far back each poll re-reads events, for inserts that committed after a higher id was already read
+EVENT_LOOKBACK_SECONDS = float(os.getenv('EVENT_LOOKBACK_SECONDS', '5'))
+
+
+class MemoryRegistry:
+    """Single-process registry; nothing is shared and no events are forwarded."""
+
+    shared = False
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.claims: Dict[str, str] = {}
+        self.runs: Dict[str, dict] = {}
+        self.sandbox_ids: Dict[str, str] = {}
+        self.cancel_requests: set = set()
+
+    async def claim_run(self, project_id: str, run_id: str) -> Optional[str]:
+        """Claim the project for `run_id`. Returns the run id that already holds it, if any."""
+        if project_id in self.claims:
+            return self.claims[project_id]
+        self.claims[project_id] = run_id
+        return None
+
+    async def release_run(self, project_id: str, run_id: str):
+        if self.claims.get(project_id) == run_id:
+            del self.claims[project_id]
+
+    async def active_run(self, project_id: str) -> Optional[str]:
+        return self.claims.get(project_id)
+
+    async def heartbeat(self, run_ids: Iterable[str]):
+        pass
+
+    async def save_run(self, run: dict):
+        self.runs[run['run_id']] = run
+
+    async def get_run(self, run_id: str) -> Optional[dict]:
+        return self.runs.get(run_id)
+
+    async def prune_runs(self, finished_before: float):
+        for run_id, run in list(self.runs.items()):
+            if run.get('finished_at') and run['finished_at'] < finished_before:
+                del self.runs[run_id]
+
+    async def request_cancel(self, run_id: str):
+        self.cancel_requests.add(run_id)
+
+    async def take_cancel_requests(self, run_ids: Iterable[str]) -> List[str]:
+        requested = [run_id for run_id in run_ids if run_id in self.cancel_requests]
+        self.cancel_requests.difference_update(requested)
+        return requested
+
+    async def set_sandbox_id(self, project_id: str, sandbox_id: str):
+        self.sandbox_ids[project_id] = sandbox_id
+
+    async def get_sandbox_id(self, project_id: str) -> Optional[str]:
+        return self.sandbox_ids.get(project_id)
+
+    async def clear_sandbox_id(self, project_id: str):
+        self.sandbox_ids.pop(project_id, None)
+
+    async def publish_events(self, events: List[Tuple[str, dict]]):
+        pass
+
+    async def poll_events(self, after_id: int, project_ids: Iterable[str]) -> List[Tuple[int, str, dict]]:
+        return []
+
+    async def last_event_id(self) -> int:
+        return 0
+
+
+def create_registry():
+    url = os.getenv('REGISTRY_URL')
+    if not url:
+        return MemoryRegistry()
+    if url.startswith('sqlite:///'):
+        os.makedirs(os.path.dirname(os.path.abspath(url[len('sqlite:///'):])), exist_ok=True)
+    # Imported here so the default in-process registry never pays for loading SQLAlchemy
+    from utils.sql_registry import SqlRegistry
+
+    return SqlRegistry(url)
+
+
+registry = create_registry()
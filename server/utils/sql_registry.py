@@ -0,0 +1,290 @@
+"""
+`SqlRegistry`: the registry kept in a database every worker can reach (a
+SQLite file or Postgres, through SQLAlchemy). utils.registry only imports
+this module when REGISTRY_URL is set, so single-worker setups never load
+SQLAlchemy.
+"""
+import asyncio
+import json
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import (
+    Column,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    create_engine,
+    delete,
+    event,
+    insert,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
+from utils.registry import CLAIM_TTL_SECONDS, EVENT_LOOKBACK_SECONDS, EVENT_RETENTION_SECONDS
+
+
+metadata = MetaData()
+
+run_claims = Table(
+    'run_claims',
+    metadata,
+    Column('project_id', String, primary_key=True),
+    Column('run_id', String, nullable=False),
+    Column('worker_id', String, nullable=False),
+    Column('heartbeat_at', Float, nullable=False),
+)
+
+run_records = Table(
+    'run_records',
+    metadata,
+    Column('run_id', String, primary_key=True),
+    Column('project_id', String, nullable=False, index=True),
+    Column('finished_at', Float),
+    Column('cancel_requested', Integer, nullable=False, default=0),
+    Column('data', Text, nullable=False),
+)
+
+project_sandboxes = Table(
+    'project_sandboxes',
+    metadata,
+    Column('project_id', String, primary_key=True),
+    Column('sandbox_id', String, nullable=False),
+)
+
+forwarded_events = Table(
+    'forwarded_events',
+    metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('project_id', String, nullable=False, index=True),
+    Column('worker_id', String, nullable=False),
+    Column('created_at', Float, nullable=False),
+    Column('payload', Text, nullable=False),
+)
+
+
+class SqlRegistry:
+    """
+    Registry backed by a database every worker can reach. Calls run in a
+    thread so a slow database never stalls the event loop.
+
+    Event ids are handed out when a row is inserted, not when it commits, so
+    under concurrent writers an event can become visible after one with a
+    higher id was already polled. Every poll therefore also re-reads the last
+    EVENT_LOOKBACK_SECONDS of events and skips the ids it already returned.
+    """
+
+    shared = True
+
+    def __init__(self, url: str):
+        self.worker_id = uuid.uuid4().hex[:12]
+        # Event ids polled within the lookback window, with their created_at
+        self._seen_events: Dict[int, float] = {}
+        self.engine = create_engine(url)
+        if self.engine.dialect.name == 'sqlite':
+            event.listen(self.engine, 'connect', _sqlite_pragmas)
+        metadata.create_all(self.engine)
+
+    def _claim_run(self, project_id: str, run_id: str) -> Optional[str]:
+        now = time.time()
+        with self.engine.begin() as conn:
+            conn.execute(
+                delete(run_claims).where(
+                    run_claims.c.project_id == project_id,
+                    run_claims.c.heartbeat_at < now - CLAIM_TTL_SECONDS,
+                )
+            )
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(
+                    insert(run_claims).values(
+                        project_id=project_id, run_id=run_id, worker_id=self.worker_id, heartbeat_at=now
+                    )
+                )
+            return None
+        except IntegrityError:
+            return self._active_run(project_id) or ''
+
+    async def claim_run(self, project_id: str, run_id: str) -> Optional[str]:
+        """Claim the project for `run_id`. Returns the run id that already holds it, if any."""
+        return await asyncio.to_thread(self._claim_run, project_id, run_id)
+
+    def _release_run(self, project_id: str, run_id: str):
+        with self.engine.begin() as conn:
+            conn.execute(
+                delete(run_claims).where(run_claims.c.project_id == project_id, run_claims.c.run_id == run_id)
+            )
+
+    async def release_run(self, project_id: str, run_id: str):
+        await asyncio.to_thread(self._release_run, project_id, run_id)
+
+    def _active_run(self, project_id: str) -> Optional[str]:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(run_claims.c.run_id).where(
+                    run_claims.c.project_id == project_id,
+                    run_claims.c.heartbeat_at >= time.time() - CLAIM_TTL_SECONDS,
+                )
+            ).scalar()
+
+    async def active_run(self, project_id: str) -> Optional[str]:
+        return await asyncio.to_thread(self._active_run, project_id)
+
+    def _heartbeat(self, run_ids: List[str]):
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(run_claims).where(run_claims.c.run_id.in_(run_ids)).values(heartbeat_at=time.time())
+            )
+
+    async def heartbeat(self, run_ids: Iterable[str]):
+        run_ids = list(run_ids)
+        if run_ids:
+            await asyncio.to_thread(self._heartbeat, run_ids)
+
+    def _save_run(self, run: dict):
+        values = {'project_id': run['project_id'], 'finished_at': run.get('finished_at'), 'data': json.dumps(run)}
+        with self.engine.begin() as conn:
+            updated = conn.execute(update(run_records).where(run_records.c.run_id == run['run_id']).values(**values))
+            if updated.rowcount == 0:
+                conn.execute(insert(run_records).values(run_id=run['run_id'], cancel_requested=0, **values))
+
+    async def save_run(self, run: dict):
+        await asyncio.to_thread(self._save_run, run)
+
+    def _get_run(self, run_id: str) -> Optional[dict]:
+        with self.engine.connect() as conn:
+            data = conn.execute(select(run_records.c.data).where(run_records.c.run_id == run_id)).scalar()
+        return json.loads(data) if data else None
+
+    async def get_run(self, run_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get_run, run_id)
+
+    def _prune_runs(self, finished_before: float):
+        with self.engine.begin() as conn:
+            conn.execute(delete(run_records).where(run_records.c.finished_at < finished_before))
+            conn.execute(delete(forwarded_events).where(forwarded_events.c.created_at < time.time() - EVENT_RETENTION_SECONDS))
+
+    async def prune_runs(self, finished_before: float):
+        await asyncio.to_thread(self._prune_runs, finished_before)
+
+    def _request_cancel(self, run_id: str):
+        with self.engine.begin() as conn:
+            conn.execute(update(run_records).where(run_records.c.run_id == run_id).values(cancel_requested=1))
+
+    async def request_cancel(self, run_id: str):
+        await asyncio.to_thread(self._request_cancel, run_id)
+
+    def _take_cancel_requests(self, run_ids: List[str]) -> List[str]:
+        with self.engine.begin() as conn:
+            requested = list(
+                conn.execute(
+                    select(run_records.c.run_id).where(
+                        run_records.c.run_id.in_(run_ids), run_records.c.cancel_requested == 1
+                    )
+                ).scalars()
+            )
+            if requested:
+                conn.execute(
+                    update(run_records).where(run_records.c.run_id.in_(requested)).values(cancel_requested=0)
+                )
+        return requested
+
+    async def take_cancel_requests(self, run_ids: Iterable[str]) -> List[str]:
+        run_ids = list(run_ids)
+        if not run_ids:
+            return []
+        return await asyncio.to_thread(self._take_cancel_requests, run_ids)
+
+    def _set_sandbox_id(self, project_id: str, sandbox_id: str):
+        with self.engine.begin() as conn:
+            conn.execute(delete(project_sandboxes).where(project_sandboxes.c.project_id == project_id))
+            conn.execute(insert(project_sandboxes).values(project_id=project_id, sandbox_id=sandbox_id))
+
+    async def set_sandbox_id(self, project_id: str, sandbox_id: str):
+        await asyncio.to_thread(self._set_sandbox_id, project_id, sandbox_id)
+
+    def _get_sandbox_id(self, project_id: str) -> Optional[str]:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(project_sandboxes.c.sandbox_id).where(project_sandboxes.c.project_id == project_id)
+            ).scalar()
+
+    async def get_sandbox_id(self, project_id: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get_sandbox_id, project_id)
+
+    def _clear_sandbox_id(self, project_id: str):
+        with self.engine.begin() as conn:
+            conn.execute(delete(project_sandboxes).where(project_sandboxes.c.project_id == project_id))
+
+    async def clear_sandbox_id(self, project_id: str):
+        await asyncio.to_thread(self._clear_sandbox_id, project_id)
+
+    def _publish_events(self, events: List[Tuple[str, dict]]):
+        now = time.time()
+        with self.engine.begin() as conn:
+            conn.execute(
+                insert(forwarded_events),
+                [
+                    {'project_id': project_id, 'worker_id': self.worker_id, 'created_at': now, 'payload': json.dumps(message)}
+                    for project_id, message in events
+                ],
+            )
+
+    async def publish_events(self, events: List[Tuple[str, dict]]):
+        if events:
+            await asyncio.to_thread(self._publish_events, events)
+
+    def _poll_events(self, after_id: int, project_ids: List[str]) -> List[Tuple[int, str, dict]]:
+        since = time.time() - EVENT_LOOKBACK_SECONDS
+        query = select(
+            forwarded_events.c.id, forwarded_events.c.project_id, forwarded_events.c.created_at, forwarded_events.c.payload
+        ).where(
+            or_(forwarded_events.c.id > after_id, forwarded_events.c.created_at >= since),
+            forwarded_events.c.worker_id != self.worker_id,
+            forwarded_events.c.project_id.in_(project_ids),
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(query.order_by(forwarded_events.c.id)).all()
+        rows = [row for row in rows if row.id not in self._seen_events]
+        self._remember_events((row.id, row.created_at) for row in rows)
+        return [(row.id, row.project_id, json.loads(row.payload)) for row in rows]
+
+    async def poll_events(self, after_id: int, project_ids: Iterable[str]) -> List[Tuple[int, str, dict]]:
+        """Events published by other workers after `after_id` for the given projects, each returned once."""
+        return await asyncio.to_thread(self._poll_events, after_id, list(project_ids))
+
+    def _remember_events(self, events: Iterable[Tuple[int, float]]):
+        self._seen_events.update(events)
+        # Twice the window, so an event is never forgotten while a poll can still return it
+        horizon = time.time() - 2 * EVENT_LOOKBACK_SECONDS
+        self._seen_events = {
+            event_id: created_at for event_id, created_at in self._seen_events.items() if created_at >= horizon
+        }
+
+    def _last_event_id(self) -> int:
+        with self.engine.connect() as conn:
+            last_id = conn.execute(select(forwarded_events.c.id).order_by(forwarded_events.c.id.desc()).limit(1)).scalar() or 0
+            # Events from before this point are not for us; keep the lookback from delivering them
+            recent = conn.execute(
+                select(forwarded_events.c.id, forwarded_events.c.created_at).where(
+                    forwarded_events.c.created_at >= time.time() - EVENT_LOOKBACK_SECONDS
+                )
+            ).all()
+        self._remember_events((row.id, row.created_at) for row in recent)
+        return last_id
+
+    async def last_event_id(self) -> int:
+        return await asyncio.to_thread(self._last_event_id)
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets workers read while another one writes; wait instead of failing on a locked database
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.close()
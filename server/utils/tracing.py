@@ -0,0 +1,215 @@
+"""
+Per-run traces and process-wide latency histograms.
+
+A run opens a Trace; `span()` anywhere below it (graph nodes included, since
+asyncio tasks inherit context) adds a timed entry to that run's timeline and
+feeds the `agent_span_duration_seconds` histogram. Code that runs outside the
+run's context, like the WebSocket writers, records through `record_for_project`.
+Finished traces are written to data/project/<id>/traces/<run_id>.json.
+"""
+import json
+import os
+import time
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from utils.persistent_store import get_project_path
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Spans beyond this still count in the run summary and the histograms
+MAX_SPANS_PER_TRACE = int(os.getenv('TRACE_MAX_SPANS', '5000'))
+RECENT_TRACES = 200
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, label: str, buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._series: Dict[str, List[float]] = {}
+
+    def observe(self, label_value: str, value: float):
+        series = self._series.get(label_value)
+        if series is None:
+            # Bucket counts, then +Inf, sum, count
+            series = self._series[label_value] = [0.0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label_value, series in sorted(self._series.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound}"}} {cumulative:g}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {series[-2]:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {series[-1]:g}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label: str):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._values: Dict[str, float] = defaultdict(float)
+
+    def inc(self, label_value: str, amount: float = 1):
+        self._values[label_value] += amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for label_value, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value:g}')
+        return lines
+
+
+span_duration = Histogram('agent_span_duration_seconds', 'Duration of traced phases', 'span')
+llm_tokens = Counter('agent_llm_tokens_total', 'Tokens sent to and received from the LLM', 'kind')
+runs_finished = Counter('agent_runs_total', 'Finished runs by status', 'status')
+edit_bytes = Counter(
+    'agent_edit_bytes_total', 'Bytes edit_file sent, against what full rewrites would have sent', 'kind'
+)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in (span_duration, llm_tokens, runs_finished, edit_bytes):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class Trace:
+    def __init__(self, run_id: str, project_id: str):
+        self.run_id = run_id
+        self.project_id = project_id
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status: Optional[str] = None
+        self.spans: List[dict] = []
+        self.dropped_spans = 0
+        self.summary: Dict[str, dict] = {}
+
+    def record(self, name: str, started: float, duration: float, attrs: Optional[dict] = None, error: Optional[str] = None):
+        span_duration.observe(name, duration)
+        totals = self.summary.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        totals['count'] += 1
+        totals['total'] += duration
+        totals['max'] = max(totals['max'], duration)
+
+        if len(self.spans) >= MAX_SPANS_PER_TRACE:
+            self.dropped_spans += 1
+            return
+        entry = {'name': name, 'start': round(started - self._started, 6), 'duration': round(duration, 6)}
+        if attrs:
+            entry['attrs'] = attrs
+        if error:
+            entry['error'] = error
+        self.spans.append(entry)
+
+    def to_dict(self) -> dict:
+        return {
+            'run_id': self.run_id,
+            'project_id': self.project_id,
+            'started_at': self.started_at,
+            'duration': self.duration,
+            'status': self.status,
+            'summary': self.summary,
+            'spans': self.spans,
+            'dropped_spans': self.dropped_spans,
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar('trace', default=None)
+_active_by_project: Dict[str, Trace] = {}
+_recent: 'OrderedDict[str, Trace]' = OrderedDict()
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def start_trace(run_id: str, project_id: str):
+    """Make a new Trace current for the enclosed run and persist it afterwards."""
+    trace = Trace(run_id, project_id)
+    token = _current.set(trace)
+    _active_by_project[project_id] = trace
+    _recent[run_id] = trace
+    while len(_recent) > RECENT_TRACES:
+        _recent.popitem(last=False)
+    try:
+        yield trace
+    finally:
+        trace.duration = time.perf_counter() - trace._started
+        _current.reset(token)
+        if _active_by_project.get(project_id) is trace:
+            del _active_by_project[project_id]
+        runs_finished.inc(trace.status or 'unknown')
+        save_trace(trace)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time the enclosed block. Outside a run it only feeds the histogram. The
+    yielded dict can be filled with attributes known only at the end.
+    """
+    started = time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        trace = _current.get()
+        if trace is not None:
+            trace.record(name, started, duration, attrs, error)
+        else:
+            span_duration.observe(name, duration)
+
+
+def record_for_project(project_id: str, name: str, started: float, duration: float, attrs: Optional[dict] = None):
+    """Add a span to the project's running trace from code outside the run's context."""
+    trace = _active_by_project.get(project_id)
+    if trace is not None:
+        trace.record(name, started, duration, attrs)
+    else:
+        span_duration.observe(name, duration)
+
+
+def _trace_path(project_id: str, run_id: str) -> str:
+    return os.path.join(get_project_path(project_id), 'traces', f'{run_id}.json')
+
+
+def save_trace(trace: Trace):
+    path = _trace_path(trace.project_id, trace.run_id)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(trace.to_dict(), f)
+        os.replace(f'{path}.tmp', path)
+    except OSError as e:
+        logger.warning(f'Could not save trace of run {trace.run_id}: {e}')
+
+
+def load_trace(project_id: str, run_id: str) -> Optional[dict]:
+    trace = _recent.get(run_id)
+    if trace is not None:
+        return trace.to_dict()
+    path = _trace_path(project_id, run_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
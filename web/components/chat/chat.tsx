@@ -14,18 +14,28 @@ interface ChatMessage {
 	id: string;
 	type: ChatType;
 	message: string;
-	event?: "thinking" | "started" | "file_created" | "file_creating" | "completed" | "command";
+	event?: "thinking" | "started" | "queued" | "file_created" | "file_creating" | "completed" | "command";
 	completed?: boolean;
+	output?: string;
+	// A thinking message still receiving thinking_delta text
+	streaming?: boolean;
+	// The LLM turn a thinking message belongs to; each turn gets its own bubble
+	turn?: string;
 }
 
+// Only the end of a command's output is kept on screen
+const MAX_TERMINAL_OUTPUT = 4000;
+
 export default function Chat({
 	projectId,
 	onSocketConnect,
-    changePrompt
+    changePrompt,
+	onPreviewReady,
 }: {
     changePrompt:(value:string)=> void
 	projectId: string;
 	onSocketConnect: (value:boolean) => void;
+	onPreviewReady: (url: string) => void;
 }) {
 	const prompt = localStorage.getItem("prompt") ?? "";
 	const [chats, setChats] = useState<ChatMessage[]>([
@@ -48,17 +58,61 @@ export default function Chat({
 
 	  ws.onmessage = (event) => {
 	    try {
-	      const data: { e: "started" | "file_created" | "file_creating" | "completed" | "thinking" | "command" ; message: string } = JSON.parse(
+	      const data: { e: "started" | "queued" | "thinking_delta" | "file_created" | "file_creating" | "completed" | "thinking" | "command" | "command_output" | "preview_ready" ; message: string; turn?: string } = JSON.parse(
 	        event.data
 	      );
 
+	      if (data.e === "preview_ready") {
+	        onPreviewReady(data.message);
+	        return;
+	      }
+
 	      setChats((prev) => {
 	        let updated = [...prev];
 
+	        if ((data.e === "thinking_delta" || data.e === "thinking") && data.turn) {
+	          // A new turn's text never goes into an earlier turn's bubble, even if that turn's final text was lost
+	          updated = updated.map((msg) =>
+	            msg.streaming && msg.turn !== data.turn ? { ...msg, streaming: false } : msg
+	          );
+	          for (let i = updated.length - 1; i >= 0; i--) {
+	            if (updated[i].event === "thinking" && updated[i].turn === data.turn) {
+	              const message = data.e === "thinking" ? data.message : updated[i].message + data.message;
+	              updated[i] = { ...updated[i], message, streaming: data.e === "thinking_delta" };
+	              return updated;
+	            }
+	          }
+	          updated.push({
+	            id: Date.now().toString(),
+	            type: "ai",
+	            message: data.message,
+	            event: "thinking",
+	            streaming: data.e === "thinking_delta",
+	            turn: data.turn,
+	          });
+	          return updated;
+	        }
+
+	        if (data.e === "command_output") {
+	          for (let i = updated.length - 1; i >= 0; i--) {
+	            if (updated[i].event === "command") {
+	              const output = ((updated[i].output ?? "") + data.message).slice(-MAX_TERMINAL_OUTPUT);
+	              updated[i] = { ...updated[i], output };
+	              break;
+	            }
+	          }
+	          return updated;
+	        }
+
 	        if (data.e === "file_created" || data.e === "command") {
 	          updated = updated.filter((msg) => msg.event !== "started");
 	        }
 
+	        // Only the latest queue position is worth showing
+	        if (data.e === "queued" || data.e === "started") {
+	          updated = updated.filter((msg) => msg.event !== "queued");
+	        }
+
 	        if (data.e === "file_created") {
 	          for (let i = updated.length - 1; i >= 0; i--) {
 	            if (updated[i].event === "file_creating" && !updated[i].completed) {
@@ -87,7 +141,7 @@ export default function Chat({
 	  };
 
 	  return () => ws.close();
-	}, [projectId,onSocketConnect]);
+	}, [projectId,onSocketConnect,onPreviewReady]);
 
 	const handleSend = () => {
 		if (!input.trim()) return;
@@ -102,7 +156,7 @@ export default function Chat({
         changePrompt(input)
 		setInput("");
 	};
-	const getChatComponent = (type: string, message: string, action?: string, completed?: boolean) => {
+	const getChatComponent = (type: string, message: string, action?: string, completed?: boolean, output?: string) => {
 		switch (type) {
 			case "ai":
 				switch (action) {
@@ -114,8 +168,10 @@ export default function Chat({
 						return <FileCreating message={message} completed={completed} />;
                     case "started":
                         return <div className="text-neutral-500 px-4 animate-pulse text-sm font-light">Creating Project...</div>
+                    case "queued":
+                        return <div className="text-neutral-500 px-4 animate-pulse text-sm font-light">{message}</div>
                     case "command":
-                        return <Terminal command={message}/>
+                        return <Terminal command={message} output={output}/>
                     
 				}
 			case "user":
@@ -136,7 +192,7 @@ export default function Chat({
 						key={chat.id}
 						className={`flex ${chat.type === "user" ? "justify-end" : "justify-start"}`}
 					>
-						{getChatComponent(chat.type, chat.message, chat.event, chat.completed)}
+						{getChatComponent(chat.type, chat.message, chat.event, chat.completed, chat.output)}
 					</div>
 				))}
 				<div ref={chatEndRef} />
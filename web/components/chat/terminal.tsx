@@ -1,7 +1,7 @@
 import { ChevronRight } from "lucide-react";
 import * as motion from "motion/react-client";
 import { TerminalIcon } from "lucide-react";
-export default function Terminal({ command }: { command: string }) {
+export default function Terminal({ command, output }: { command: string; output?: string }) {
   return (
     <motion.div
       initial={{ x: -10, opacity: 0 }}
@@ -21,6 +21,12 @@ export default function Terminal({ command }: { command: string }) {
       >
         {command}
       </motion.span>
+
+      {output && (
+        <pre className="text-neutral-500 px-3 pb-2.5 max-h-48 overflow-y-auto whitespace-pre-wrap break-all">
+          {output}
+        </pre>
+      )}
     </motion.div>
   );
 }
@@ -1,6 +1,6 @@
 "use client";
 
-import { useEffect, useState } from "react";
+import { useCallback, useEffect, useState } from "react";
 import Chat from "@/components/chat/chat";
 import {
 	ResizableHandle,
@@ -19,6 +19,9 @@ export default function ChatWithCodeViewer({
 }: ChatWithCodeViewerProps) {
 	const [isSocketConnected, setIsSocketConnected] = useState(false);
 	const [prompt, setPrompt] = useState<string>("");
+	const [previewUrl, setPreviewUrl] = useState<string | null>(null);
+	const handleSocketConnect = useCallback((value: boolean) => setIsSocketConnected(value), []);
+	const handlePreviewReady = useCallback((url: string) => setPreviewUrl(url), []);
 
 	useEffect(() => {
 		const prompt = localStorage.getItem("prompt") || "create a todo";
@@ -37,13 +40,14 @@ export default function ChatWithCodeViewer({
 					<Chat
                         changePrompt={(value)=> setPrompt(value)}
 						projectId={projectId}
-						onSocketConnect={(value: boolean) => setIsSocketConnected(value)}
+						onSocketConnect={handleSocketConnect}
+						onPreviewReady={handlePreviewReady}
 					/>
 				</ResizablePanel>
 				<ResizableHandle withHandle />
 				<ResizablePanel>
 					{isSocketConnected ? (
-						<CodeViewer projectId={projectId} prompt={prompt} />
+						<CodeViewer projectId={projectId} prompt={prompt} previewUrl={previewUrl} />
 					) : (
 						<div className="flex items-center justify-center h-full text-neutral-500">
 							<Loader variant="gradient" />
@@ -6,6 +6,8 @@ import { Tabs, TabsContent, TabsList, TabsTrigger } from "../ui/tabs";
 import { CodeEditor } from "./code";
 import { FileExplorer } from "./explorer";
 
+const RUN_POLL_INTERVAL_MS = 1500;
+
 type FileType = {
 	file_path: string;
 	content: string;
@@ -19,6 +21,14 @@ export type FileNode = {
 	content?: string;
 };
 
+// The server answers errors as {"error": "..."}; anything else is a network failure
+function describeError(error: unknown): string {
+	if (axios.isAxiosError(error)) {
+		return error.response?.data?.error ?? error.message;
+	}
+	return error instanceof Error ? error.message : String(error);
+}
+
 function buildFileTree(files: FileType[]): FileNode[] {
 	const root: Record<string, any> = {};
 
@@ -56,34 +66,80 @@ function buildFileTree(files: FileType[]): FileNode[] {
 	return objectToArray(root);
 }
 
-export const CodeViewer: React.FC<{ projectId: string,prompt:string }> = ({
-	projectId, prompt
+export const CodeViewer: React.FC<{ projectId: string,prompt:string,previewUrl?:string|null }> = ({
+	projectId, prompt, previewUrl
 }: {
 	projectId: string;
     prompt:string
+	previewUrl?: string | null;
 }) => {
 	const [tree, setTree] = useState<FileNode[]>([]);
 	const [selectedFile, setSelectedFile] = useState<FileNode | null>(null);
     const [prevUrl, setPrevUrl]= useState<string | null>(null)
+	const [error, setError] = useState<string | null>(null);
+	// The dev server is pushed over the socket as soon as it is up, before the run finishes
+	useEffect(() => {
+		if (previewUrl) setPrevUrl(previewUrl);
+	}, [previewUrl]);
 	useEffect(() => {
         setTree([])
-		axios
-			.post(`http://localhost:8000/chat/${projectId}`, {
-				prompt: prompt,
-			})
-			.then((res) => {
-				const data = res.data;
+		setError(null);
+		let cancelled = false;
+
+		const pollRun = async (runId: string) => {
+			while (!cancelled) {
+				const { data } = await axios.get(`http://localhost:8000/runs/${runId}`);
+				if (data.status === "queued" || data.status === "running") {
+					await new Promise((resolve) => setTimeout(resolve, RUN_POLL_INTERVAL_MS));
+					continue;
+				}
+				if (cancelled) return;
+				if (data.status !== "completed") {
+					setError(data.error ?? `The run was ${data.status}`);
+					return;
+				}
+
 				const files: FileType[] = data.files;
 				const treeFiles = buildFileTree(files);
                 const prevUrl = `https://5173-${data.sandbox_id}.e2b.app`
                 setPrevUrl(prevUrl)
 				setTree(treeFiles);
 				setSelectedFile(treeFiles[0]);
-			});
+				return;
+			}
+		};
+
+		// A busy server sheds the run with 429; submit it again once Retry-After has passed
+		const startRun = async () => {
+			while (!cancelled) {
+				try {
+					const res = await axios.post(`http://localhost:8000/chat/${projectId}`, {
+						prompt: prompt,
+					});
+					return pollRun(res.data.run_id);
+				} catch (error) {
+					if (!axios.isAxiosError(error) || error.response?.status !== 429) throw error;
+					const retryAfter = Number(error.response.headers["retry-after"]) || 1;
+					await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+				}
+			}
+		};
+
+		startRun().catch((error) => {
+			if (!cancelled) setError(describeError(error));
+		});
+
+		return () => {
+			cancelled = true;
+		};
 	}, [projectId,prompt]);
 	return (
 		<div className="flex w-full h-screen bg-[#0a0a0a]">
-			{tree.length === 0 ? (
+			{error && tree.length === 0 ? (
+				<div className="flex items-center justify-center h-full w-full text-sm text-red-400">
+					{error}
+				</div>
+			) : tree.length === 0 && !prevUrl ? (
 				<div className="flex justify-center h-full w-full">
 					<Loader variant="square" message="Building your MVP..." />
 				</div>
@@ -93,7 +149,7 @@ export const CodeViewer: React.FC<{ projectId: string,prompt:string }> = ({
 						<FileExplorer files={tree} onFileClick={setSelectedFile} />
 					</div>
 					
-					<Tabs defaultValue="code" className="flex-1 flex flex-col min-w-0">
+					<Tabs defaultValue={tree.length === 0 ? "preview" : "code"} className="flex-1 flex flex-col min-w-0">
 						<div className="px-4 pt-4 border-b border-neutral-900/50">
 							<TabsList className="bg-neutral-900/30 border border-neutral-800/50">
 								<TabsTrigger value="code" className="text-xs">Code Viewer</TabsTrigger>